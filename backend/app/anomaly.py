@@ -0,0 +1,244 @@
+"""
+Spike / flatline detection for sensor readings.
+
+Per sensor we keep an exponentially weighted mean and variance plus a
+counter of identical consecutive values. A reading is flagged
+
+    "spike"     if it is more than `z` EWMA standard deviations away
+                from the EWMA mean of the readings before it
+    "flatline"  if it is the `stuck`-th identical value in a row
+
+The streaming path (`AnomalyDetector.score`) is O(1) per reading and runs
+at ingest. `score_series` computes exactly the same labels for a whole
+series with NumPy, used to re-score history:
+
+    python -m app.anomaly              # every sensor
+    python -m app.anomaly <sensor_id>  # one sensor
+"""
+from datetime import datetime
+from typing import Optional
+import asyncio
+import math
+import sys
+
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from .db import db
+
+# Weight of the newest reading in the EWMA
+ALPHA = 0.1
+
+# Readings needed before we start calling anything a spike
+WARMUP = 12
+
+# Per sensor type:
+#   z          spike threshold in EWMA standard deviations
+#   min_std    floor for the std, so near-constant series don't flag noise
+#   stuck      identical values in a row that count as a flatline
+#   stuck_zero whether a run of zeros counts (a dry rain gauge reads 0)
+TYPE_CONFIG = {
+    "water_level": {"z": 6.0, "min_std": 0.02, "stuck": 12, "stuck_zero": True},
+    "rain": {"z": 8.0, "min_std": 1.0, "stuck": 6, "stuck_zero": False},
+    "temperature": {"z": 6.0, "min_std": 0.2, "stuck": 12, "stuck_zero": True},
+}
+DEFAULT_CONFIG = {"z": 6.0, "min_std": 0.1, "stuck": 12, "stuck_zero": True}
+
+RESCORE_BATCH_SIZE = 1000
+
+
+def _config(sensor_type: Optional[str]) -> dict:
+    return TYPE_CONFIG.get(sensor_type or "", DEFAULT_CONFIG)
+
+
+class _SensorState:
+    __slots__ = ("n", "mean", "var", "last", "run", "last_ts")
+
+    def __init__(self):
+        self.last_ts = None
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.last = None
+        self.run = 0
+
+
+class AnomalyDetector:
+    """
+    Rolling per-sensor statistics, updated one reading at a time.
+    """
+
+    def __init__(self, alpha: float = ALPHA):
+        self.alpha = alpha
+        self.states: dict[ObjectId, _SensorState] = {}
+
+    def score(
+        self,
+        sensor_id: ObjectId,
+        sensor_type: Optional[str],
+        timestamp: datetime,
+        value: float,
+    ) -> tuple[Optional[str], float]:
+        """
+        Return (label, z) for a new reading and fold it into the state.
+        label is "spike", "flatline" or None. Retried or out-of-order
+        readings (not newer than the last one seen) leave the state alone.
+        """
+        cfg = _config(sensor_type)
+        st = self.states.get(sensor_id)
+        if st is None:
+            st = self.states[sensor_id] = _SensorState()
+
+        if st.last_ts is not None and timestamp <= st.last_ts:
+            return None, 0.0
+        st.last_ts = timestamp
+
+        # stuck-value counter
+        st.run = st.run + 1 if value == st.last else 1
+        st.last = value
+
+        if st.n == 0:
+            st.n = 1
+            st.mean = value
+            return None, 0.0
+
+        # score against the statistics of the readings *before* this one
+        diff = value - st.mean
+        z = abs(diff) / max(math.sqrt(st.var), cfg["min_std"])
+
+        label = None
+        if st.n >= WARMUP and z > cfg["z"]:
+            label = "spike"
+        elif st.run >= cfg["stuck"] and (value != 0 or cfg["stuck_zero"]):
+            label = "flatline"
+
+        # EWMA mean / variance update
+        incr = self.alpha * diff
+        st.mean += incr
+        st.var = (1 - self.alpha) * (st.var + diff * incr)
+        st.n += 1
+
+        return label, z
+
+
+def _linear_recurrence(u: np.ndarray, d: float, y0: float) -> np.ndarray:
+    """
+    y[t] = d * y[t-1] + u[t], with y[-1] = y0, without a Python loop per
+    element. Works in blocks short enough that d**-block stays well inside
+    float64 range.
+    """
+    n = len(u)
+    out = np.empty(n, dtype=np.float64)
+    block = max(1, int(27 / -math.log(d))) if 0 < d < 1 else n or 1
+
+    k = np.arange(1, block + 1, dtype=np.float64)
+    up = d ** k          # d^(k+1) for position k
+    down = d ** -k       # d^-(k+1)
+
+    y = y0
+    for start in range(0, n, block):
+        chunk = u[start:start + block]
+        m = len(chunk)
+        acc = np.cumsum(chunk * down[:m])
+        out[start:start + m] = up[:m] * (y + acc)
+        y = out[start + m - 1]
+    return out
+
+
+def score_series(values, sensor_type: Optional[str], alpha: float = ALPHA):
+    """
+    Vectorised version of AnomalyDetector.score over a whole series
+    (oldest first). Returns (labels, z) arrays; labels hold None,
+    "spike" or "flatline".
+    """
+    x = np.asarray(values, dtype=np.float64)
+    n = len(x)
+    labels = np.full(n, None, dtype=object)
+    z = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return labels, z
+
+    cfg = _config(sensor_type)
+    d = 1 - alpha
+
+    # mean[t] is the EWMA after reading t; mean[0] = x[0]
+    mean = np.empty(n)
+    mean[0] = x[0]
+    if n > 1:
+        mean[1:] = _linear_recurrence(alpha * x[1:], d, x[0])
+
+    # diff[t] = x[t] - mean[t-1]; var[t] = d * (var[t-1] + alpha * diff[t]^2)
+    diff = np.zeros(n)
+    diff[1:] = x[1:] - mean[:-1]
+    var = np.zeros(n)
+    if n > 1:
+        var[1:] = _linear_recurrence(d * alpha * diff[1:] ** 2, d, 0.0)
+
+    prev_std = np.zeros(n)
+    prev_std[1:] = np.sqrt(var[:-1])
+    z[1:] = np.abs(diff[1:]) / np.maximum(prev_std[1:], cfg["min_std"])
+
+    # run length of identical consecutive values, 1-based
+    change = np.ones(n, dtype=bool)
+    change[1:] = x[1:] != x[:-1]
+    run_start = np.maximum.accumulate(np.where(change, np.arange(n), 0))
+    run = np.arange(n) - run_start + 1
+
+    idx = np.arange(n)
+    spike = (idx >= WARMUP) & (z > cfg["z"])
+    flat = (idx >= 1) & (run >= cfg["stuck"])
+    if not cfg["stuck_zero"]:
+        flat &= x != 0
+
+    labels[flat] = "flatline"
+    labels[spike] = "spike"
+    return labels, z
+
+
+async def rescore_sensor(sensor_id: ObjectId, sensor_type: Optional[str]) -> int:
+    """
+    Re-score every stored reading of one sensor and write back only the
+    readings whose label changed. Returns the number of updated readings.
+    """
+    ids, values, current = [], [], []
+    cursor = db.sensor_readings.find(
+        {"sensor_id": sensor_id}, {"value": 1, "anomaly": 1}
+    ).sort("timestamp", 1)
+    async for doc in cursor:
+        ids.append(doc["_id"])
+        values.append(float(doc.get("value") or 0.0))
+        current.append(doc.get("anomaly"))
+
+    labels, z = score_series(values, sensor_type)
+
+    ops = []
+    updated = 0
+    for i, label in enumerate(labels):
+        if label == current[i]:
+            continue
+        if label is None:
+            ops.append(UpdateOne({"_id": ids[i]}, {"$unset": {"anomaly": "", "anomaly_score": ""}}))
+        else:
+            ops.append(UpdateOne(
+                {"_id": ids[i]},
+                {"$set": {"anomaly": label, "anomaly_score": round(float(z[i]), 2)}},
+            ))
+        if len(ops) >= RESCORE_BATCH_SIZE:
+            updated += (await db.sensor_readings.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+
+    if ops:
+        updated += (await db.sensor_readings.bulk_write(ops, ordered=False)).modified_count
+    return updated
+
+
+async def main(sensor_ids: list[str]):
+    query = {"_id": {"$in": [ObjectId(s) for s in sensor_ids]}} if sensor_ids else {}
+    async for sensor in db.sensors.find(query, {"name": 1, "type": 1}):
+        updated = await rescore_sensor(sensor["_id"], sensor.get("type"))
+        print(f"{sensor.get('name')}: {updated} readings re-labelled")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,335 @@
+"""
+Cold tier for sensor_readings.
+
+Readings older than RETENTION_DAYS are moved out of Mongo into one
+compressed NumPy file per sensor per month:
+
+    ARCHIVE_DIR/<sensor_id>/<YYYY-MM>.npz   (timestamp_ms, value, oid)
+
+A .npz is a zip and can't be memory-mapped, so the first read of a month
+unpacks its columns to .npy files next to it and maps those; later reads
+only touch the pages they need. The unpacked files are named after the
+.npz they came from (inode, mtime, size), so a copy unpacked from a month
+file that has since been rewritten is never mistaken for the current one.
+
+Run the export from cron (or by hand):
+
+    python -m app.archive
+"""
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+import asyncio
+import heapq
+import os
+import tempfile
+
+import numpy as np
+from bson import ObjectId
+
+from .db import db
+
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", Path(__file__).resolve().parent.parent / "archive"))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+
+# Mongo deletes are done in chunks so we never hold a huge $in list
+DELETE_BATCH_SIZE = 5000
+
+COLUMNS = ("timestamp_ms", "value", "oid")
+
+
+def hot_tier_start(now: Optional[datetime] = None) -> datetime:
+    """
+    Oldest timestamp that is guaranteed to still be in Mongo.
+    """
+    return (now or datetime.utcnow()) - timedelta(days=RETENTION_DAYS)
+
+
+def _to_ms(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp() * 1000)
+
+
+def _from_ms(ms: int) -> datetime:
+    # naive UTC, same as what Motor hands back for stored dates
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+def _month_key(ts: datetime) -> str:
+    return f"{ts.year:04d}-{ts.month:02d}"
+
+
+def _months_between(start: datetime, end: datetime) -> list[str]:
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _month_path(sensor_id: ObjectId, month: str) -> Path:
+    return ARCHIVE_DIR / str(sensor_id) / f"{month}.npz"
+
+
+def _write_month(sensor_id: ObjectId, month: str, ts_ms, values, oids):
+    """
+    Merge new rows into the month file (sorted by time, one row per
+    timestamp) and replace it atomically.
+    """
+    path = _month_path(sensor_id, month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    oids = np.asarray(oids, dtype=np.uint8).reshape(-1, 12)
+
+    if path.exists():
+        with np.load(path) as old:
+            ts_ms = np.concatenate([old["timestamp_ms"], ts_ms])
+            values = np.concatenate([old["value"], values])
+            oids = np.concatenate([old["oid"], oids])
+
+    # keep the first copy of each timestamp (matches the unique index)
+    ts_ms, first = np.unique(ts_ms, return_index=True)
+    values = values[first]
+    oids = oids[first]
+
+    _write_atomic(path, lambda f: np.savez_compressed(f, timestamp_ms=ts_ms, value=values, oid=oids))
+
+    # drop the unpacked copies, they are rebuilt on next read
+    for old in path.parent.glob(f"{month}.*.npy"):
+        old.unlink(missing_ok=True)
+
+
+def _write_atomic(path: Path, write):
+    """
+    write(file) into a temp file of its own next to `path`, then rename it
+    over `path`. Concurrent writers (threads or workers) each publish a
+    complete file; whichever rename lands last wins, and both are fine.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _tag(st: os.stat_result) -> str:
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _col_paths(path: Path, month: str, tag: str) -> dict:
+    return {col: path.with_name(f"{month}.{tag}.{col}.npy") for col in COLUMNS}
+
+
+def _drop_stale_columns(path: Path, month: str, keep: set):
+    """
+    Remove copies unpacked from earlier versions of the month file (a
+    reader that raced a rewrite can leave them behind). Only done while
+    `keep` still matches the current file.
+    """
+    try:
+        current = set(_col_paths(path, month, _tag(path.stat())).values())
+    except FileNotFoundError:
+        return
+    if current != keep:
+        return
+    for old in path.parent.glob(f"{month}.*.npy"):
+        if old not in keep:
+            old.unlink(missing_ok=True)
+
+
+def _open_month(sensor_id: ObjectId, month: str) -> Optional[dict]:
+    """
+    Memory-map the columns of one archived month, unpacking them from the
+    .npz on first use.
+    """
+    path = _month_path(sensor_id, month)
+    try:
+        col_paths = _col_paths(path, month, _tag(path.stat()))
+    except FileNotFoundError:
+        return None
+
+    if all(p.exists() for p in col_paths.values()):
+        try:
+            return {col: np.load(p, mmap_mode="r") for col, p in col_paths.items()}
+        except FileNotFoundError:
+            pass   # the export replaced the month file in between
+
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f, np.load(f) as packed:
+        columns = {col: packed[col] for col in COLUMNS}
+        # tag what we actually read, not what the name points at now
+        col_paths = _col_paths(path, month, _tag(os.fstat(f.fileno())))
+    for col, col_path in col_paths.items():
+        _write_atomic(col_path, lambda out: np.save(out, columns[col]))
+    _drop_stale_columns(path, month, set(col_paths.values()))
+
+    try:
+        return {col: np.load(p, mmap_mode="r") for col, p in col_paths.items()}
+    except FileNotFoundError:
+        # replaced again already; what we unpacked is still a whole month
+        return columns
+
+
+def read_archived(sensor_id: ObjectId, since: datetime, until: datetime) -> list[dict]:
+    """
+    Archived readings for one sensor with since <= timestamp < until,
+    oldest first, shaped like sensor_readings documents (minus the
+    sensor metadata, which the caller adds).
+    """
+    since_ms, until_ms = _to_ms(since), _to_ms(until)
+    readings = []
+
+    for month in _months_between(since, until):
+        cols = _open_month(sensor_id, month)
+        if cols is None:
+            continue
+
+        ts = cols["timestamp_ms"]
+        lo = int(np.searchsorted(ts, since_ms, side="left"))
+        hi = int(np.searchsorted(ts, until_ms, side="left"))
+        if lo >= hi:
+            continue
+
+        ts_slice = ts[lo:hi].tolist()
+        values = cols["value"][lo:hi].tolist()
+        oids = cols["oid"][lo:hi]
+
+        for i, ms in enumerate(ts_slice):
+            readings.append(
+                {
+                    "id": bytes(oids[i]).hex(),
+                    "sensor_id": str(sensor_id),
+                    "timestamp": _from_ms(ms),
+                    "value": values[i],
+                    "archived": True,
+                }
+            )
+
+    return readings
+
+
+def archived_sensor_ids() -> list[ObjectId]:
+    """
+    Every sensor that has an archive directory.
+    """
+    if not ARCHIVE_DIR.is_dir():
+        return []
+    return [ObjectId(p.name) for p in ARCHIVE_DIR.iterdir() if p.is_dir() and ObjectId.is_valid(p.name)]
+
+
+def _first_month(sensor_ids: list[ObjectId]) -> Optional[str]:
+    months = [
+        p.stem
+        for sid in sensor_ids
+        for p in (ARCHIVE_DIR / str(sid)).glob("*.npz")
+    ]
+    return min(months, default=None)
+
+
+def iter_archived(since: Optional[datetime], untils: dict) -> Iterator[dict]:
+    """
+    Archived readings of several sensors ({sensor_id: until}), each with
+    since <= timestamp < its own until, merged oldest first. Only one
+    month of every sensor is held in memory at a time. since=None starts
+    at the oldest archived month.
+    """
+    if not untils:
+        return
+    if since is None:
+        first = _first_month(list(untils))
+        if first is None:
+            return
+        since = datetime.strptime(first, "%Y-%m")
+
+    for month in _months_between(since, max(untils.values())):
+        year, mon = map(int, month.split("-"))
+        start = max(since, datetime(year, mon, 1))
+        end = datetime(year + 1, 1, 1) if mon == 12 else datetime(year, mon + 1, 1)
+        per_sensor = [
+            read_archived(sid, start, min(end, until))
+            for sid, until in untils.items()
+            if start < until
+        ]
+        yield from heapq.merge(*per_sensor, key=lambda doc: doc["timestamp"])
+
+
+async def archive_old_readings(cutoff: Optional[datetime] = None) -> dict:
+    """
+    Export every reading older than `cutoff` to the archive, then delete
+    it from Mongo in batches. A month file is always written before its
+    rows are deleted, so a crash in between only leaves rows in both tiers
+    (reads prefer Mongo, and the next run merges them again).
+    """
+    cutoff = cutoff or hot_tier_start()
+    stats = {"sensors": 0, "files": 0, "archived": 0, "deleted": 0}
+
+    sensor_ids = await db.sensor_readings.distinct(
+        "sensor_id", {"timestamp": {"$lt": cutoff}}
+    )
+
+    for sid in sensor_ids:
+        stats["sensors"] += 1
+        cursor = (
+            db.sensor_readings.find(
+                {"sensor_id": sid, "timestamp": {"$lt": cutoff}},
+                {"timestamp": 1, "value": 1},
+            )
+            .sort("timestamp", 1)
+            .batch_size(DELETE_BATCH_SIZE)
+        )
+
+        month = None
+        ts_ms, values, oids = [], [], []
+
+        async def flush_month():
+            if not ts_ms:
+                return
+            await asyncio.to_thread(_write_month, sid, month, ts_ms, values, oids)
+            stats["files"] += 1
+            stats["archived"] += len(ts_ms)
+
+            ids = [ObjectId(bytes(o)) for o in oids]
+            for i in range(0, len(ids), DELETE_BATCH_SIZE):
+                result = await db.sensor_readings.delete_many(
+                    {"_id": {"$in": ids[i:i + DELETE_BATCH_SIZE]}}
+                )
+                stats["deleted"] += result.deleted_count
+
+        async for doc in cursor:
+            doc_month = _month_key(doc["timestamp"])
+            if doc_month != month:
+                await flush_month()
+                month = doc_month
+                ts_ms, values, oids = [], [], []
+
+            ts_ms.append(_to_ms(doc["timestamp"]))
+            values.append(float(doc.get("value") or 0.0))
+            oids.append(list(doc["_id"].binary))
+
+        await flush_month()
+
+    return stats
+
+
+async def main():
+    cutoff = hot_tier_start()
+    print(f"Archiving readings older than {cutoff} UTC to {ARCHIVE_DIR} ...")
+    stats = await archive_old_readings(cutoff)
+    print(
+        f"Archived {stats['archived']} readings from {stats['sensors']} sensors "
+        f"into {stats['files']} month files, deleted {stats['deleted']} from Mongo."
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""
+Background cascade cleanup after a user is deleted.
+
+DELETE /users/{id} removes the user document and records a job in
+`cleanup_jobs`; this module then, in batches of CLEANUP_BATCH_SIZE with a
+short pause between batches so other requests keep their latency:
+
+  1. pulls the user from `liked_by` on every report they liked and
+     decrements `likes` (and the authors' likes_received)
+  2. deletes the user's own reports and takes them off the counters
+
+Progress is stored on the job (GET /cleanup-jobs/{id}). Jobs are claimed
+by one worker at a time; a job whose worker died (no progress for
+CLEANUP_STALE_SECONDS) is picked up again by another, and every batch
+is safe to repeat.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import os
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from .counters import on_reports_deleted
+from .db import db
+from .hot import rescore
+from .invalidation import WORKER_ID, cache_bus
+
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "500"))
+CLEANUP_PAUSE_SECONDS = float(os.getenv("CLEANUP_PAUSE_SECONDS", "0.05"))
+CLEANUP_POLL_SECONDS = 30
+CLEANUP_STALE_SECONDS = 300
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _event() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+async def enqueue_user_cleanup(user_oid: ObjectId) -> ObjectId:
+    """
+    Record a cleanup job for a deleted user and wake the runner.
+    """
+    liked, reports = await asyncio.gather(
+        db.user_reports.count_documents({"liked_by": user_oid}),
+        db.user_reports.count_documents({"user_id": user_oid}),
+    )
+    now = datetime.utcnow()
+    result = await db.cleanup_jobs.insert_one({
+        "kind": "user",
+        "user_id": user_oid,
+        "status": "queued",
+        "likes_total": liked,
+        "likes_removed": 0,
+        "reports_total": reports,
+        "reports_deleted": 0,
+        "created_at": now,
+        "updated_at": now,
+    })
+    _event().set()
+    return result.inserted_id
+
+
+async def _claim() -> Optional[dict]:
+    now = datetime.utcnow()
+    return await db.cleanup_jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "updated_at": {"$lt": now - timedelta(seconds=CLEANUP_STALE_SECONDS)}},
+        ]},
+        {"$set": {"status": "running", "worker": WORKER_ID, "updated_at": now}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _progress(job_id: ObjectId, **inc):
+    await db.cleanup_jobs.update_one(
+        {"_id": job_id},
+        {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}},
+    )
+
+
+async def _unlike(rid: ObjectId, uid: ObjectId) -> Optional[ObjectId]:
+    """
+    Take uid's like off one report and off its author's likes_received.
+    The author is only charged if this update removed the like (not an
+    unlike that landed since the batch was read), right after it, so an
+    interrupted job loses at most the reports it was in the middle of.
+    Returns rid if the like was removed.
+    """
+    doc = await db.user_reports.find_one_and_update(
+        {"_id": rid, "liked_by": uid},
+        {"$pull": {"liked_by": uid}, "$inc": {"likes": -1}},
+        projection={"user_id": 1},
+    )
+    if doc is None:
+        return None
+    if doc.get("user_id") is not None:
+        await db.users.update_one({"_id": doc["user_id"]}, {"$inc": {"likes_received": -1}})
+    return rid
+
+
+async def _remove_likes(job: dict):
+    """
+    Step 1, one batch at a time via the liked_by index.
+    """
+    uid = job["user_id"]
+    while True:
+        batch = await db.user_reports.find(
+            {"liked_by": uid}, {"_id": 1}
+        ).limit(CLEANUP_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            return
+
+        removed = [r for r in await asyncio.gather(*(_unlike(doc["_id"], uid) for doc in batch)) if r]
+
+        await rescore(removed)
+        await _progress(job["_id"], likes_removed=len(removed))
+        await cache_bus.publish("like")
+        await asyncio.sleep(CLEANUP_PAUSE_SECONDS)
+
+
+async def _delete_reports(job: dict):
+    """
+    Step 2, one batch at a time via the user_id index.
+    """
+    uid = job["user_id"]
+    while True:
+        batch = await db.user_reports.find(
+            {"user_id": uid},
+            {"_id": 1, "user_id": 1, "sensor_id": 1, "location": 1, "likes": 1},
+        ).limit(CLEANUP_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            return
+
+        result = await db.user_reports.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        await on_reports_deleted(batch)
+
+        await _progress(job["_id"], reports_deleted=result.deleted_count)
+        await cache_bus.publish("user_report")
+        await asyncio.sleep(CLEANUP_PAUSE_SECONDS)
+
+
+async def run_job(job: dict):
+    try:
+        await _remove_likes(job)
+        await _delete_reports(job)
+    except Exception as exc:
+        await db.cleanup_jobs.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "failed", "error": str(exc), "updated_at": datetime.utcnow()}},
+        )
+        print(f"[cleanup] job {job['_id']} failed: {exc}")
+        return
+
+    await db.cleanup_jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": "done", "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}},
+    )
+
+
+async def cleanup_loop():
+    """
+    Lifespan task: run queued (or abandoned) jobs, one at a time.
+    """
+    wakeup = _event()
+    while True:
+        wakeup.clear()
+        try:
+            while (job := await _claim()) is not None:
+                await run_job(job)
+        except Exception as exc:
+            print(f"[cleanup] {exc}")
+
+        try:
+            await asyncio.wait_for(wakeup.wait(), CLEANUP_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def get_job(job_id: ObjectId) -> Optional[dict]:
+    return await db.cleanup_jobs.find_one({"_id": job_id})
@@ -0,0 +1,153 @@
+"""
+Rain -> river lag correlation.
+
+For each location we put the rain and the water-level series on the same
+regular time grid (app/resample.py) and compute the normalised cross-correlation of
+rain[t] with water_level[t + lag] for lag = 0 .. max_lag. The lag with
+the highest correlation is "how long after rain the river rises".
+
+Every location is processed at once as rows of a (locations x steps)
+matrix: direct sliding-window products for short grids, batched FFT for
+long ones.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import time
+
+import numpy as np
+
+from .db import db
+from .resample import resample, to_ms
+
+# Above this many grid points the FFT path is faster than direct products
+FFT_MIN_POINTS = 512
+
+CACHE_MAX_ENTRIES = 512
+
+
+def lag_correlation(lead: np.ndarray, follow: np.ndarray, max_lag: int) -> np.ndarray:
+    """
+    Pearson correlation of lead[:, t] with follow[:, t + k] for each row
+    and k = 0..max_lag. lead and follow are (rows, n). Returns (rows, max_lag + 1);
+    rows with a constant series get NaN.
+    """
+    lead = lead - lead.mean(axis=1, keepdims=True)
+    follow = follow - follow.mean(axis=1, keepdims=True)
+    rows, n = lead.shape
+    max_lag = min(max_lag, n - 1)
+
+    if n >= FFT_MIN_POINTS:
+        size = 1 << (2 * n - 1).bit_length()
+        spec = np.conj(np.fft.rfft(lead, size, axis=1)) * np.fft.rfft(follow, size, axis=1)
+        raw = np.fft.irfft(spec, size, axis=1)[:, : max_lag + 1]
+    else:
+        # windows[r, t, k] = follow[r, t + k], zero past the end
+        padded = np.pad(follow, ((0, 0), (0, max_lag)))
+        windows = np.lib.stride_tricks.sliding_window_view(padded, max_lag + 1, axis=1)[:, :n]
+        raw = np.einsum("rt,rtk->rk", lead, windows)
+
+    overlap = n - np.arange(max_lag + 1)
+    denom = lead.std(axis=1, keepdims=True) * follow.std(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denom > 0, raw / overlap / denom, np.nan)
+
+
+# (location, hours, max_lag, step_minutes, window_end_ms) -> result
+_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+
+
+def _cache_put(key: tuple, value: dict):
+    _cache[key] = value
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+async def compute_lag_correlations(
+    locations: Optional[list[str]],
+    hours: int,
+    max_lag_hours: int,
+    step_minutes: int,
+) -> dict[str, dict]:
+    """
+    Lag correlation for the given locations (None = every location that
+    has both a rain and a water-level sensor). Results are cached per
+    grid window, so repeated calls within the same step are dict lookups.
+    """
+    step_ms = step_minutes * 60 * 1000
+    n = hours * 60 // step_minutes
+    max_lag = max_lag_hours * 60 // step_minutes
+
+    # Window ends on a grid boundary, so everyone in the same step shares it
+    end_ms = int(time.time() * 1000) // step_ms * step_ms
+    start_ms = end_ms - n * step_ms
+
+    # 1. One rain + one water-level sensor per location
+    query = {"type": {"$in": ["rain", "water_level"]}, "is_active": True}
+    if locations is not None:
+        query["location"] = {"$in": locations}
+
+    pairs: dict[str, dict] = {}
+    async for s in db.sensors.find(query, {"type": 1, "location": 1}).sort("_id", 1):
+        pairs.setdefault(s.get("location"), {}).setdefault(s["type"], s["_id"])
+    pairs = {loc: p for loc, p in pairs.items() if "rain" in p and "water_level" in p}
+
+    results: dict[str, dict] = {}
+    missing = []
+    for loc in pairs:
+        cached = _cache.get((loc, hours, max_lag_hours, step_minutes, end_ms))
+        if cached is not None:
+            results[loc] = cached
+        else:
+            missing.append(loc)
+
+    if not missing or n < 2:
+        return results
+
+    # 2. All readings for all missing pairs in one query
+    sensor_ids = [pairs[loc][t] for loc in missing for t in ("rain", "water_level")]
+    start = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc)
+    end = start + timedelta(milliseconds=n * step_ms)
+
+    series: dict = {sid: ([], []) for sid in sensor_ids}
+    cursor = db.sensor_readings.find(
+        {"sensor_id": {"$in": sensor_ids}, "timestamp": {"$gte": start, "$lt": end}},
+        {"_id": 0, "sensor_id": 1, "timestamp": 1, "value": 1},
+    )
+    async for doc in cursor:
+        ts, vals = series[doc["sensor_id"]]
+        ts.append(to_ms(doc["timestamp"]))
+        vals.append(float(doc.get("value") or 0.0))
+
+    # 3. (locations x steps) matrices, one batched correlation
+    def grid(sid, fill):
+        ts, vals = series[sid]
+        values, _ = resample(np.asarray(ts, dtype=np.int64), np.asarray(vals), start_ms, step_ms, n, fill)
+        return np.nan_to_num(values)
+
+    rain = np.vstack([grid(pairs[loc]["rain"], "zero") for loc in missing])
+    level = np.vstack([grid(pairs[loc]["water_level"], "linear") for loc in missing])
+    corr = lag_correlation(rain, level, max_lag)
+
+    lags_minutes = (np.arange(corr.shape[1]) * step_minutes).tolist()
+    for row, loc in enumerate(missing):
+        values = corr[row]
+        best = None if np.all(np.isnan(values)) else int(np.nanargmax(values))
+        result = {
+            "location": loc,
+            "rain_sensor_id": str(pairs[loc]["rain"]),
+            "water_level_sensor_id": str(pairs[loc]["water_level"]),
+            "hours": hours,
+            "max_lag_hours": max_lag_hours,
+            "step_minutes": step_minutes,
+            "points": n,
+            "lags_minutes": lags_minutes,
+            "correlation": [None if np.isnan(v) else round(float(v), 4) for v in values],
+            "best_lag_minutes": None if best is None else lags_minutes[best],
+            "best_correlation": None if best is None else round(float(values[best]), 4),
+        }
+        _cache_put((loc, hours, max_lag_hours, step_minutes, end_ms), result)
+        results[loc] = result
+
+    return results
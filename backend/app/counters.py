@@ -0,0 +1,184 @@
+"""
+Denormalised counters for user reports.
+
+    users.report_count       reports posted by the user
+    users.likes_received     likes on the user's reports
+    sensors.report_count     reports attached to the sensor
+    location_stats           {_id: location, report_count}
+
+They are kept up to date with atomic $inc in the same endpoints that
+create, delete, move and like reports, so profile / station views are a
+single document read. The endpoints and the counters are separate writes,
+so `reconcile_counters()` recomputes everything from user_reports in
+batches to repair any drift:
+
+    python -m app.counters
+"""
+from datetime import datetime
+from typing import Optional
+import asyncio
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from .db import db
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+async def on_report_created(user_oid: ObjectId, sensor_oid: ObjectId, location: Optional[str]):
+    await asyncio.gather(
+        db.users.update_one({"_id": user_oid}, {"$inc": {"report_count": 1}}),
+        db.sensors.update_one({"_id": sensor_oid}, {"$inc": {"report_count": 1}}),
+        _inc_location(location, 1),
+    )
+
+
+async def on_report_deleted(report: dict):
+    await asyncio.gather(
+        db.users.update_one(
+            {"_id": report.get("user_id")},
+            {"$inc": {"report_count": -1, "likes_received": -int(report.get("likes") or 0)}},
+        ),
+        db.sensors.update_one({"_id": report.get("sensor_id")}, {"$inc": {"report_count": -1}}),
+        _inc_location(report.get("location"), -1),
+    )
+
+
+async def on_reports_deleted(reports: list[dict]):
+    """
+    on_report_deleted for a batch of reports (batched cleanups): one $inc
+    per user / sensor / location touched.
+    """
+    users: dict = {}
+    sensors: dict = {}
+    locations: dict = {}
+    for report in reports:
+        inc = users.setdefault(report.get("user_id"), {"report_count": 0, "likes_received": 0})
+        inc["report_count"] -= 1
+        inc["likes_received"] -= int(report.get("likes") or 0)
+        sensors[report.get("sensor_id")] = sensors.get(report.get("sensor_id"), 0) + 1
+        locations[report.get("location")] = locations.get(report.get("location"), 0) + 1
+
+    ops = []
+    if users:
+        ops.append(db.users.bulk_write(
+            [UpdateOne({"_id": oid}, {"$inc": inc}) for oid, inc in users.items()],
+            ordered=False,
+        ))
+    if sensors:
+        ops.append(db.sensors.bulk_write(
+            [UpdateOne({"_id": sid}, {"$inc": {"report_count": -n}}) for sid, n in sensors.items()],
+            ordered=False,
+        ))
+    ops += [_inc_location(loc, -n) for loc, n in locations.items()]
+    await asyncio.gather(*ops)
+
+
+async def on_report_moved(old: dict, new_sensor_oid: ObjectId, new_location: Optional[str]):
+    """
+    A report changed station in update_user_report.
+    """
+    if old.get("sensor_id") == new_sensor_oid:
+        return
+    ops = [
+        db.sensors.update_one({"_id": old.get("sensor_id")}, {"$inc": {"report_count": -1}}),
+        db.sensors.update_one({"_id": new_sensor_oid}, {"$inc": {"report_count": 1}}),
+    ]
+    if old.get("location") != new_location:
+        ops += [_inc_location(old.get("location"), -1), _inc_location(new_location, 1)]
+    await asyncio.gather(*ops)
+
+
+async def on_like_changed(author_oid: ObjectId, delta: int):
+    await db.users.update_one({"_id": author_oid}, {"$inc": {"likes_received": delta}})
+
+
+async def _inc_location(location: Optional[str], delta: int):
+    if not location:
+        return
+    await db.location_stats.update_one(
+        {"_id": location}, {"$inc": {"report_count": delta}}, upsert=True
+    )
+
+
+async def get_location_report_count(location: Optional[str]) -> int:
+    if not location:
+        return 0
+    doc = await db.location_stats.find_one({"_id": location})
+    return int(doc.get("report_count") or 0) if doc else 0
+
+
+async def _reconcile(collection, pipeline: list, fields: dict, run_id: datetime, upsert: bool = False) -> int:
+    """
+    $set the aggregated counters on every group in batches, then zero the
+    counters of documents that no group touched in this run.
+    """
+    ops, touched = [], 0
+    async for row in db.user_reports.aggregate(pipeline, allowDiskUse=True):
+        if row["_id"] is None:
+            continue
+        values = {field: row.get(field, 0) for field in fields}
+        ops.append(UpdateOne(
+            {"_id": row["_id"]},
+            {"$set": values | {"counters_run": run_id}},
+            upsert=upsert,
+        ))
+        if len(ops) >= RECONCILE_BATCH_SIZE:
+            await collection.bulk_write(ops, ordered=False)
+            touched += len(ops)
+            ops = []
+
+    if ops:
+        await collection.bulk_write(ops, ordered=False)
+        touched += len(ops)
+
+    await collection.update_many(
+        {"counters_run": {"$ne": run_id}},
+        {"$set": dict(fields) | {"counters_run": run_id}},
+    )
+    return touched
+
+
+async def reconcile_counters() -> dict:
+    """
+    Recompute every counter from user_reports.
+    """
+    run_id = datetime.utcnow()
+
+    users = await _reconcile(
+        db.users,
+        [{"$group": {
+            "_id": "$user_id",
+            "report_count": {"$sum": 1},
+            "likes_received": {"$sum": {"$ifNull": ["$likes", 0]}},
+        }}],
+        {"report_count": 0, "likes_received": 0},
+        run_id,
+    )
+    sensors = await _reconcile(
+        db.sensors,
+        [{"$group": {"_id": "$sensor_id", "report_count": {"$sum": 1}}}],
+        {"report_count": 0},
+        run_id,
+    )
+    locations = await _reconcile(
+        db.location_stats,
+        [{"$group": {"_id": "$location", "report_count": {"$sum": 1}}}],
+        {"report_count": 0},
+        run_id,
+        upsert=True,
+    )
+    return {"users": users, "sensors": sensors, "locations": locations}
+
+
+async def main():
+    stats = await reconcile_counters()
+    print(
+        f"Reconciled counters for {stats['users']} users, "
+        f"{stats['sensors']} sensors and {stats['locations']} locations."
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
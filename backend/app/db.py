@@ -1,15 +1,43 @@
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
 
-# Load .env from the Backend folder
+# Load .env from the Backend folder (modules read their settings at import)
 load_dotenv()
 
 MONGO_URL = os.getenv("MONGO_URL")
 DB_NAME = os.getenv("MONGO_DB_NAME", "water_status")
 
-if not MONGO_URL:
-    raise RuntimeError("MONGO_URL is not set. Did you create Backend/.env?")
+_db = None
 
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
\ No newline at end of file
+
+def get_db():
+    """
+    The Motor database, created on first use rather than at import, so
+    spawning a worker (or importing a helper module) doesn't pay for the
+    driver or fail without a MONGO_URL.
+    """
+    global _db
+    if _db is None:
+        if not MONGO_URL:
+            raise RuntimeError("MONGO_URL is not set. Did you create Backend/.env?")
+
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        client = AsyncIOMotorClient(MONGO_URL)
+        _db = client[DB_NAME]
+    return _db
+
+
+class _LazyDatabase:
+    """
+    Stands in for the database object: `db.sensors`, `db["sensors"]`.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+db = _LazyDatabase()
@@ -0,0 +1,110 @@
+"""
+Incremental ("since") polling for readings endpoints.
+
+Every readings response carries a `cursor`: the timestamp of the newest
+reading it contains. Passing it back as `since=` returns only readings
+after it, so a chart refresh costs as much as the new data rather than
+the whole window. `since=` also takes a plain ISO-8601 timestamp.
+
+    single sensor   cursor = "<ms since epoch>"
+    several sensors cursor = opaque, one position per sensor (a late
+                    reading of one station isn't skipped because another
+                    station already reported later)
+
+Cursors are positions in reading time, not in arrival order: a reading
+that lands after a client's cursor has passed its timestamp (a gateway
+retry, a late-committing batch, a backfill) is never part of a delta for
+that client. Clients that keep a chart open should fetch the full window
+again (no since=) every few minutes; the web app does so every
+CHART_RESYNC_MS (frontend/app/routes/posts.tsx).
+
+With `wait=N` a request with nothing new parks until the readings feed
+(app/reading_feed.py) sees a new reading for one of its sensors, or N
+seconds pass.
+"""
+from datetime import datetime
+from typing import Awaitable, Callable
+import base64
+import time
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from .reading_feed import reading_feed
+from .resample import to_ms
+from .singleflight import SingleFlight
+
+MAX_WAIT_SECONDS = 30
+
+
+def parse_since(since: str) -> int:
+    """
+    ms since epoch from a single-sensor cursor or an ISO-8601 timestamp.
+    """
+    since = since.strip()
+    if since.isdigit():
+        return int(since)
+    try:
+        return to_ms(datetime.fromisoformat(since.replace("Z", "+00:00")))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be an ISO timestamp or a cursor")
+
+
+def encode_series_cursor(positions: dict[ObjectId, int]) -> str:
+    raw = ",".join(f"{sid}:{ms}" for sid, ms in positions.items()).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def parse_series_since(since: str, sensor_ids: list[ObjectId]) -> dict[ObjectId, int]:
+    """
+    Per-sensor positions from a series cursor, or the same position for
+    every sensor from an ISO timestamp. Sensors missing from the cursor
+    start at its oldest position.
+    """
+    since = since.strip()
+    try:
+        return dict.fromkeys(sensor_ids, to_ms(datetime.fromisoformat(since.replace("Z", "+00:00"))))
+    except ValueError:
+        pass
+
+    try:
+        padded = since + "=" * (-len(since) % 4)
+        positions = {}
+        for part in base64.urlsafe_b64decode(padded).decode().split(","):
+            sid, ms = part.split(":")
+            positions[ObjectId(sid)] = int(ms)
+    except Exception:
+        raise HTTPException(status_code=400, detail="since must be an ISO timestamp or a cursor")
+
+    oldest = min(positions.values())
+    return {sid: positions.get(sid, oldest) for sid in sensor_ids}
+
+
+def check_wait(wait: float):
+    if wait < 0 or wait > MAX_WAIT_SECONDS:
+        raise HTTPException(status_code=400, detail=f"wait must be between 0 and {MAX_WAIT_SECONDS} seconds")
+
+
+async def long_poll(
+    flight: SingleFlight,
+    key: tuple,
+    sensor_ids: list[ObjectId],
+    wait: float,
+    load: Callable[[], Awaitable[tuple[bytes, int]]],
+) -> bytes:
+    """
+    Run a delta load, `load()` -> (body, number of new readings).
+    If nothing is new and wait > 0, sleep until the feed brings a reading
+    for one of sensor_ids and load again. The feed generation is part of
+    the coalescing key, so a cached "nothing new" never outlives new data.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        generation = reading_feed.generation
+        body, count = await flight.do(key + (generation,), load)
+        remaining = deadline - time.monotonic()
+        if count or remaining <= 0:
+            return body
+        # generation moved while we loaded -> load again straight away
+        if reading_feed.generation == generation and not await reading_feed.wait(sensor_ids, remaining):
+            return body
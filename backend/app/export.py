@@ -0,0 +1,321 @@
+"""
+Streaming bulk export of sensor_readings and user_reports.
+
+Rows are read from the Motor cursor in chunks and encoded chunk by chunk
+(CSV, NDJSON or Parquet, optionally gzipped), so exports of any size run
+in constant memory. Sensor-readings exports that reach back past the hot
+tier (app/archive.py) start with the archived readings of each sensor,
+up to its oldest reading still in Mongo, the same split the readings
+endpoint uses. Used by the /export/* endpoints and from the shell:
+
+    python -m app.export sensor-readings --from 2025-01-01 --format csv --gzip --out readings.csv.gz
+    python -m app.export user-reports --format ndjson --out reports.ndjson
+
+Parquet needs the optional `pyarrow` package.
+"""
+from datetime import datetime
+from typing import AsyncIterator, Optional
+import argparse
+import asyncio
+import csv
+import importlib.util
+import io
+import itertools
+import json
+import zlib
+
+from bson import ObjectId
+
+from .archive import archived_sensor_ids, hot_tier_start, iter_archived
+from .db import db
+
+CHUNK_ROWS = 5000
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# collection, columns (in file order), parquet type per column
+EXPORTS = {
+    "sensor-readings": {
+        "collection": "sensor_readings",
+        "columns": {
+            "id": "string",
+            "sensor_id": "string",
+            "sensor_name": "string",
+            "location": "string",
+            "timestamp": "timestamp",
+            "type": "string",
+            "value": "float",
+            "unit": "string",
+            "anomaly": "string",
+        },
+    },
+    "user-reports": {
+        "collection": "user_reports",
+        "columns": {
+            "id": "string",
+            "user_id": "string",
+            "sensor_id": "string",
+            "sensor_name": "string",
+            "location": "string",
+            "timestamp": "timestamp",
+            "type": "string",
+            "value": "float",
+            "unit": "string",
+            "source": "string",
+            "comment": "string",
+            "likes": "int",
+        },
+    },
+}
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def build_query(
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    sensor_ids: Optional[list[ObjectId]] = None,
+) -> dict:
+    query: dict = {}
+    if date_from or date_to:
+        query["timestamp"] = {}
+        if date_from:
+            query["timestamp"]["$gte"] = date_from
+        if date_to:
+            query["timestamp"]["$lt"] = date_to
+    if sensor_ids:
+        query["sensor_id"] = {"$in": sensor_ids}
+    return query
+
+
+async def iter_chunks(kind: str, query: dict, chunk_rows: int = CHUNK_ROWS) -> AsyncIterator[list[dict]]:
+    """
+    Rows (plain str/float/datetime values, one key per export column)
+    in chunks of at most chunk_rows, oldest first (archived readings,
+    then Mongo).
+    """
+    spec = EXPORTS[kind]
+    columns = spec["columns"]
+    projection = {c: 1 for c in columns if c != "id"}
+
+    if kind == "sensor-readings":
+        async for chunk in _archived_chunks(query, chunk_rows):
+            yield chunk
+
+    cursor = (
+        db[spec["collection"]]
+        .find(query, projection)
+        .sort("timestamp", 1)
+        .batch_size(chunk_rows)
+    )
+
+    chunk = []
+    async for doc in cursor:
+        row = {}
+        for col in columns:
+            value = doc.get("_id" if col == "id" else col)
+            if isinstance(value, ObjectId):
+                value = str(value)
+            row[col] = value
+        chunk.append(row)
+
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+async def _archived_chunks(query: dict, chunk_rows: int) -> AsyncIterator[list[dict]]:
+    """
+    Export rows from the archive for the part of a sensor-readings query
+    older than the hot tier: per sensor, everything before its oldest
+    reading still in Mongo (rows can sit in both tiers until the archive
+    run deletes them, and Mongo wins).
+    """
+    span = query.get("timestamp", {})
+    date_from, date_to = span.get("$gte"), span.get("$lt")
+    if date_from is not None and date_from >= hot_tier_start():
+        return
+
+    sensor_ids = query["sensor_id"]["$in"] if "sensor_id" in query else archived_sensor_ids()
+    if not sensor_ids:
+        return
+
+    # 1. Where Mongo takes over, per sensor
+    oldest = {
+        row["_id"]: row["timestamp"]
+        async for row in db.sensor_readings.aggregate([
+            {"$match": {**query, "sensor_id": {"$in": sensor_ids}}},
+            {"$sort": {"sensor_id": 1, "timestamp": 1}},
+            {"$group": {"_id": "$sensor_id", "timestamp": {"$first": "$timestamp"}}},
+        ])
+    }
+    end = date_to or datetime.utcnow()
+    untils = {sid: min(oldest.get(sid, end), end) for sid in sensor_ids}
+
+    # 2. Sensor metadata the archive doesn't keep
+    sensors = {
+        s["_id"]: s
+        async for s in db.sensors.find(
+            {"_id": {"$in": sensor_ids}}, {"name": 1, "location": 1, "type": 1, "unit": 1}
+        )
+    }
+
+    # 3. Read the archive a chunk at a time off the event loop
+    docs = iter_archived(date_from, untils)
+    while True:
+        batch = await asyncio.to_thread(lambda: list(itertools.islice(docs, chunk_rows)))
+        if not batch:
+            return
+        chunk = []
+        for doc in batch:
+            sensor = sensors.get(ObjectId(doc["sensor_id"]), {})
+            chunk.append({
+                "id": doc["id"],
+                "sensor_id": doc["sensor_id"],
+                "sensor_name": sensor.get("name"),
+                "location": sensor.get("location"),
+                "timestamp": doc["timestamp"],
+                "type": sensor.get("type"),
+                "value": doc["value"],
+                "unit": sensor.get("unit"),
+                "anomaly": None,
+            })
+        yield chunk
+
+
+async def _encode_csv(kind: str, chunks) -> AsyncIterator[bytes]:
+    columns = list(EXPORTS[kind]["columns"])
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=columns)
+    writer.writeheader()
+
+    async for chunk in chunks:
+        for row in chunk:
+            if isinstance(row.get("timestamp"), datetime):
+                row["timestamp"] = row["timestamp"].isoformat()
+        writer.writerows(chunk)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+async def _encode_ndjson(kind: str, chunks) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        lines = [json.dumps(row, default=_json_default, ensure_ascii=False) for row in chunk]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+class _ByteSink(io.RawIOBase):
+    """
+    Write-only file object that hands written bytes back to the generator.
+    """
+
+    def __init__(self):
+        self.parts: list[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+async def _encode_parquet(kind: str, chunks) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "string": pa.string(),
+        "timestamp": pa.timestamp("ms"),
+        "float": pa.float64(),
+        "int": pa.int64(),
+    }
+    schema = pa.schema([(col, types[t]) for col, t in EXPORTS[kind]["columns"].items()])
+
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        # one row group per chunk
+        async for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+async def _gzip(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip container
+    async for data in stream:
+        out = compressor.compress(data)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def export_stream(kind: str, query: dict, fmt: str, gzip: bool = False) -> AsyncIterator[bytes]:
+    encoders = {"csv": _encode_csv, "ndjson": _encode_ndjson, "parquet": _encode_parquet}
+    stream = encoders[fmt](kind, iter_chunks(kind, query))
+    return _gzip(stream) if gzip else stream
+
+
+def filename(kind: str, fmt: str, gzip: bool) -> str:
+    name = f"{kind}.{FORMATS[fmt][1]}"
+    return name + ".gz" if gzip else name
+
+
+async def main(args):
+    if args.format == "parquet" and not parquet_available():
+        raise SystemExit("Parquet export needs pyarrow (pip install pyarrow)")
+
+    date_from = datetime.fromisoformat(args.date_from) if args.date_from else None
+    date_to = datetime.fromisoformat(args.date_to) if args.date_to else None
+    sensor_ids = [ObjectId(s) for s in args.sensor_ids.split(",")] if args.sensor_ids else None
+    query = build_query(date_from, date_to, sensor_ids)
+
+    out = args.out or filename(args.kind, args.format, args.gzip)
+    written = 0
+    with open(out, "wb") as f:
+        async for data in export_stream(args.kind, query, args.format, args.gzip):
+            f.write(data)
+            written += len(data)
+
+    print(f"Wrote {written:,} bytes to {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export readings or reports to a local file")
+    parser.add_argument("kind", choices=list(EXPORTS))
+    parser.add_argument("--from", dest="date_from", help="ISO date/time, inclusive")
+    parser.add_argument("--to", dest="date_to", help="ISO date/time, exclusive")
+    parser.add_argument("--sensor-ids", help="comma separated sensor ids")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--out", help="output path (default: <kind>.<format>[.gz])")
+    asyncio.run(main(parser.parse_args()))
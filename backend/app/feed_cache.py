@@ -0,0 +1,241 @@
+"""
+Shared cache of encoded feed pages (GET /user-reports, GET /reports).
+
+A page is loaded and encoded once per key (the endpoint's filters: page
+size and keyset cursor) and then served from memory until a write
+actually touches it:
+
+    a new or re-dated report (key "<id>@<timestamp ms>", or
+      "@<ms>~<ms>" for a batch) drops only the pages whose time range it
+      falls into, plus the last page if it isn't full
+    an edited or deleted report (key "<id>") drops only the pages that
+      contain it
+    a like (key "<id>[,<id>...]") re-reads likes/liked_by of that report
+      and patches it in place, so like storms don't empty the cache
+    key None ("anything may have changed") drops every page
+
+Pages in "hot" order (app/hot.py) are keyed by score instead of time: a
+new or re-dated report drops the pages at or above its lowest possible
+score, and a liked report is patched in place only while it keeps its
+position, otherwise the pages it leaves and enters are dropped.
+
+Events come from the cache bus (app/invalidation.py), so a write on one
+worker reaches every worker. FEED_CACHE_TTL bounds staleness if an event
+is ever missed.
+
+User-report pages keep each report encoded without `liked_by_me`, plus
+the set of user ids that liked it. A per-user response is assembled by
+byte concatenation, no re-encoding.
+"""
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional
+import asyncio
+import math
+import os
+import time
+
+from .hot import hot_score
+from .resample import from_ms
+
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "60"))
+FEED_CACHE_MAX_PAGES = int(os.getenv("FEED_CACHE_MAX_PAGES", "256"))
+
+LIKED = b',"liked_by_me":true}'
+NOT_LIKED = b',"liked_by_me":false}'
+
+
+class FeedPage:
+    __slots__ = ("docs", "parts", "liked_by", "index", "sort", "keys", "upper", "full", "tail", "body", "expires")
+
+    def __init__(self, docs: list[dict], liked_by: Optional[list[set[str]]], keys: list[float],
+                 upper: Optional[float], next_cursor: Optional[str], encode: Callable, sort: str = "new"):
+        """
+        docs: shaped reports in feed order. liked_by: per report the ids
+        of users who liked it, or None for feeds without likes.
+        keys: per report its sort key, descending (timestamp ms for "new",
+        score for "hot"). upper: sort key of the cursor this page starts
+        after (None for the first page). The page is "full" when more
+        reports follow it.
+        """
+        self.docs = docs
+        self.liked_by = liked_by
+        self.index = {doc["id"]: i for i, doc in enumerate(docs)}
+        self.sort = sort
+        self.keys = keys
+        self.upper = upper
+        self.full = next_cursor is not None
+        self.tail = b'],"next_cursor":' + encode(next_cursor) + b"}"
+        self.parts = [encode(doc) for doc in docs]
+        if liked_by is not None:
+            self.parts = [part[:-1] for part in self.parts]   # room for liked_by_me
+        self.body = self.render(None)
+        self.expires = time.monotonic() + FEED_CACHE_TTL
+
+    def render(self, user_id: Optional[str]) -> bytes:
+        if self.liked_by is None:
+            items = b",".join(self.parts)
+        elif user_id is None:
+            items = b",".join(part + NOT_LIKED for part in self.parts)
+        else:
+            items = b",".join(
+                part + (LIKED if user_id in liked else NOT_LIKED)
+                for part, liked in zip(self.parts, self.liked_by)
+            )
+        return b'{"reports":[' + items + self.tail
+
+    def covers(self, lo: float, hi: float) -> bool:
+        """
+        Would a report with a sort key anywhere in [lo, hi] land on this page?
+        """
+        if self.upper is not None and lo > self.upper:
+            return False
+        return not self.full or not self.keys or hi >= self.keys[-1]
+
+    def covers_time(self, lo_ms: int, hi_ms: int) -> bool:
+        """
+        covers() for a report timestamped in [lo_ms, hi_ms] whose likes
+        aren't known: in hot order it scores at least hot_score(0, lo_ms).
+        """
+        if self.sort == "hot":
+            return self.covers(hot_score(0, from_ms(lo_ms)), math.inf)
+        return self.covers(lo_ms, hi_ms)
+
+    def holds(self, i: int, key: float) -> bool:
+        """
+        Would report i still be in place with this sort key?
+        """
+        above = self.keys[i - 1] if i > 0 else self.upper
+        if above is not None and key > above:
+            return False
+        if i + 1 < len(self.keys):
+            return key >= self.keys[i + 1]
+        # last on a full page: it mustn't fall behind the next page's first
+        return not self.full or key >= self.keys[i]
+
+
+def parse_key(key: str) -> tuple[list[str], Optional[tuple[int, int]]]:
+    """
+    "<id>[,<id>...][@<ms>[~<ms>]]" -> (ids, (lo_ms, hi_ms) or None)
+    """
+    ids, _, span = key.partition("@")
+    ids = [i for i in ids.split(",") if i]
+    if not span:
+        return ids, None
+    lo, _, hi = span.partition("~")
+    return ids, (int(lo), int(hi or lo))
+
+
+class FeedCache:
+    def __init__(self, encode: Callable):
+        self.encode = encode
+        self.pages: OrderedDict[Hashable, FeedPage] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # bumped by every write event; a load that raced one isn't stored
+        self.version = 0
+        # report id -> latest like event, so only the newest re-read patches
+        self._like_seq: dict[str, int] = {}
+        self.stats = {"hits": 0, "loads": 0, "dropped": 0, "patched": 0}
+
+    async def get(self, key: Hashable, load: Callable[[], Awaitable[FeedPage]]) -> FeedPage:
+        page = self.pages.get(key)
+        if page is not None and page.expires > time.monotonic():
+            self.pages.move_to_end(key)
+            self.stats["hits"] += 1
+            return page
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["loads"] += 1
+            task = asyncio.ensure_future(self._load(key, load))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[FeedPage]]) -> FeedPage:
+        version = self.version
+        try:
+            page = await load()
+        finally:
+            self._inflight.pop(key, None)
+        if version == self.version:
+            self.pages[key] = page
+            while len(self.pages) > FEED_CACHE_MAX_PAGES:
+                self.pages.popitem(last=False)
+        return page
+
+    def clear(self):
+        self.version += 1
+        self.stats["dropped"] += len(self.pages)
+        self.pages.clear()
+
+    def _drop(self, predicate: Callable[[FeedPage], bool]):
+        self.version += 1
+        for key in [k for k, page in self.pages.items() if predicate(page)]:
+            del self.pages[key]
+            self.stats["dropped"] += 1
+
+    def invalidate(self, key: Optional[str]):
+        """
+        Cache bus subscriber for report writes (see module docstring).
+        """
+        if key is None:
+            self.clear()
+            return
+        ids, span = parse_key(key)
+        self._drop(lambda page: any(i in page.index for i in ids) or (span is not None and page.covers_time(*span)))
+
+    async def refresh_likes(self, key: Optional[str], fetch: Callable[[list[str]], Awaitable[list[dict]]]):
+        """
+        Cache bus subscriber for likes. fetch(ids) returns the current
+        {"id", "likes", "liked_by", "hot"} of those reports.
+        """
+        if key is None:
+            self.clear()
+            return
+        self.version += 1   # a page being loaded right now may predate the like
+        ids = parse_key(key)[0]
+        ranked = any(page.sort == "hot" for page in self.pages.values())
+        if not ranked:
+            # only pages that show these reports care
+            ids = [i for i in ids if any(i in page.index for page in self.pages.values())]
+        if not ids:
+            return
+
+        seqs = {}
+        for rid in ids:
+            seqs[rid] = self._like_seq[rid] = self._like_seq.get(rid, 0) + 1
+        try:
+            docs = await fetch(ids)
+        except Exception:
+            self._drop(lambda page: any(i in page.index for i in ids))
+            raise
+
+        found = {doc["id"]: doc for doc in docs}
+        for rid, seq in seqs.items():
+            if self._like_seq.get(rid) != seq:
+                continue   # a newer like re-read is on its way
+            del self._like_seq[rid]
+            doc = found.get(rid)
+            if doc is None:
+                self._drop(lambda page: rid in page.index)
+                continue
+            self._patch(rid, doc)
+
+    def _patch(self, rid: str, doc: dict):
+        hot = doc.get("hot")
+        for key, page in list(self.pages.items()):
+            i = page.index.get(rid)
+            if page.sort == "hot":
+                # the score moved: fine only if the order on every page holds
+                if hot is None or (i is None and page.covers(hot, hot)) or (i is not None and not page.holds(i, hot)):
+                    del self.pages[key]
+                    self.stats["dropped"] += 1
+                    continue
+            if i is None or page.liked_by is None:
+                continue
+            page.docs[i]["likes"] = doc["likes"]
+            page.liked_by[i] = doc["liked_by"]
+            if page.sort == "hot":
+                page.keys[i] = hot
+            page.parts[i] = self.encode(page.docs[i])[:-1]
+            page.body = page.render(None)
+            self.stats["patched"] += 1
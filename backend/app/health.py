@@ -0,0 +1,95 @@
+"""
+Stale-sensor detection.
+
+Once a minute (lifespan task) we find every sensor's last reading time
+with one aggregation that walks the (sensor_id, timestamp) index as a
+DISTINCT_SCAN, one index entry per sensor, regardless of how many
+readings there are (app/latest.py).
+
+A sensor is "stale" when its last reading is older than
+STALE_AFTER_INTERVALS times its expected reporting interval
+(`expected_interval_minutes` on the sensor, default 10), and "no_data"
+if it never reported. The status and last reading time are written back
+to the sensor document only when they change.
+"""
+from datetime import datetime
+from typing import Optional
+import asyncio
+import os
+
+from pymongo import UpdateOne
+
+from .db import db
+from .latest import latest_per_sensor
+
+SENSOR_HEALTH_INTERVAL_SECONDS = float(os.getenv("SENSOR_HEALTH_INTERVAL_SECONDS", "60"))
+DEFAULT_EXPECTED_INTERVAL_MINUTES = 10
+STALE_AFTER_INTERVALS = 3
+
+# Result of the most recent check in this process
+latest_health: dict = {"checked_at": None, "sensors": []}
+
+
+async def last_reading_times() -> dict:
+    latest = await latest_per_sensor()
+    return {sid: row["timestamp"] for sid, row in latest.items()}
+
+
+async def check_sensor_health(now: Optional[datetime] = None) -> dict:
+    now = now or datetime.utcnow()
+
+    sensors, last_seen = await asyncio.gather(
+        db.sensors.find(
+            {"is_active": True},
+            {"name": 1, "type": 1, "location": 1, "expected_interval_minutes": 1,
+             "health_status": 1, "last_reading_at": 1},
+        ).to_list(length=None),
+        last_reading_times(),
+    )
+
+    results, ops = [], []
+    for s in sensors:
+        interval = s.get("expected_interval_minutes") or DEFAULT_EXPECTED_INTERVAL_MINUTES
+        last = last_seen.get(s["_id"])
+
+        if last is None:
+            status, staleness = "no_data", None
+        else:
+            staleness = max((now - last).total_seconds(), 0.0)
+            status = "stale" if staleness > STALE_AFTER_INTERVALS * interval * 60 else "ok"
+
+        results.append({
+            "sensor_id": str(s["_id"]),
+            "name": s.get("name"),
+            "type": s.get("type"),
+            "location": s.get("location"),
+            "status": status,
+            "last_reading_at": last,
+            "staleness_seconds": None if staleness is None else round(staleness),
+            "expected_interval_minutes": interval,
+        })
+
+        if s.get("health_status") != status or s.get("last_reading_at") != last:
+            ops.append(UpdateOne(
+                {"_id": s["_id"]},
+                {"$set": {"health_status": status, "last_reading_at": last}},
+            ))
+
+    if ops:
+        await db.sensors.bulk_write(ops, ordered=False)
+
+    latest_health["checked_at"] = now
+    latest_health["sensors"] = results
+    return latest_health
+
+
+async def sensor_health_loop():
+    """
+    Lifespan task: re-check every SENSOR_HEALTH_INTERVAL_SECONDS.
+    """
+    while True:
+        try:
+            await check_sensor_health()
+        except Exception as exc:
+            print(f"[health] sensor check failed: {exc}")
+        await asyncio.sleep(SENSOR_HEALTH_INTERVAL_SECONDS)
@@ -0,0 +1,94 @@
+"""
+"Hot" ranking for the community feed (GET /user-reports?sort=hot).
+
+Every user report carries an indexed `hot` score:
+
+    hot = log2(1 + likes) + (timestamp - HOT_EPOCH) / HOT_HALF_LIFE_HOURS
+
+Ranking by it is the same as ranking by (1 + likes) * 2^(-age / half-life):
+a report HOT_HALF_LIFE_HOURS older needs twice the likes to rank level.
+The age term is relative to a fixed epoch, so scores don't go stale as
+time passes, and the hot feed is an index scan on (hot, _id).
+
+Scores are maintained where likes and timestamps change:
+
+    create          hot_score(0, timestamp) is stored with the document
+    like / unlike   HOT_UPDATE recomputes it server-side from the current
+                    likes, in one update, so concurrent toggles can't race
+    re-dated edit   same
+
+`hot_loop` rewrites every score in batches every HOT_REDECAY_SECONDS. It
+backfills reports written before this field existed, repairs writes that
+bypassed the paths above, and re-decays everything when
+HOT_HALF_LIFE_HOURS is changed.
+"""
+from datetime import datetime, timezone
+import asyncio
+import math
+import os
+
+from .db import db
+
+HOT_HALF_LIFE_HOURS = float(os.getenv("HOT_HALF_LIFE_HOURS", "12"))
+HOT_REDECAY_SECONDS = float(os.getenv("HOT_REDECAY_SECONDS", str(6 * 3600)))
+HOT_BATCH_SIZE = 1000
+HOT_BATCH_PAUSE_SECONDS = 0.05
+
+HOT_EPOCH = datetime(2025, 1, 1)
+_HALF_LIFE_MS = HOT_HALF_LIFE_HOURS * 3600 * 1000
+
+
+def hot_score(likes: int, timestamp: datetime) -> float:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    age_ms = (timestamp - HOT_EPOCH).total_seconds() * 1000
+    return math.log2(1 + max(int(likes or 0), 0)) + age_ms / _HALF_LIFE_MS
+
+
+# The same formula as an update pipeline, evaluated on the stored fields
+HOT_UPDATE = [{"$set": {"hot": {"$add": [
+    {"$log": [{"$add": [{"$max": [{"$ifNull": ["$likes", 0]}, 0]}, 1]}, 2]},
+    {"$divide": [{"$subtract": ["$timestamp", HOT_EPOCH]}, _HALF_LIFE_MS]},
+]}}}]
+
+
+async def rescore(ids: list):
+    """
+    Recompute `hot` for these reports from their current likes/timestamp.
+    """
+    if ids:
+        await db.user_reports.update_many({"_id": {"$in": list(ids)}}, HOT_UPDATE)
+
+
+async def redecay() -> int:
+    """
+    Rewrite every report's score, HOT_BATCH_SIZE reports at a time in _id
+    order. Returns how many changed.
+    """
+    changed = 0
+    last_id = None
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        batch = await db.user_reports.find(query, {"_id": 1}).sort("_id", 1).limit(HOT_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            return changed
+
+        ids = [doc["_id"] for doc in batch]
+        result = await db.user_reports.update_many({"_id": {"$in": ids}}, HOT_UPDATE)
+        changed += result.modified_count
+        last_id = ids[-1]
+        await asyncio.sleep(HOT_BATCH_PAUSE_SECONDS)
+
+
+async def hot_loop():
+    """
+    Lifespan task: re-decay on startup, then every HOT_REDECAY_SECONDS.
+    """
+    while True:
+        try:
+            changed = await redecay()
+            if changed:
+                print(f"[hot] rescored {changed} reports")
+        except Exception as exc:
+            print(f"[hot] {exc}")
+        await asyncio.sleep(HOT_REDECAY_SECONDS)
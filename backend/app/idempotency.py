@@ -0,0 +1,133 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request with a given key claims it in the `idempotency_keys`
+collection, runs, and stores its response. Retries with the same key get
+the stored response back instead of writing again. Keys expire through a
+TTL index (see indexes.py).
+
+A claim is a lease of IDEMPOTENCY_LEASE_SECONDS. If the request fails or
+is cancelled the claim is released at once; if its worker dies before it
+can do that, a retry after the lease runs out takes the key over instead
+of getting 409 until the key expires.
+
+A handler that was released or taken over may already have written, so
+handlers get a document id derived from the key (`key_object_id`) and
+insert with it: a second run hits a duplicate key and answers with the
+document the first run created.
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+import asyncio
+import hashlib
+import json
+import math
+import os
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from .db import db
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# longer than any handler takes, or a slow first attempt could be run twice
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+
+
+def key_object_id(key_id: str) -> ObjectId:
+    """
+    The same ObjectId for every run of one (scope, key).
+    """
+    return ObjectId(hashlib.sha256(key_id.encode()).digest()[:12])
+
+
+def _request_hash(payload: dict) -> str:
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def run_idempotent(
+    scope: str,
+    key: Optional[str],
+    payload: dict,
+    handler: Callable[[Optional[ObjectId]], Awaitable[dict]],
+) -> dict:
+    """
+    Run `handler(doc_id)` at most once per (scope, key). doc_id is
+    key_object_id() of the key (None without a key); handlers must use it
+    as the _id of what they create.
+
+    - no key: just run the handler
+    - key already completed with the same payload: return the stored response
+    - key still in flight: 409 with Retry-After
+    - key claimed by a request whose lease ran out: take it over and run
+    - key reused with a different payload: 422
+    """
+    if not key:
+        return await handler(None)
+
+    key_id = f"{scope}:{key}"
+    request_hash = _request_hash(payload)
+    owner = ObjectId()
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+
+    try:
+        await db.idempotency_keys.insert_one(
+            {
+                "_id": key_id,
+                "request_hash": request_hash,
+                "created_at": now,
+                "owner": owner,
+                "lease_until": lease_until,
+                "response": None,
+            }
+        )
+    except DuplicateKeyError:
+        existing = await db.idempotency_keys.find_one({"_id": key_id})
+        if existing is None:
+            # expired between insert and read; treat as a fresh request
+            return await run_idempotent(scope, key, payload, handler)
+
+        if existing.get("request_hash") != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request body",
+            )
+        if existing.get("response") is not None:
+            return existing["response"]
+
+        # Claims from before leases existed count as expired
+        expires = existing.get("lease_until") or existing["created_at"]
+        if expires > now:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed",
+                headers={"Retry-After": str(math.ceil((expires - now).total_seconds()))},
+            )
+
+        # The owner never finished: take the key over, unless another
+        # retry got there first (then start over and see what it did)
+        taken = await db.idempotency_keys.update_one(
+            {"_id": key_id, "response": None, "owner": existing.get("owner"), "lease_until": existing.get("lease_until")},
+            {"$set": {"owner": owner, "lease_until": lease_until}},
+        )
+        if taken.modified_count == 0:
+            return await run_idempotent(scope, key, payload, handler)
+
+    try:
+        response = await handler(key_object_id(key_id))
+    except BaseException:
+        # Failed or cancelled: let the client retry with the same key.
+        # Shielded so a second cancel can't skip the release.
+        try:
+            await asyncio.shield(db.idempotency_keys.delete_one({"_id": key_id, "owner": owner}))
+        except BaseException:
+            pass   # the lease runs out on its own
+        raise
+
+    await db.idempotency_keys.update_one(
+        {"_id": key_id, "owner": owner}, {"$set": {"response": response}}
+    )
+    return response
@@ -0,0 +1,66 @@
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+from .db import db
+from .idempotency import IDEMPOTENCY_TTL_SECONDS
+
+
+async def ensure_indexes():
+    """
+    Create the indexes the API and the ingest gateway rely on.
+    Safe to call on every startup (create_index is a no-op if it exists).
+    """
+    # One reading per sensor per timestamp: retries from loggers become no-ops
+    try:
+        await db.sensor_readings.create_index(
+            [("sensor_id", ASCENDING), ("timestamp", ASCENDING)],
+            unique=True,
+            name="sensor_id_timestamp_unique",
+        )
+    except OperationFailure as exc:
+        # Usually means old duplicate readings are still in the collection
+        print(
+            "[indexes] could not create unique (sensor_id, timestamp) index on "
+            f"sensor_readings: {exc}. Run dedupe_sensor_readings.py and restart."
+        )
+
+    # Newest readings across all sensors (dashboard)
+    await db.sensor_readings.create_index([("timestamp", DESCENDING)])
+
+    # Only flagged readings are indexed, for GET /sensors/{id}/anomalies
+    await db.sensor_readings.create_index(
+        [("sensor_id", ASCENDING), ("anomaly", ASCENDING), ("timestamp", ASCENDING)],
+        partialFilterExpression={"anomaly": {"$exists": True}},
+        name="sensor_id_timestamp_anomalies",
+    )
+
+    # Full-text search over community reports. default_language "none":
+    # most posts are Malay, and English stemming / stop words mangle them.
+    await db.user_reports.create_index(
+        [("comment", TEXT), ("location", TEXT), ("sensor_name", TEXT)],
+        weights={"comment": 10, "location": 3, "sensor_name": 2},
+        default_language="none",
+        name="user_reports_text",
+    )
+
+    # Feed pages, newest first, keyset-paginated on (timestamp, _id)
+    await db.user_reports.create_index([("timestamp", DESCENDING), ("_id", DESCENDING)])
+    await db.reports.create_index([("timestamp", DESCENDING), ("_id", DESCENDING)])
+
+    # GET /user-reports?sort=hot, see app/hot.py
+    await db.user_reports.create_index([("hot", DESCENDING), ("_id", DESCENDING)])
+
+    # A user's reports, and the reports a user liked (user deletion cleanup,
+    # app/cleanup.py)
+    await db.user_reports.create_index([("user_id", ASCENDING)])
+    await db.user_reports.create_index([("liked_by", ASCENDING)])
+
+    # Runnable cleanup jobs, oldest first
+    await db.cleanup_jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+
+    # Expire idempotency keys after the TTL
+    await db.idempotency_keys.create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS,
+        name="created_at_ttl",
+    )
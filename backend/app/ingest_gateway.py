@@ -0,0 +1,374 @@
+"""
+Line-protocol ingestion gateway for field sensors.
+
+Rain gauges and river-level loggers send one reading per line:
+
+    sensor_id,timestamp,value
+
+over TCP (newline separated) or UDP (one or more lines per datagram).
+`timestamp` is either ISO-8601 or unix epoch seconds. Readings are
+buffered into size- and time-bounded batches and written to
+`sensor_readings` with unordered bulk inserts. The unique
+(sensor_id, timestamp) index makes retried lines harmless: duplicates are
+rejected by Mongo inside the same bulk call and only counted here.
+
+Run it next to the API (uses the same .env / app.db config):
+
+    python -m app.ingest_gateway
+"""
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import math
+import os
+import time
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from .anomaly import AnomalyDetector
+from .db import db
+from .indexes import ensure_indexes
+
+INGEST_HOST = os.getenv("INGEST_HOST", "0.0.0.0")
+INGEST_TCP_PORT = int(os.getenv("INGEST_TCP_PORT", "7070"))
+INGEST_UDP_PORT = int(os.getenv("INGEST_UDP_PORT", "7071"))
+
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_MS", "200")) / 1000
+MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "20000"))
+
+# A batch that fails outright (network, primary step-down) is retried
+# this many times, backing off from INSERT_RETRY_BASE seconds
+INSERT_RETRIES = int(os.getenv("INGEST_INSERT_RETRIES", "6"))
+INSERT_RETRY_BASE = 0.25
+INSERT_RETRY_MAX = 10.0
+
+# How often we are allowed to go back to Mongo for an unknown sensor id
+SENSOR_REFRESH_SECONDS = 30
+
+
+def parse_timestamp(raw: str) -> datetime:
+    """
+    Accept unix epoch seconds ("1731900000.5") or ISO-8601
+    ("2025-11-18T03:20:00Z"). Always returns an aware UTC datetime.
+    """
+    raw = raw.strip()
+    try:
+        seconds = float(raw)
+    except ValueError:
+        seconds = None
+
+    if seconds is not None:
+        try:
+            return datetime.fromtimestamp(seconds, tz=timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            # nan, inf, or outside what the platform's time functions take
+            raise ValueError(f"timestamp out of range '{raw}'")
+
+    ts = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def parse_line(line: str) -> tuple[ObjectId, datetime, float]:
+    """
+    Parse 'sensor_id,timestamp,value'. Raises ValueError on bad input.
+    """
+    parts = line.strip().split(",")
+    if len(parts) != 3:
+        raise ValueError(f"expected 3 fields, got {len(parts)}")
+
+    sensor_id, ts, value = parts
+    try:
+        sid = ObjectId(sensor_id.strip())
+    except Exception:
+        raise ValueError(f"invalid sensor id '{sensor_id}'")
+
+    reading = float(value)
+    if not math.isfinite(reading):
+        # would break JSON encoding downstream and the anomaly statistics
+        raise ValueError(f"value must be finite, got '{value.strip()}'")
+
+    return sid, parse_timestamp(ts), reading
+
+
+class SensorDirectory:
+    """
+    In-memory copy of sensor metadata so each reading can be stored with
+    the same denormalised fields as the seeded data (name, location, ...).
+    Unknown ids trigger a reload, at most once every SENSOR_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self.sensors: dict[ObjectId, dict] = {}
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        sensors = {}
+        cursor = db.sensors.find(
+            {}, {"name": 1, "location": 1, "type": 1, "unit": 1}
+        )
+        async for doc in cursor:
+            sensors[doc["_id"]] = doc
+        self.sensors = sensors
+        self.loaded_at = time.monotonic()
+
+    async def get(self, sid: ObjectId) -> Optional[dict]:
+        sensor = self.sensors.get(sid)
+        if sensor is not None:
+            return sensor
+
+        async with self._lock:
+            if time.monotonic() - self.loaded_at >= SENSOR_REFRESH_SECONDS:
+                await self.load()
+        return self.sensors.get(sid)
+
+
+class ReadingBatcher:
+    """
+    Bounded queue in front of Mongo. Producers `await put()` (TCP, which
+    gives us backpressure: we stop reading the socket while the queue is
+    full) or `offer()` (UDP, which has no flow control, so we drop and
+    count instead). A single writer drains the queue into insert_many
+    calls of at most `batch_size` docs, or whatever arrived within
+    `flush_interval` seconds.
+
+    A batch whose insert fails outright is retried with backoff (the
+    writer waits, so the queue fills and TCP producers are throttled).
+    Docs keep the _id they got on the first attempt, so the part of a
+    batch that did land comes back as duplicates, not as second copies.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.stats = {
+            "received": 0,
+            "inserted": 0,
+            "duplicates": 0,
+            "dropped": 0,
+            "rejected": 0,
+            "batches": 0,
+            "retries": 0,
+            "errors": 0,
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    async def put(self, doc: dict):
+        self.stats["received"] += 1
+        await self.queue.put(doc)
+
+    def offer(self, doc: dict) -> bool:
+        self.stats["received"] += 1
+        try:
+            self.queue.put_nowait(doc)
+            return True
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Flush everything still queued, then stop the writer.
+        """
+        await self.queue.join()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self.flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def flush(self, batch: list[dict]):
+        for attempt in range(INSERT_RETRIES + 1):
+            try:
+                await self._insert(batch)
+                break
+            except Exception as exc:
+                if attempt == INSERT_RETRIES:
+                    self.stats["errors"] += 1
+                    print(f"[ingest] insert_many of {len(batch)} readings failed after {attempt + 1} attempts: {exc}")
+                    break
+                self.stats["retries"] += 1
+                await asyncio.sleep(min(INSERT_RETRY_MAX, INSERT_RETRY_BASE * 2 ** attempt))
+        self.stats["batches"] += 1
+
+    async def _insert(self, batch: list[dict]):
+        """
+        One unordered insert_many. Raises only if the call failed as a
+        whole; per-document write errors are counted here.
+        """
+        try:
+            result = await db.sensor_readings.insert_many(batch, ordered=False)
+            self.stats["inserted"] += len(result.inserted_ids)
+        except BulkWriteError as exc:
+            # ordered=False: everything except the failed docs was written
+            details = exc.details
+            write_errors = details.get("writeErrors", [])
+            dupes = sum(1 for e in write_errors if e.get("code") == 11000)
+            self.stats["inserted"] += details.get("nInserted", 0)
+            self.stats["duplicates"] += dupes
+            if dupes < len(write_errors):
+                self.stats["errors"] += 1
+                print(f"[ingest] {len(write_errors) - dupes} readings failed to insert")
+
+
+class IngestGateway:
+    def __init__(self, batcher: ReadingBatcher, directory: SensorDirectory):
+        self.batcher = batcher
+        self.directory = directory
+        self.detector = AnomalyDetector()
+
+    async def build_doc(self, line: str) -> Optional[dict]:
+        """
+        Turn one protocol line into a sensor_readings document,
+        or None (and count it) if it is malformed or for an unknown sensor.
+        """
+        if not line.strip():
+            return None
+
+        try:
+            sid, ts, value = parse_line(line)
+        except ValueError:
+            self.batcher.stats["rejected"] += 1
+            return None
+
+        sensor = await self.directory.get(sid)
+        if sensor is None:
+            self.batcher.stats["rejected"] += 1
+            return None
+
+        doc = {
+            "sensor_id": sid,
+            "sensor_name": sensor.get("name"),
+            "location": sensor.get("location"),
+            "timestamp": ts,
+            "type": sensor.get("type"),
+            "value": value,
+            "unit": sensor.get("unit"),
+        }
+
+        label, z = self.detector.score(sid, sensor.get("type"), ts, value)
+        if label is not None:
+            doc["anomaly"] = label
+            doc["anomaly_score"] = round(z, 2)
+
+        return doc
+
+    async def handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                doc = await self.build_doc(raw.decode("utf-8", errors="replace"))
+                if doc is not None:
+                    # blocks while the queue is full -> TCP flow control
+                    await self.batcher.put(doc)
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_datagram(self, data: bytes):
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            doc = await self.build_doc(line)
+            if doc is not None:
+                self.batcher.offer(doc)
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, gateway: IngestGateway):
+        self.gateway = gateway
+
+    def datagram_received(self, data, addr):
+        asyncio.ensure_future(self.gateway.handle_datagram(data))
+
+
+async def report_stats(batcher: ReadingBatcher, every: float = 5.0):
+    last_inserted = 0
+    while True:
+        await asyncio.sleep(every)
+        inserted = batcher.stats["inserted"]
+        rate = (inserted - last_inserted) / every
+        last_inserted = inserted
+        print(
+            f"[ingest] {rate:,.0f} readings/s | queued={batcher.queue.qsize()} "
+            + " ".join(f"{k}={v}" for k, v in batcher.stats.items())
+        )
+
+
+async def main():
+    await ensure_indexes()
+
+    directory = SensorDirectory()
+    await directory.load()
+    print(f"[ingest] loaded {len(directory.sensors)} sensors")
+
+    batcher = ReadingBatcher()
+    batcher.start()
+    gateway = IngestGateway(batcher, directory)
+
+    loop = asyncio.get_running_loop()
+    tcp_server = await asyncio.start_server(
+        gateway.handle_tcp, INGEST_HOST, INGEST_TCP_PORT
+    )
+    udp_transport, _ = await loop.create_datagram_endpoint(
+        lambda: _UDPProtocol(gateway),
+        local_addr=(INGEST_HOST, INGEST_UDP_PORT),
+    )
+    stats_task = asyncio.create_task(report_stats(batcher))
+
+    print(
+        f"[ingest] listening on tcp://{INGEST_HOST}:{INGEST_TCP_PORT} "
+        f"and udp://{INGEST_HOST}:{INGEST_UDP_PORT} "
+        f"(batch={batcher.batch_size}, flush={int(batcher.flush_interval * 1000)}ms)"
+    )
+
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        udp_transport.close()
+        stats_task.cancel()
+        await batcher.stop()
+        print(f"[ingest] stopped: {batcher.stats}")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
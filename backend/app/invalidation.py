@@ -0,0 +1,138 @@
+"""
+Cache invalidation across uvicorn workers.
+
+Every worker keeps its own in-memory caches (map tiles, reading rings,
+coalesced responses, ...), so a write handled by one worker has to reach
+the others. Writes call
+
+    await cache_bus.publish("sensor", str(sensor_id))
+
+which runs this worker's subscribers right away and appends an event to
+the capped `cache_events` collection. Every worker tails that collection
+with an awaiting tailable cursor and replays other workers' events into
+its own subscribers, normally within milliseconds. `versions[topic]`
+counts events per topic, for caches that prefer versioned keys.
+
+Topics: "sensor", "user_report", "like", "report". A subscriber gets the
+key, or None for "anything in this topic may have changed".
+
+If a worker loses the tail it resumes from its last event; if the capped
+collection wrapped past that point in the meantime it flushes every
+subscriber, so no cache is stale for longer than the reconnect delay.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+import asyncio
+import inspect
+import os
+import socket
+import uuid
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from .db import db
+
+CACHE_BUS_SIZE_BYTES = 8 * 1024 * 1024
+CACHE_BUS_RETRY_SECONDS = float(os.getenv("CACHE_BUS_RETRY_SECONDS", "2"))
+
+# ObjectIds from different processes aren't strictly ordered, so a resumed
+# tail starts a little before the last event seen (replays are harmless)
+RESUME_LOOKBACK_SECONDS = 2
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class CacheBus:
+    def __init__(self):
+        self.subscribers: dict[str, list[Callable[[Optional[str]], Any]]] = {}
+        self.versions: dict[str, int] = {}
+        self.last_id: Optional[ObjectId] = None
+        self.stats = {"published": 0, "received": 0, "flushes": 0}
+
+    def subscribe(self, topic: str, callback: Callable[[Optional[str]], Any]):
+        """
+        callback(key) may be a plain function or a coroutine function.
+        """
+        self.subscribers.setdefault(topic, []).append(callback)
+
+    async def _dispatch(self, topic: str, key: Optional[str]):
+        self.versions[topic] = self.versions.get(topic, 0) + 1
+        for callback in self.subscribers.get(topic, ()):
+            try:
+                result = callback(key)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as exc:
+                print(f"[cache-bus] {topic} subscriber {callback!r} failed: {exc}")
+
+    async def publish(self, topic: str, key: Optional[str] = None):
+        await self._dispatch(topic, key)
+        self.stats["published"] += 1
+        try:
+            await db.cache_events.insert_one({
+                "topic": topic,
+                "key": key,
+                "origin": WORKER_ID,
+                "at": datetime.utcnow(),
+            })
+        except Exception as exc:
+            # the write itself succeeded; other workers catch up via TTLs
+            print(f"[cache-bus] publish {topic}/{key} failed: {exc}")
+
+    async def flush_all(self):
+        self.stats["flushes"] += 1
+        for topic in list(self.subscribers):
+            await self._dispatch(topic, None)
+
+    async def _start(self):
+        """
+        Create the capped collection if needed and start from its end.
+        """
+        try:
+            await db.create_collection("cache_events", capped=True, size=CACHE_BUS_SIZE_BYTES)
+        except CollectionInvalid:
+            pass  # already there (or another worker just created it)
+
+        # a tailable cursor on an empty collection dies at once, so every
+        # worker leaves a marker that is also its starting point
+        result = await db.cache_events.insert_one({
+            "topic": "_start",
+            "origin": WORKER_ID,
+            "at": datetime.utcnow(),
+        })
+        self.last_id = result.inserted_id
+
+    async def _resume_query(self) -> dict:
+        oldest = await db.cache_events.find_one({}, sort=[("$natural", 1)])
+        if oldest is not None and oldest["_id"] > self.last_id:
+            # wrapped past our position: we can't know what we missed
+            await self.flush_all()
+        since = self.last_id.generation_time - timedelta(seconds=RESUME_LOOKBACK_SECONDS)
+        return {"_id": {"$gte": ObjectId.from_datetime(since)}}
+
+    async def run(self):
+        """
+        Lifespan task: tail cache_events and apply other workers' events.
+        """
+        while True:
+            try:
+                if self.last_id is None:
+                    await self._start()
+                query = await self._resume_query()
+
+                cursor = db.cache_events.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        self.last_id = event["_id"]
+                        if event.get("origin") == WORKER_ID or event["topic"] == "_start":
+                            continue
+                        self.stats["received"] += 1
+                        await self._dispatch(event["topic"], event.get("key"))
+            except Exception as exc:
+                print(f"[cache-bus] tail lost: {exc}")
+            await asyncio.sleep(CACHE_BUS_RETRY_SECONDS)
+
+
+cache_bus = CacheBus()
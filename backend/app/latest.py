@@ -0,0 +1,64 @@
+"""
+Latest reading per sensor, straight off the readings index.
+
+The pipeline sorts in the exact reverse of `sensor_id_timestamp_unique`
+(sensor_id ASC, timestamp ASC) and keeps only $first values, so the
+planner turns $sort + $group into a DISTINCT_SCAN: one index seek per
+sensor, no in-memory sort, however many readings there are. Any other
+sort order (e.g. sensor_id ASC, timestamp DESC) is a blocking sort of
+the whole collection. Check the plan with
+
+    python -m app.latest
+"""
+import asyncio
+
+from .db import db
+
+
+def latest_pipeline(*fields: str) -> list[dict]:
+    """
+    One row per sensor: {_id: sensor_id, timestamp, <fields>} of its newest reading.
+    """
+    group = {"_id": "$sensor_id", "timestamp": {"$first": "$timestamp"}}
+    for field in fields:
+        group[field] = {"$first": f"${field}"}
+    return [
+        {"$sort": {"sensor_id": -1, "timestamp": -1}},
+        {"$group": group},
+    ]
+
+
+async def latest_per_sensor(*fields: str) -> dict:
+    """
+    {sensor_id: row} for every sensor that has readings.
+    """
+    return {
+        row["_id"]: row
+        async for row in db.sensor_readings.aggregate(latest_pipeline(*fields))
+    }
+
+
+def _stages(plan) -> list[str]:
+    if isinstance(plan, dict):
+        found = [plan["stage"]] if "stage" in plan else []
+        for value in plan.values():
+            found += _stages(value)
+        return found
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _stages(item)]
+    return []
+
+
+async def main():
+    explain = await db.command(
+        "explain",
+        {"aggregate": "sensor_readings", "pipeline": latest_pipeline("value"), "cursor": {}},
+        verbosity="queryPlanner",
+    )
+    stages = _stages(explain)
+    print("plan stages:", " -> ".join(dict.fromkeys(stages)))
+    print("DISTINCT_SCAN" if "DISTINCT_SCAN" in stages else "NO DISTINCT_SCAN (collection sort!)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
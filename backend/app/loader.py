@@ -0,0 +1,84 @@
+"""
+Request-scoped batched loader for documents by _id.
+
+Every `load()` issued in the same event-loop tick for the same collection
+is resolved by a single `find({"_id": {"$in": [...]}})`, and results are
+cached for the rest of the request. Combine with asyncio.gather to run
+independent lookups concurrently:
+
+    user, sensor = await asyncio.gather(
+        loader.load("users", user_oid),
+        loader.load("sensors", sensor_oid),
+    )
+"""
+from typing import Optional
+import asyncio
+
+from bson import ObjectId
+
+from .db import db
+
+
+class DocLoader:
+    def __init__(self):
+        self._cache: dict[tuple[str, ObjectId], asyncio.Future] = {}
+        self._pending: dict[str, dict[ObjectId, asyncio.Future]] = {}
+        self.queries = 0
+
+    async def load(self, collection: str, oid: ObjectId) -> Optional[dict]:
+        """
+        The document with this _id, or None. Returns a copy, so callers
+        can reshape it freely.
+        """
+        key = (collection, oid)
+        fut = self._cache.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = self._cache[key] = loop.create_future()
+
+            batch = self._pending.get(collection)
+            if batch is None:
+                batch = self._pending[collection] = {}
+                # runs after every other load() queued in this tick
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch(collection)))
+            batch[oid] = fut
+
+        doc = await fut
+        return dict(doc) if doc is not None else None
+
+    async def load_many(self, collection: str, oids) -> list[Optional[dict]]:
+        return list(await asyncio.gather(*(self.load(collection, oid) for oid in oids)))
+
+    def forget(self, collection: str, oid: ObjectId):
+        """
+        Drop a cached document after writing to it.
+        """
+        self._cache.pop((collection, oid), None)
+
+    async def _dispatch(self, collection: str):
+        batch = self._pending.pop(collection, {})
+        if not batch:
+            return
+
+        self.queries += 1
+        try:
+            docs = {}
+            async for doc in db[collection].find({"_id": {"$in": list(batch)}}):
+                docs[doc["_id"]] = doc
+        except Exception as exc:
+            for oid, fut in batch.items():
+                self._cache.pop((collection, oid), None)
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+
+        for oid, fut in batch.items():
+            if not fut.done():
+                fut.set_result(docs.get(oid))
+
+
+def get_loader() -> DocLoader:
+    """
+    FastAPI dependency: a fresh loader (and cache) per request.
+    """
+    return DocLoader()
@@ -1,18 +1,209 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from bson import ObjectId
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Optional, List
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
+import asyncio
 import os
-import stripe
 
+from .archive import hot_tier_start, read_archived
+from .cleanup import cleanup_loop, enqueue_user_cleanup, get_job
+from .correlation import compute_lag_correlations
+from .counters import (
+    get_location_report_count,
+    on_like_changed,
+    on_report_created,
+    on_report_deleted,
+    on_report_moved,
+)
 from .db import db
+from .delta import check_wait, encode_series_cursor, long_poll, parse_series_since, parse_since
+from .export import FORMATS as EXPORT_FORMATS
+from .export import build_query as build_export_query
+from .export import export_stream, parquet_available
+from .export import filename as export_filename
+from .feed_cache import FeedCache, FeedPage
+from .health import SENSOR_HEALTH_INTERVAL_SECONDS, check_sensor_health, latest_health, sensor_health_loop
+from .hot import HOT_UPDATE, hot_loop, hot_score
+from .idempotency import run_idempotent
+from .indexes import ensure_indexes
+from .invalidation import cache_bus
+from .latest import latest_per_sensor as latest_readings
+from .loader import DocLoader, get_loader
+from .search import decode_cursor, encode_cursor, highlight, query_terms
 from .models import UserReportCreate
+from .nowcast import get_forecast, nowcast_loop
+from .ratelimit import rate_limit, rate_limiter
+from .reading_feed import reading_feed
+from .resample import FFILL_LIMIT, fill_policy, from_ms, grid_window, resample_readings, to_ms
+from .ring_buffer import reading_ring
+from .singleflight import SingleFlight
+from .tiles import MAX_ZOOM as TILE_MAX_ZOOM
+from .tiles import tile_index
+from .write_behind import write_behind
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Indexes and the in-memory caches load concurrently: startup takes
+    # as long as the slowest of them, not the sum
+    await asyncio.gather(ensure_indexes(), tile_index.warm(), reading_ring.warm())
+
+    # In-memory map tiles, kept current from the readings feed
+    reading_feed.subscribe(tile_index.apply_readings)
+
+    # Recent readings per sensor, so chart windows skip Mongo
+    reading_feed.subscribe(reading_ring.apply_readings)
+
+    # Writes on any worker invalidate the caches of every worker
+    cache_bus.subscribe("sensor", _on_sensor_changed)
+    cache_bus.subscribe("user_report", _on_feed_changed)
+    cache_bus.subscribe("like", _on_likes_changed)
+    cache_bus.subscribe("report", report_pages.invalidate)
+
+    # Optional batched report/like writes (WRITE_BEHIND_ENABLED=1)
+    write_behind.on_flushed.append(_publish_flushed)
+    await write_behind.start()
+
+    # Background jobs, cancelled on shutdown
+    tasks = [
+        asyncio.create_task(nowcast_loop()),
+        asyncio.create_task(sensor_health_loop()),
+        asyncio.create_task(reading_feed.run()),
+        asyncio.create_task(reading_ring.rewarm_loop()),
+        asyncio.create_task(cache_bus.run()),
+        asyncio.create_task(cleanup_loop()),
+        asyncio.create_task(hot_loop()),
+    ]
+    try:
+        yield
+    finally:
+        # acknowledged writes go to Mongo before anything else stops
+        await write_behind.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Routes are registered here and mounted by create_app() at the bottom
+router = APIRouter()
+
+# Short micro-cache for /sensors/{id}/readings, see app/singleflight.py
+READINGS_CACHE_TTL = float(os.getenv("READINGS_CACHE_TTL", "2"))
+readings_flight = SingleFlight(ttl=READINGS_CACHE_TTL)
+
+# User-independent parts of GET /dashboard
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "5"))
+dashboard_flight = SingleFlight(ttl=DASHBOARD_CACHE_TTL)
+
+
+async def _on_sensor_changed(key: Optional[str]):
+    """
+    Cache bus: a sensor was created, updated or deleted (key = its id),
+    or None if anything may have changed.
+    """
+    readings_flight.invalidate()
+    dashboard_flight.invalidate()
+
+    if key is None:
+        await tile_index.warm()
+        return
+
+    sid = ObjectId(key)
+    doc = await db.sensors.find_one({"_id": sid})
+    if doc is None:
+        tile_index.remove_sensor(sid)
+        reading_ring.remove_sensor(sid)
+    else:
+        tile_index.set_sensor(doc)
+
+
+def _on_feed_changed(key: Optional[str]):
+    """
+    Cache bus: a user report was created, edited or deleted.
+    """
+    dashboard_flight.invalidate()
+    user_report_pages.invalidate(key)
+
+
+async def _on_likes_changed(key: Optional[str]):
+    """
+    Cache bus: user reports were liked or unliked (key = their ids).
+    """
+    dashboard_flight.invalidate()
+    await user_report_pages.refresh_likes(key, _fetch_likes)
+
+
+async def _fetch_likes(ids: list[str]) -> list[dict]:
+    docs = await db.user_reports.find(
+        {"_id": {"$in": [ObjectId(i) for i in ids]}}, {"likes": 1, "liked_by": 1, "hot": 1}
+    ).to_list(length=None)
+    return [
+        {
+            "id": str(doc["_id"]),
+            "likes": int(doc.get("likes") or 0),
+            "liked_by": {str(x) for x in doc.get("liked_by") or [] if isinstance(x, ObjectId)},
+            "hot": doc.get("hot"),
+        }
+        for doc in docs
+    ]
+
+
+async def _publish_flushed(reports: list[dict], liked_ids: list[ObjectId]):
+    """
+    Write-behind batch landed: one event for its new reports, one for its likes.
+    """
+    if reports:
+        stamps = [to_ms(doc["timestamp"]) for doc in reports]
+        await cache_bus.publish("user_report", f"@{min(stamps)}~{max(stamps)}")
+    if liked_ids:
+        await cache_bus.publish("like", ",".join(sorted({str(rid) for rid in liked_ids})))
+
+
+def encode_json(payload) -> bytes:
+    """
+    Encode a response body once (same output as FastAPI's default
+    JSONResponse) so cached results can be sent as-is.
+    """
+    return JSONResponse(jsonable_encoder(payload)).body
 
-app = FastAPI()
+
+# Encoded pages of GET /user-reports and GET /reports, see app/feed_cache.py
+FEED_MAX_LIMIT = 500
+user_report_pages = FeedCache(encode_json)
+report_pages = FeedCache(encode_json)
+
+
+def _feed_after(cursor: Optional[str]) -> Optional[tuple[float, ObjectId]]:
+    """
+    Parse a feed `cursor` (sort key and _id of the last report seen).
+    """
+    if cursor is None:
+        return None
+    after = decode_cursor(cursor)
+    if after is None:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+def _feed_query(after: Optional[tuple[float, ObjectId]], field: str = "timestamp") -> dict:
+    """
+    Keyset condition for the page after `after`, in (field, _id) desc order.
+    """
+    if after is None:
+        return {}
+    key = from_ms(int(after[0])) if field == "timestamp" else after[0]
+    return {"$or": [
+        {field: {"$lt": key}},
+        {field: key, "_id": {"$lt": after[1]}},
+    ]}
 
 class CheckoutItem(BaseModel):
     name: str
@@ -22,12 +213,14 @@ class CheckoutItem(BaseModel):
 class CheckoutPayload(BaseModel):
     items: List[CheckoutItem]
 
-@app.post("/create-checkout-session")
+@router.post("/create-checkout-session")
 async def create_checkout_session(payload: CheckoutPayload):
     # For now: just log and return a fake URL
     print("CHECKOUT PAYLOAD:", payload)
 
-    # Later you plug Stripe here. For now this must be valid JSON:
+    # Later you plug Stripe here, imported inside this handler (`import
+    # stripe`) so workers don't pay for it at startup. For now this must be
+    # valid JSON:
     return {"url": "https://example.com"}
 
 origins = [
@@ -35,20 +228,12 @@ origins = [
     "http://127.0.0.1:5173",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],        # only your frontend dev origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.get("/")
+@router.get("/")
 def read_root():
     return {"message": "River & Farm Guardian backend is running"}
 
 
-@app.get("/health")
+@router.get("/health")
 def health_check():
     return {"status": "ok"}
 
@@ -160,6 +345,7 @@ class SensorCreate(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     is_active: bool = True
+    expected_interval_minutes: Optional[int] = None  # reporting interval, for stale checks
 
 
 class SensorUpdate(BaseModel):
@@ -170,6 +356,7 @@ class SensorUpdate(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     is_active: Optional[bool] = None
+    expected_interval_minutes: Optional[int] = None
 
 class ReportUpdate(BaseModel):
     category: Optional[str] = None
@@ -190,7 +377,7 @@ class ReportCreate(BaseModel):
     comment: Optional[str] = None         # “heavy rain, fast current”, etc.
 
 
-@app.post("/sensors")
+@router.post("/sensors")
 async def create_sensor(sensor: SensorCreate):
     sensor_dict = sensor.model_dump()
 
@@ -198,9 +385,10 @@ async def create_sensor(sensor: SensorCreate):
     sensor_dict["type"] = normalize_category(sensor_dict["type"])
 
     result = await db.sensors.insert_one(sensor_dict)
+    await cache_bus.publish("sensor", str(result.inserted_id))
     return {"id": str(result.inserted_id)}
 
-@app.get("/sensors")
+@router.get("/sensors")
 async def list_sensors():
     sensors = []
     cursor = db.sensors.find()
@@ -212,7 +400,31 @@ async def list_sensors():
 
     return {"sensors": sensors}
 
-@app.get("/sensors/{sensor_id}")
+@router.get("/sensors/health")
+async def get_sensors_health(status: Optional[str] = None):
+    """
+    Status of every active sensor: ok / stale / no_data, last reading time
+    and seconds since. Served from the background check (app/health.py);
+    runs a check inline if the last one is too old.
+    """
+    checked_at = latest_health["checked_at"]
+    if checked_at is None or (
+        datetime.utcnow() - checked_at
+    ).total_seconds() > 2 * SENSOR_HEALTH_INTERVAL_SECONDS:
+        await check_sensor_health()
+
+    sensors = latest_health["sensors"]
+    if status:
+        sensors = [s for s in sensors if s["status"] == status]
+
+    counts: dict = {}
+    for s in latest_health["sensors"]:
+        counts[s["status"]] = counts.get(s["status"], 0) + 1
+
+    return {"checked_at": latest_health["checked_at"], "counts": counts, "sensors": sensors}
+
+
+@router.get("/sensors/{sensor_id}")
 async def get_sensor(sensor_id: str):
     try:
         sid = ObjectId(sensor_id)
@@ -223,11 +435,16 @@ async def get_sensor(sensor_id: str):
     if not doc:
         raise HTTPException(status_code=404, detail="Sensor not found")
 
+    # Denormalised counters (see app/counters.py)
+    doc["report_count"] = int(doc.get("report_count") or 0)
+    doc["location_report_count"] = await get_location_report_count(doc.get("location"))
+    doc.pop("counters_run", None)
+
     doc["id"] = str(doc["_id"])
     del doc["_id"]
     return doc
 
-@app.patch("/sensors/{sensor_id}")
+@router.patch("/sensors/{sensor_id}")
 async def update_sensor(sensor_id: str, payload: SensorUpdate):
     try:
         sid = ObjectId(sensor_id)
@@ -257,6 +474,9 @@ async def update_sensor(sensor_id: str, payload: SensorUpdate):
     if payload.is_active is not None:
         updates["is_active"] = payload.is_active
 
+    if payload.expected_interval_minutes is not None:
+        updates["expected_interval_minutes"] = payload.expected_interval_minutes
+
     if not updates:
         raise HTTPException(status_code=400, detail="No fields to update")
 
@@ -265,12 +485,14 @@ async def update_sensor(sensor_id: str, payload: SensorUpdate):
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Sensor not found")
 
+    await cache_bus.publish("sensor", str(sid))
+
     doc = await db.sensors.find_one({"_id": sid})
     doc["id"] = str(doc["_id"])
     del doc["_id"]
     return doc
 
-@app.delete("/sensors/{sensor_id}")
+@router.delete("/sensors/{sensor_id}")
 async def delete_sensor(sensor_id: str):
     try:
         sid = ObjectId(sensor_id)
@@ -282,9 +504,10 @@ async def delete_sensor(sensor_id: str):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Sensor not found")
 
+    await cache_bus.publish("sensor", str(sid))
     return {"id": sensor_id, "deleted": True}
 
-@app.post("/users")
+@router.post("/users")
 async def create_user(user: UserCreate):
     # Convert Pydantic model to dict
     user_dict = user.model_dump()
@@ -296,7 +519,7 @@ async def create_user(user: UserCreate):
     return {"id": str(result.inserted_id)}
 
 
-@app.get("/users")
+@router.get("/users")
 async def list_users():
     users = []
     cursor = db.users.find()
@@ -309,7 +532,7 @@ async def list_users():
 
     return {"users": users}
 
-@app.patch("/users/{user_id}")
+@router.patch("/users/{user_id}")
 async def update_user(user_id: str, payload: UserUpdate):
     # 1. Validate ID
     try:
@@ -333,6 +556,7 @@ async def update_user(user_id: str, payload: UserUpdate):
                 detail=f"Invalid plan. Allowed plans: {ALLOWED_PLANS}",
             )
         updates["plan"] = payload.plan
+        rate_limiter.forget_plan(user_id)
 
     if not updates:
         raise HTTPException(status_code=400, detail="No fields to update")
@@ -349,7 +573,7 @@ async def update_user(user_id: str, payload: UserUpdate):
     del doc["_id"]
     return doc
 
-@app.patch("/users/{user_id}/plan")
+@router.patch("/users/{user_id}/plan")
 async def update_user_plan(user_id: str, payload: UserUpdatePlan):
     # 1. Validate requested plan
     if payload.plan not in ALLOWED_PLANS:
@@ -373,10 +597,12 @@ async def update_user_plan(user_id: str, payload: UserUpdatePlan):
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
 
+    rate_limiter.forget_plan(user_id)
+
     # 4. Option: return updated plan or simple success
     return {"id": user_id, "new_plan": payload.plan}
 
-@app.get("/users/{user_id}")
+@router.get("/users/{user_id}")
 async def get_user(user_id: str):
     # 1. Validate & convert ID to ObjectId
     try:
@@ -389,16 +615,21 @@ async def get_user(user_id: str):
     if not doc:
         raise HTTPException(status_code=404, detail="User not found")
 
+    # Denormalised counters (see app/counters.py)
+    doc["report_count"] = int(doc.get("report_count") or 0)
+    doc["likes_received"] = int(doc.get("likes_received") or 0)
+    doc.pop("counters_run", None)
+
     # 3. Convert _id to id string and return
     doc["id"] = str(doc["_id"])
     del doc["_id"]
     return doc
 
-@app.delete("/users/{user_id}")
+@router.delete("/users/{user_id}")
 async def delete_user(user_id: str):
     """
-    Delete a user by ID.
-    Optionally also delete their user_reports so we don't leave orphans.
+    Delete a user by ID. Their reports and likes are cleaned up by a
+    background job (app/cleanup.py); follow it on GET /cleanup-jobs/{id}.
     """
     # 1) Validate ObjectId
     try:
@@ -414,21 +645,52 @@ async def delete_user(user_id: str):
     # 3) Delete the user
     await db.users.delete_one({"_id": oid})
 
-    # 4) Optional: clean up that user's reports
-    await db.user_reports.delete_many({"user_id": oid})
+    # 4) Reports and likes are removed in the background, in batches
+    job_id = await enqueue_user_cleanup(oid)
+
+    return {"id": user_id, "deleted": True, "cleanup_job_id": str(job_id)}
+
+
+@router.get("/cleanup-jobs/{job_id}")
+async def get_cleanup_job(job_id: str):
+    try:
+        jid = ObjectId(job_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid job ID format")
+
+    job = await get_job(jid)
+    if not job:
+        raise HTTPException(status_code=404, detail="Cleanup job not found")
 
-    return {"id": user_id, "deleted": True}
+    job["id"] = str(job["_id"])
+    job["user_id"] = str(job["user_id"])
+    del job["_id"]
+    return job
 
 
-@app.post("/reports")
-async def create_report(report: ReportCreate):
+@router.post("/reports")
+async def create_report(
+    report: ReportCreate,
+    idempotency_key: Optional[str] = Header(default=None),
+    loader: DocLoader = Depends(get_loader),
+):
+    # Retried POSTs with the same Idempotency-Key return the first response
+    return await run_idempotent(
+        "reports",
+        idempotency_key,
+        report.model_dump(mode="json"),
+        lambda doc_id: _insert_report(report, loader, doc_id),
+    )
+
+
+async def _insert_report(report: ReportCreate, loader: DocLoader, doc_id: Optional[ObjectId] = None) -> dict:
     # 1. Validate & convert user_id
     try:
         user_oid = ObjectId(report.user_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
 
-    user = await db.users.find_one({"_id": user_oid})
+    user = await loader.load("users", user_oid)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -445,99 +707,47 @@ async def create_report(report: ReportCreate):
     if report_dict["timestamp"] is None:
         report_dict["timestamp"] = datetime.utcnow()
 
-    # 6. Save
-    result = await db.reports.insert_one(report_dict)
+    # 6. Save (with an Idempotency-Key the _id comes from the key, so a
+    #    rerun finds what an earlier run already wrote)
+    if doc_id is not None:
+        report_dict["_id"] = doc_id
+    try:
+        result = await db.reports.insert_one(report_dict)
+    except DuplicateKeyError:
+        if doc_id is None:
+            raise
+        return {"id": str(doc_id)}
+    await cache_bus.publish("report", f"{result.inserted_id}@{to_ms(report_dict['timestamp'])}")
     return {"id": str(result.inserted_id)}
 
-@app.get("/reports")
-async def list_reports(limit: int = 50):
-    reports = []
-
-    cursor = db.reports.find().sort("timestamp", -1).limit(limit)
-
-    async for doc in cursor:
-        doc["id"] = str(doc["_id"])
-        doc["user_id"] = str(doc["user_id"])
-        del doc["_id"]
-        reports.append(doc)
-
-    return {"reports": reports}
-
-@app.patch("/user-reports/{report_id}")
-async def update_user_report(report_id: str, payload: UserReportUpdate):
+@router.get("/reports")
+async def list_reports(limit: int = 50, cursor: Optional[str] = None):
     """
-    Update fields of a user report, but only if the requesting user_id
-    matches the report's user_id.
+    Newest reports first. Pass `next_cursor` as `cursor` for the next page.
     """
-    # 1) Validate ids
-    try:
-        rid = ObjectId(report_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid report ID format")
-
-    try:
-        uid = ObjectId(payload.user_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid user ID format")
-
-    # 2) Fetch existing report
-    existing = await db.user_reports.find_one({"_id": rid})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Report not found")
-
-    if existing.get("user_id") != uid:
-        raise HTTPException(
-            status_code=403,
-            detail="You can only edit your own reports.",
-        )
-
-    # 3) Build updates
-    updates: dict = {}
-    if payload.value is not None:
-        updates["value"] = payload.value
-    if payload.comment is not None:
-        updates["comment"] = payload.comment
-    if payload.timestamp is not None:
-        updates["timestamp"] = payload.timestamp
-    # ⭐ allow changing type (rain / water_level / temperature)
-    if payload.type is not None:
-        updates["type"] = normalize_category(payload.type)
-
-    # ⭐ allow changing station (sensor)
-    if payload.sensor_id is not None:
-        try:
-            new_sid = ObjectId(payload.sensor_id)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid sensor ID format")
-
-        sensor = await db.sensors.find_one({"_id": new_sid})
-        if not sensor:
-            raise HTTPException(status_code=404, detail="Sensor not found")
-        
-        # update sensor fields together
-        updates["sensor_id"] = new_sid
-        updates["sensor_name"] = sensor.get("name")
-        updates["location"] = sensor.get("location")
-        if sensor.get("unit"):
-            updates["unit"] = sensor["unit"]   # keep unit in sync with station
-
-    if not updates:
-        raise HTTPException(status_code=400, detail="No fields to update")
-
-    # 4) Apply and return updated doc
-    await db.user_reports.update_one({"_id": rid}, {"$set": updates})
-
-    doc = await db.user_reports.find_one({"_id": rid})
-    doc["id"] = str(doc["_id"])
-    doc["sensor_id"] = str(doc["sensor_id"])
-    doc["user_id"] = str(doc["user_id"])
-    doc["source"] = doc.get("source", "User")
-    del doc["_id"]
-    return doc
-
-
-
-@app.get("/reports/{report_id}")
+    limit = max(1, min(limit, FEED_MAX_LIMIT))
+    after = _feed_after(cursor)
+
+    async def load() -> FeedPage:
+        docs = await db.reports.find(_feed_query(after)).sort(
+            [("timestamp", -1), ("_id", -1)]
+        ).limit(limit + 1).to_list(length=None)
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+
+        next_cursor = encode_cursor(to_ms(docs[-1]["timestamp"]), docs[-1]["_id"]) if has_more else None
+        stamps = [to_ms(doc["timestamp"]) for doc in docs]
+        for doc in docs:
+            doc["id"] = str(doc["_id"])
+            doc["user_id"] = str(doc["user_id"])
+            del doc["_id"]
+        upper = int(after[0]) if after else None
+        return FeedPage(docs, None, stamps, upper, next_cursor, encode_json)
+
+    page = await report_pages.get((limit, cursor), load)
+    return Response(content=page.body, media_type="application/json")
+
+@router.get("/reports/{report_id}")
 async def get_report(report_id: str):
     # 1. Validate ID format
     try:
@@ -559,25 +769,40 @@ async def get_report(report_id: str):
 
 # --- USER REPORTS CRUD + LIKES --------------------------------------------
 
-@app.post("/user-reports")
-async def create_user_report(report: UserReportCreate):
-    # 1. Validate & convert user_id
+@router.post("/user-reports")
+async def create_user_report(
+    report: UserReportCreate,
+    idempotency_key: Optional[str] = Header(default=None),
+    loader: DocLoader = Depends(get_loader),
+):
+    # Retried POSTs with the same Idempotency-Key return the first response
+    return await run_idempotent(
+        "user-reports",
+        idempotency_key,
+        report.model_dump(mode="json"),
+        lambda doc_id: _insert_user_report(report, loader, doc_id),
+    )
+
+
+async def _insert_user_report(report: UserReportCreate, loader: DocLoader, doc_id: Optional[ObjectId] = None) -> dict:
+    # 1. Validate & convert user_id and sensor_id
     try:
         user_oid = ObjectId(report.user_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
 
-    user = await db.users.find_one({"_id": user_oid})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # 2. Validate & convert sensor_id
     try:
         sensor_oid = ObjectId(report.sensor_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid sensor ID format")
 
-    sensor = await db.sensors.find_one({"_id": sensor_oid})
+    # 2. Look both up concurrently
+    user, sensor = await asyncio.gather(
+        loader.load("users", user_oid),
+        loader.load("sensors", sensor_oid),
+    )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     if not sensor:
         raise HTTPException(status_code=404, detail="Sensor not found")
 
@@ -603,22 +828,111 @@ async def create_user_report(report: UserReportCreate):
         "comment": report.comment or "",
         "likes": 0,
         "liked_by": [],   # list of ObjectIds
+        "hot": hot_score(0, ts),   # sort=hot, see app/hot.py
     }
 
-    result = await db.user_reports.insert_one(doc)
+    # With an Idempotency-Key the _id comes from the key, so a rerun finds
+    # what an earlier run already wrote (or queued)
+    if doc_id is not None:
+        doc["_id"] = doc_id
+
+    # Write-behind: acknowledge now, insert with the next batch
+    if write_behind.enabled:
+        if doc_id is not None and (
+            doc_id in write_behind.pending_reports
+            or await db.user_reports.find_one({"_id": doc_id}, {"_id": 1})
+        ):
+            return {"id": str(doc_id)}
+        doc.setdefault("_id", ObjectId())
+        await write_behind.submit_report(doc)
+        return {"id": str(doc["_id"])}
+
+    try:
+        result = await db.user_reports.insert_one(doc)
+    except DuplicateKeyError:
+        if doc_id is None:
+            raise
+        return {"id": str(doc_id)}
+    await on_report_created(user_oid, sensor_oid, sensor.get("location"))
+    await cache_bus.publish("user_report", f"{result.inserted_id}@{to_ms(ts)}")
     return {"id": str(result.inserted_id)}
 
 
-@app.get("/user-reports")
-async def list_user_reports(
-    limit: int = 100,
-    current_user_id: str | None = None,
+async def _load_feed_page(
+    limit: int,
+    loader: DocLoader,
+    after: Optional[tuple[float, ObjectId]] = None,
+    sort: str = "new",
+) -> tuple[list[dict], dict]:
+    """
+    Newest (or, with sort="hot", highest scored) user reports after the
+    `after` cursor, plus {user_id: name} for their authors (one $in query
+    for the whole page). Both orders are index scans.
+    """
+    field = "hot" if sort == "hot" else "timestamp"
+    docs = await db.user_reports.find(_feed_query(after, field)).sort(
+        [(field, -1), ("_id", -1)]
+    ).limit(limit).to_list(length=None)
+
+    user_ids = {d.get("user_id") for d in docs if isinstance(d.get("user_id"), ObjectId)}
+    users = await loader.load_many("users", user_ids)
+    user_names = {u["_id"]: u.get("name") for u in users if u}
+    return docs, user_names
+
+
+def shape_user_report(doc: dict, user_names: dict, current_oid: ObjectId | None) -> dict:
+    """
+    Shape a user_reports document for the frontend (in place).
+    """
+    user_name = user_names.get(doc.get("user_id"))
+
+    # --- likes info ---
+    likes = int(doc.get("likes") or 0)
+    liked_by = doc.get("liked_by") or []
+    if not isinstance(liked_by, list):
+        liked_by = []
+
+    liked_by_me = False
+    if current_oid is not None:
+        liked_by_me = any(
+            isinstance(x, ObjectId) and x == current_oid for x in liked_by
+        )
+
+    # --- shape the document for frontend ---
+    doc["id"] = str(doc["_id"])
+    doc["sensor_id"] = str(doc["sensor_id"])
+    doc["user_id"] = str(doc["user_id"])
+
+    doc["source"] = doc.get("source") or user_name or "User"
+    doc["likes"] = likes
+    doc["liked_by_me"] = liked_by_me
+
+    # do NOT send raw ObjectId list (or the internal ranking score)
+    if "liked_by" in doc:
+        del doc["liked_by"]
+    doc.pop("hot", None)
+    del doc["_id"]
+
+    return doc
+
+
+@router.get("/user-reports/search")
+async def search_user_reports(
+    q: str,
+    location: Optional[str] = None,
+    type: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    current_user_id: Optional[str] = None,
 ):
     """
-    Return user-made reports, always including a 'source' field.
-    If current_user_id is provided, also include `liked_by_me` per report.
+    Full-text search over community reports, best match first.
+    Pass `next_cursor` from the previous page as `cursor` for the next one.
     """
-    # Try to parse the current user ID (for liked_by_me)
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q is required")
+    limit = max(1, min(limit, 100))
+
     current_oid: ObjectId | None = None
     if current_user_id:
         try:
@@ -626,60 +940,114 @@ async def list_user_reports(
         except Exception:
             current_oid = None
 
-    reports = []
-    cursor = db.user_reports.find().sort("timestamp", -1).limit(limit)
-
-    async for doc in cursor:
-        # --- resolve user name for `source` ---
-        user_name = None
-        user_id = doc.get("user_id")
-        if isinstance(user_id, ObjectId):
-            user_doc = await db.users.find_one({"_id": user_id}, {"name": 1})
-            if user_doc:
-                user_name = user_doc.get("name")
-
-        # --- likes info ---
-        likes = int(doc.get("likes") or 0)
-        liked_by = doc.get("liked_by") or []
-        if not isinstance(liked_by, list):
-            liked_by = []
-
-        liked_by_me = False
-        if current_oid is not None:
-            liked_by_me = any(
-                isinstance(x, ObjectId) and x == current_oid for x in liked_by
-            )
-
-        # --- shape the document for frontend ---
+    # 1. Text match + optional filters
+    match: dict = {"$text": {"$search": q}}
+    if location:
+        match["location"] = location
+    if type:
+        match["type"] = normalize_category(type)
+
+    pipeline: list[dict] = [
+        {"$match": match},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+
+    # 2. Keyset pagination on (score desc, _id desc)
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        score, last_id = after
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "_id": {"$lt": last_id}},
+        ]}})
+
+    pipeline += [
+        {"$sort": {"score": -1, "_id": -1}},
+        {"$limit": limit + 1},
+    ]
+
+    docs = await db.user_reports.aggregate(pipeline).to_list(length=None)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    # 3. Shape like list_user_reports, plus score and snippet
+    terms = query_terms(q)
+    next_cursor = encode_cursor(docs[-1]["score"], docs[-1]["_id"]) if has_more else None
+
+    results = []
+    for doc in docs:
+        liked_by = doc.pop("liked_by", None) or []
         doc["id"] = str(doc["_id"])
         doc["sensor_id"] = str(doc["sensor_id"])
         doc["user_id"] = str(doc["user_id"])
-
-        doc["source"] = doc.get("source") or user_name or "User"
-        doc["likes"] = likes
-        doc["liked_by_me"] = liked_by_me
-
-        # do NOT send raw ObjectId list
-        if "liked_by" in doc:
-            del doc["liked_by"]
+        doc["source"] = doc.get("source") or "User"
+        doc["likes"] = int(doc.get("likes") or 0)
+        doc["liked_by_me"] = current_oid is not None and current_oid in liked_by
+        doc["score"] = round(doc["score"], 4)
+        doc["snippet"] = highlight(doc.get("comment") or "", terms)
+        doc.pop("hot", None)
         del doc["_id"]
+        results.append(doc)
 
-        reports.append(doc)
-
-    return {"reports": reports}
-
-
-class UserReportUpdate(BaseModel):
-    user_id: str
-    value: float | None = None
-    comment: str | None = None
-    timestamp: datetime | None = None
-    type: str | None = None
-    sensor_id: str | None = None
+    return {"reports": results, "next_cursor": next_cursor}
 
 
-@app.patch("/user-reports/{report_id}")
-async def update_user_report(report_id: str, payload: UserReportUpdate):
+@router.get("/user-reports")
+async def list_user_reports(
+    limit: int = 100,
+    current_user_id: str | None = None,
+    cursor: Optional[str] = None,
+    sort: str = "new",
+    loader: DocLoader = Depends(get_loader),
+):
+    """
+    Return user-made reports, always including a 'source' field.
+    If current_user_id is provided, also include `liked_by_me` per report.
+    sort: "new" (newest first) or "hot" (likes decayed by age, app/hot.py).
+    Pass `next_cursor` as `cursor` for the next page.
+    """
+    if sort not in ("new", "hot"):
+        raise HTTPException(status_code=400, detail="sort must be 'new' or 'hot'")
+    limit = max(1, min(limit, FEED_MAX_LIMIT))
+    after = _feed_after(cursor)
+
+    # 1. Shared page, the same for every user
+    async def load() -> FeedPage:
+        docs, user_names = await _load_feed_page(limit + 1, loader, after, sort)
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+
+        if sort == "hot":
+            keys = [float(doc.get("hot") or 0.0) for doc in docs]
+        else:
+            keys = [to_ms(doc["timestamp"]) for doc in docs]
+        next_cursor = encode_cursor(keys[-1], docs[-1]["_id"]) if has_more else None
+        liked_by = [
+            {str(x) for x in doc.get("liked_by") or [] if isinstance(x, ObjectId)}
+            for doc in docs
+        ]
+        reports = []
+        for doc in docs:
+            report = shape_user_report(doc, user_names, None)
+            del report["liked_by_me"]
+            reports.append(report)
+        upper = after[0] if after else None
+        return FeedPage(reports, liked_by, keys, upper, next_cursor, encode_json, sort)
+
+    page = await user_report_pages.get((sort, limit, cursor), load)
+
+    # 2. liked_by_me for this user, spliced into the encoded page
+    return Response(content=page.render(current_user_id or None), media_type="application/json")
+
+
+@router.patch("/user-reports/{report_id}")
+async def update_user_report(
+    report_id: str,
+    payload: UserReportUpdate,
+    loader: DocLoader = Depends(get_loader),
+):
     """
     Update fields of a user report, but only if the requesting user_id
     matches the report's user_id.
@@ -695,8 +1063,18 @@ async def update_user_report(report_id: str, payload: UserReportUpdate):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
 
-    # 2) Fetch existing
-    existing = await db.user_reports.find_one({"_id": rid})
+    new_sid = None
+    if payload.sensor_id is not None:
+        try:
+            new_sid = ObjectId(payload.sensor_id)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid sensor ID format")
+
+    # 2) Fetch existing report and the new station concurrently
+    existing, sensor = await asyncio.gather(
+        loader.load("user_reports", rid),
+        loader.load("sensors", new_sid) if new_sid is not None else asyncio.sleep(0),
+    )
     if not existing:
         raise HTTPException(status_code=404, detail="Report not found")
 
@@ -716,13 +1094,7 @@ async def update_user_report(report_id: str, payload: UserReportUpdate):
         updates["timestamp"] = payload.timestamp
     if payload.type is not None:
         updates["type"] = normalize_category(payload.type)
-    if payload.sensor_id is not None:
-        try:
-            new_sid = ObjectId(payload.sensor_id)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid sensor ID format")
-
-        sensor = await db.sensors.find_one({"_id": new_sid})
+    if new_sid is not None:
         if not sensor:
             raise HTTPException(status_code=404, detail="Sensor not found")
 
@@ -730,14 +1102,30 @@ async def update_user_report(report_id: str, payload: UserReportUpdate):
         updates["sensor_name"] = sensor.get("name")
         updates["location"] = sensor.get("location")
         if sensor.get("unit"):
-          updates["unit"] = sensor["unit"]
+            updates["unit"] = sensor["unit"]
 
     if not updates:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    await db.user_reports.update_one({"_id": rid}, {"$set": updates})
+    # 4) Apply and get the updated doc back in the same round trip
+    doc = await db.user_reports.find_one_and_update(
+        {"_id": rid},
+        {"$set": updates},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Report not found")
+    loader.forget("user_reports", rid)
+
+    if new_sid is not None:
+        await on_report_moved(existing, new_sid, sensor.get("location"))
+    # a new timestamp moves the report to another page (and rescores it)
+    moved_to = ""
+    if "timestamp" in updates:
+        await db.user_reports.update_one({"_id": rid}, HOT_UPDATE)
+        moved_to = f"@{to_ms(doc['timestamp'])}"
+    await cache_bus.publish("user_report", f"{rid}{moved_to}")
 
-    doc = await db.user_reports.find_one({"_id": rid})
     # re-shape like in list_user_reports
     likes = int(doc.get("likes") or 0)
     liked_by = doc.get("liked_by") or []
@@ -755,11 +1143,12 @@ async def update_user_report(report_id: str, payload: UserReportUpdate):
     doc["likes"] = likes
     doc["liked_by_me"] = liked_by_me
     del doc["_id"]
-    del doc["liked_by"]
+    doc.pop("liked_by", None)
+    doc.pop("hot", None)
     return doc
 
 
-@app.delete("/user-reports/{report_id}")
+@router.delete("/user-reports/{report_id}")
 async def delete_user_report(report_id: str, user_id: str):
     """
     Delete a single user report by its Mongo _id, but only if it belongs
@@ -792,6 +1181,9 @@ async def delete_user_report(report_id: str, user_id: str):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Report not found")
 
+    await on_report_deleted(doc)
+    await cache_bus.publish("user_report", str(rid))
+
     return {"id": report_id, "deleted": True}
 
 
@@ -799,7 +1191,7 @@ class LikePayload(BaseModel):
   user_id: str
 
 
-@app.post("/user-reports/{report_id}/like")
+@router.post("/user-reports/{report_id}/like")
 async def toggle_like_user_report(report_id: str, payload: LikePayload):
     """
     Toggle a like from a given user on a report.
@@ -815,37 +1207,61 @@ async def toggle_like_user_report(report_id: str, payload: LikePayload):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
 
-    doc = await db.user_reports.find_one({"_id": rid})
-    if not doc:
+    # Write-behind: toggles are folded and written with the next batch
+    if write_behind.enabled:
+        result = await write_behind.toggle_like(rid, uid)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Report not found")
+        likes, liked = result
+        return {"id": report_id, "likes": likes, "liked": liked}
+
+    # Like if not liked yet, otherwise unlike. Each branch is a single
+    # conditional update, so concurrent toggles can't lose a like.
+    projection = {"likes": 1, "user_id": 1}
+    doc = await db.user_reports.find_one_and_update(
+        {"_id": rid, "liked_by": {"$ne": uid}},
+        {"$push": {"liked_by": uid}, "$inc": {"likes": 1}},
+        projection=projection,
+        return_document=ReturnDocument.AFTER,
+    )
+    liked = doc is not None
+
+    if doc is None:
+        doc = await db.user_reports.find_one_and_update(
+            {"_id": rid, "liked_by": uid},
+            {"$pull": {"liked_by": uid}, "$inc": {"likes": -1}},
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+        )
+    if doc is None:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    likes = int(doc.get("likes") or 0)
-    liked_by = doc.get("liked_by") or []
-    if not isinstance(liked_by, list):
-        liked_by = []
-
-    is_liked = any(isinstance(x, ObjectId) and x == uid for x in liked_by)
-
-    if is_liked:
-        # Unlike
-        liked_by = [x for x in liked_by if not (isinstance(x, ObjectId) and x == uid)]
-        likes = max(likes - 1, 0)
-        liked = False
-    else:
-        # Like
-        liked_by.append(uid)
-        likes += 1
-        liked = True
-
-    await db.user_reports.update_one(
-        {"_id": rid},
-        {"$set": {"likes": likes, "liked_by": liked_by}},
-    )
+    await on_like_changed(doc.get("user_id"), 1 if liked else -1)
+    await db.user_reports.update_one({"_id": rid}, HOT_UPDATE)
+    await cache_bus.publish("like", str(rid))
 
-    return {"id": report_id, "likes": likes, "liked": liked}
+    return {"id": report_id, "likes": max(int(doc.get("likes") or 0), 0), "liked": liked}
 
-@app.get("/sensors/{sensor_id}/readings")
-async def get_sensor_readings(sensor_id: str, hours: int = 24):
+@router.get("/sensors/{sensor_id}/readings")
+async def get_sensor_readings(
+    sensor_id: str,
+    hours: int = 24,
+    interval_minutes: Optional[int] = None,
+    since: Optional[str] = None,
+    wait: float = 0,
+):
+    """
+    Readings of one sensor for the last `hours`, oldest first.
+    With interval_minutes, readings are snapped to a regular grid instead
+    (one point per interval, gaps filled per sensor type, see app/resample.py).
+
+    With since (the `cursor` of an earlier response, or a timestamp) only
+    readings after it are returned - on the grid, the intervals from the
+    first new reading on. Readings that arrive late with a timestamp at
+    or before the cursor are not included; re-fetch the full window now
+    and then to pick those up. wait=N long-polls up to N seconds for new
+    data (see app/delta.py).
+    """
     # 1. Validate sensor id
     try:
         sid = ObjectId(sensor_id)
@@ -855,15 +1271,42 @@ async def get_sensor_readings(sensor_id: str, hours: int = 24):
     if hours <= 0:
         raise HTTPException(status_code=400, detail="hours must be positive")
 
-    # 2. (Optional but nice) Check sensor exists
-    sensor = await db.sensors.find_one({"_id": sid})
-    if not sensor:
-        raise HTTPException(status_code=404, detail="Sensor not found")
+    if interval_minutes is not None and interval_minutes <= 0:
+        raise HTTPException(status_code=400, detail="interval_minutes must be positive")
 
-    # 3. Compute time window
-    since = datetime.utcnow() - timedelta(hours=hours)
+    check_wait(wait)
+
+    # Incremental refresh: only what's new since the client's cursor
+    if since is not None:
+        since_ms = parse_since(since)
+        body = await long_poll(
+            readings_flight,
+            ("readings-since", sid, hours, interval_minutes, since_ms),
+            [sid],
+            wait,
+            lambda: _load_sensor_readings_since(sid, hours, interval_minutes, since_ms),
+        )
+        return Response(content=body, media_type="application/json")
+
+    # Identical concurrent requests share one query and one encoded body
+    body = await readings_flight.do(
+        ("readings", sid, hours, interval_minutes),
+        lambda: _load_sensor_readings(sid, hours, interval_minutes),
+    )
+    return Response(content=body, media_type="application/json")
+
+
+async def _fetch_readings_window(sid: ObjectId, sensor: dict, since: datetime) -> list[dict]:
+    """
+    Readings of one sensor since `since`, oldest first, from Mongo and
+    (for windows older than the hot tier) the archive. Recent windows
+    come straight from the in-memory ring (app/ring_buffer.py).
+    """
+    recent = reading_ring.window_docs(sid, sensor, since)
+    if recent is not None:
+        return recent
 
-    # 4. Query readings for this sensor, newest last (for graphs)
+    # Query readings for this sensor, newest last (for graphs)
     readings = []
     cursor = (
         db.sensor_readings.find(
@@ -882,17 +1325,262 @@ async def get_sensor_readings(sensor_id: str, hours: int = 24):
         del doc["_id"]
         readings.append(doc)
 
+    # Window reaches past the hot tier -> prepend archived readings
+    # older than the oldest one still in Mongo
+    if since < hot_tier_start():
+        until = readings[0]["timestamp"] if readings else datetime.utcnow()
+        archived = await asyncio.to_thread(read_archived, sid, since, until)
+        for doc in archived:
+            doc["sensor_name"] = sensor.get("name")
+            doc["location"] = sensor.get("location")
+            doc["type"] = sensor.get("type")
+            doc["unit"] = sensor.get("unit")
+        readings = archived + readings
+
+    return readings
+
+
+async def _load_sensor_readings(sid: ObjectId, hours: int, interval_minutes: Optional[int]) -> bytes:
+    # 2. (Optional but nice) Check sensor exists
+    sensor = await db.sensors.find_one({"_id": sid})
+    if not sensor:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+
+    # 3. Compute time window
+    now = datetime.utcnow()
+    since = now - timedelta(hours=hours)
+
+    # 4. Readings for this sensor (hot tier + archive)
+    readings = await _fetch_readings_window(sid, sensor, since)
+
+    payload = _readings_header(sid, sensor, hours)
+    # where to continue from with ?since=
+    payload["cursor"] = str(to_ms(readings[-1]["timestamp"] if readings else since))
+
+    # 5. Optional: one point per interval instead of raw readings
+    if interval_minutes:
+        step_ms = interval_minutes * 60 * 1000
+        start_ms, n = grid_window(since, now, step_ms)
+        payload["interval_minutes"] = interval_minutes
+        payload["fill"] = fill_policy(sensor.get("type"))
+        readings = resample_readings(readings, sensor.get("type"), start_ms, step_ms, n)
+
+    payload["readings"] = readings
+    return encode_json(payload)
+
+
+def _readings_header(sid: ObjectId, sensor: dict, hours: int) -> dict:
+    return {
+        "sensor_id": str(sid),
+        "sensor_name": sensor.get("name"),
+        "location": sensor.get("location"),
+        "type": sensor.get("type"),
+        "unit": sensor.get("unit"),
+        "hours": hours,
+    }
+
+
+def _delta_context_ms(after_ms: int, grid_start_ms: int, step_ms: int) -> tuple[int, int]:
+    """
+    (first_bin_ms, context_ms) for a grid delta: the interval holding the
+    first new reading, and a few intervals before it so gap filling at
+    the edge has readings to work from.
+    """
+    first_bin_ms = after_ms // step_ms * step_ms
+    return first_bin_ms, max(first_bin_ms - FFILL_LIMIT * step_ms, grid_start_ms)
+
+
+async def _load_sensor_readings_since(
+    sid: ObjectId,
+    hours: int,
+    interval_minutes: Optional[int],
+    since_ms: int,
+) -> tuple[bytes, int]:
+    """
+    Delta for get_sensor_readings: (encoded body, number of new readings).
+    """
+    sensor = await db.sensors.find_one({"_id": sid})
+    if not sensor:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+
+    now = datetime.utcnow()
+    window_start = now - timedelta(hours=hours)
+    after_ms = max(since_ms + 1, to_ms(window_start))
+
+    payload = _readings_header(sid, sensor, hours)
+    payload["since"] = str(since_ms)
+
+    # Raw readings: exactly the new ones
+    if not interval_minutes:
+        readings = await _fetch_readings_window(sid, sensor, from_ms(after_ms))
+        payload["cursor"] = str(to_ms(readings[-1]["timestamp"])) if readings else str(since_ms)
+        payload["readings"] = readings
+        return encode_json(payload), len(readings)
+
+    # Grid: the intervals from the first new reading on
+    step_ms = interval_minutes * 60 * 1000
+    grid_start_ms, _ = grid_window(window_start, now, step_ms)
+    first_bin_ms, context_ms = _delta_context_ms(after_ms, grid_start_ms, step_ms)
+
+    readings = await _fetch_readings_window(sid, sensor, from_ms(context_ms))
+    new = [r for r in readings if to_ms(r["timestamp"]) >= after_ms]
+
+    points = []
+    if new:
+        start_ms, n = grid_window(from_ms(context_ms), now, step_ms)
+        points = resample_readings(readings, sensor.get("type"), start_ms, step_ms, n)
+        points = points[(first_bin_ms - start_ms) // step_ms:]
+
+    payload["interval_minutes"] = interval_minutes
+    payload["fill"] = fill_policy(sensor.get("type"))
+    payload["cursor"] = str(to_ms(new[-1]["timestamp"])) if new else str(since_ms)
+    payload["readings"] = points
+    return encode_json(payload), len(new)
+
+
+@router.get("/sensor-readings/series")
+async def get_aligned_sensor_series(
+    sensor_ids: str,
+    hours: int = 24,
+    interval_minutes: int = 10,
+    since: Optional[str] = None,
+    wait: float = 0,
+):
+    """
+    Several sensors on one shared time grid, for charts that compare
+    stations. Columnar: one `timestamps` list, and per sensor `values`
+    (None where a gap couldn't be filled) plus a `gap` mask.
+
+    since / wait work as on GET /sensors/{id}/readings: with the `cursor`
+    of an earlier response only the intervals from the first new reading
+    on are returned.
+    """
+    if hours <= 0 or interval_minutes <= 0:
+        raise HTTPException(status_code=400, detail="hours and interval_minutes must be positive")
+
+    check_wait(wait)
+
+    try:
+        sids = [ObjectId(s.strip()) for s in sensor_ids.split(",") if s.strip()]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sensor ID format")
+    if not sids:
+        raise HTTPException(status_code=400, detail="sensor_ids is required")
+
+    sensors = {doc["_id"]: doc async for doc in db.sensors.find({"_id": {"$in": sids}})}
+    missing = [str(s) for s in sids if s not in sensors]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Sensor not found: {', '.join(missing)}")
+
+    if since is not None:
+        positions = parse_series_since(since, sids)
+        body = await long_poll(
+            readings_flight,
+            ("series-since", tuple(sids), hours, interval_minutes, tuple(positions.values())),
+            sids,
+            wait,
+            lambda: _load_series_since(sids, sensors, hours, interval_minutes, positions),
+        )
+        return Response(content=body, media_type="application/json")
+
+    now = datetime.utcnow()
+    since = now - timedelta(hours=hours)
+    step_ms = interval_minutes * 60 * 1000
+    start_ms, n = grid_window(since, now, step_ms)
+
+    windows = await asyncio.gather(
+        *(_fetch_readings_window(sid, sensors[sid], since) for sid in sids)
+    )
+
+    series = []
+    for sid, readings in zip(sids, windows):
+        sensor = sensors[sid]
+        points = resample_readings(readings, sensor.get("type"), start_ms, step_ms, n)
+        series.append(_series_entry(sid, sensor, points))
+
+    cursor = {
+        sid: to_ms(readings[-1]["timestamp"] if readings else since)
+        for sid, readings in zip(sids, windows)
+    }
+
+    return {
+        "hours": hours,
+        "interval_minutes": interval_minutes,
+        "cursor": encode_series_cursor(cursor),
+        "timestamps": [from_ms(start_ms + i * step_ms) for i in range(n)],
+        "series": series,
+    }
+
+
+def _series_entry(sid: ObjectId, sensor: dict, points: list[dict]) -> dict:
     return {
         "sensor_id": str(sid),
         "sensor_name": sensor.get("name"),
         "location": sensor.get("location"),
         "type": sensor.get("type"),
         "unit": sensor.get("unit"),
+        "fill": fill_policy(sensor.get("type")),
+        "values": [p["value"] for p in points],
+        "gap": [p["gap"] for p in points],
+    }
+
+
+async def _load_series_since(
+    sids: list[ObjectId],
+    sensors: dict,
+    hours: int,
+    interval_minutes: int,
+    positions: dict[ObjectId, int],
+) -> tuple[bytes, int]:
+    """
+    Delta for get_aligned_sensor_series: (encoded body, number of new
+    readings across all sensors).
+    """
+    now = datetime.utcnow()
+    window_start = now - timedelta(hours=hours)
+    step_ms = interval_minutes * 60 * 1000
+    grid_start_ms, _ = grid_window(window_start, now, step_ms)
+
+    after = {sid: max(positions[sid] + 1, to_ms(window_start)) for sid in sids}
+    _, context_ms = _delta_context_ms(min(after.values()), grid_start_ms, step_ms)
+
+    windows = await asyncio.gather(
+        *(_fetch_readings_window(sid, sensors[sid], from_ms(context_ms)) for sid in sids)
+    )
+    new = {
+        sid: [r for r in readings if to_ms(r["timestamp"]) >= after[sid]]
+        for sid, readings in zip(sids, windows)
+    }
+    count = sum(len(rows) for rows in new.values())
+
+    cursor = {sid: to_ms(new[sid][-1]["timestamp"]) if new[sid] else positions[sid] for sid in sids}
+    payload = {
         "hours": hours,
-        "readings": readings,
+        "interval_minutes": interval_minutes,
+        "cursor": encode_series_cursor(cursor),
+        "timestamps": [],
+        "series": [_series_entry(sid, sensors[sid], []) for sid in sids],
     }
+    if not count:
+        return encode_json(payload), 0
+
+    # Intervals from the earliest new reading on, for every sensor
+    first_bin_ms, _ = _delta_context_ms(min(after[sid] for sid in sids if new[sid]), grid_start_ms, step_ms)
+    start_ms, n = grid_window(from_ms(context_ms), now, step_ms)
+    skip = (first_bin_ms - start_ms) // step_ms
+
+    payload["timestamps"] = [from_ms(start_ms + i * step_ms) for i in range(skip, n)]
+    payload["series"] = [
+        _series_entry(
+            sid,
+            sensors[sid],
+            resample_readings(readings, sensors[sid].get("type"), start_ms, step_ms, n)[skip:],
+        )
+        for sid, readings in zip(sids, windows)
+    ]
+    return encode_json(payload), count
 
-@app.get("/sensors/{sensor_id}/latest-reading")
+@router.get("/sensors/{sensor_id}/latest-reading")
 async def get_latest_sensor_reading(sensor_id: str):
     # 1. Validate sensor id
     try:
@@ -927,7 +1615,285 @@ async def get_latest_sensor_reading(sensor_id: str):
         "latest_reading": doc,
     }
 
-@app.get("/sensor-readings")
+@router.get("/sensors/{sensor_id}/anomalies")
+async def get_sensor_anomalies(sensor_id: str, hours: int = 24, limit: int = 500):
+    """
+    Readings flagged as "spike" or "flatline" (see app/anomaly.py),
+    newest first.
+    """
+    # 1. Validate sensor id
+    try:
+        sid = ObjectId(sensor_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sensor ID format")
+
+    if hours <= 0:
+        raise HTTPException(status_code=400, detail="hours must be positive")
+
+    # 2. Check sensor exists
+    sensor = await db.sensors.find_one({"_id": sid})
+    if not sensor:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+
+    # 3. Only flagged readings (served by the partial anomaly index)
+    since = datetime.utcnow() - timedelta(hours=hours)
+    cursor = (
+        db.sensor_readings.find(
+            {
+                "sensor_id": sid,
+                "anomaly": {"$exists": True},
+                "timestamp": {"$gte": since},
+            }
+        )
+        .sort("timestamp", -1)
+        .limit(limit)
+    )
+
+    anomalies = []
+    async for doc in cursor:
+        doc["id"] = str(doc["_id"])
+        doc["sensor_id"] = str(doc["sensor_id"])
+        del doc["_id"]
+        anomalies.append(doc)
+
+    return {
+        "sensor_id": str(sid),
+        "sensor_name": sensor.get("name"),
+        "type": sensor.get("type"),
+        "hours": hours,
+        "anomalies": anomalies,
+    }
+
+@router.get("/sensors/{sensor_id}/forecast")
+async def get_sensor_forecast(sensor_id: str, hours: float = 3):
+    """
+    Precomputed water-level nowcast (see app/nowcast.py) for the next
+    `hours`, up to the model horizon.
+    """
+    try:
+        sid = ObjectId(sensor_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sensor ID format")
+
+    if hours <= 0:
+        raise HTTPException(status_code=400, detail="hours must be positive")
+
+    forecast = await get_forecast(sid, hours)
+    if forecast is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No forecast for this sensor (only water_level sensors are forecast)",
+        )
+
+    return {"sensor_id": str(sid), "hours": hours, **forecast}
+
+
+@router.get("/locations/{location}/lag-correlation")
+async def get_location_lag_correlation(
+    location: str,
+    hours: int = 72,
+    max_lag: int = 12,
+    step_minutes: int = 10,
+):
+    """
+    How long after rain does the river rise at this location?
+    Cross-correlation of rain[t] with water_level[t + lag] for lags of
+    0..max_lag hours on a step_minutes grid.
+    """
+    if hours <= 0 or max_lag < 0 or step_minutes <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail="hours and step_minutes must be positive, max_lag must be >= 0",
+        )
+    if max_lag >= hours:
+        raise HTTPException(status_code=400, detail="max_lag must be smaller than hours")
+
+    results = await compute_lag_correlations([location], hours, max_lag, step_minutes)
+    if location not in results:
+        raise HTTPException(
+            status_code=404,
+            detail="Location needs an active rain and water_level sensor",
+        )
+    return results[location]
+
+
+@router.get("/lag-correlation")
+async def get_all_lag_correlations(
+    hours: int = 72,
+    max_lag: int = 12,
+    step_minutes: int = 10,
+):
+    """
+    Same as /locations/{location}/lag-correlation for every location,
+    computed in one batch.
+    """
+    if hours <= 0 or max_lag < 0 or step_minutes <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail="hours and step_minutes must be positive, max_lag must be >= 0",
+        )
+    if max_lag >= hours:
+        raise HTTPException(status_code=400, detail="max_lag must be smaller than hours")
+
+    results = await compute_lag_correlations(None, hours, max_lag, step_minutes)
+    return {"locations": list(results.values())}
+
+async def _load_dashboard_shared(feed_limit: int, recent_limit: int) -> dict:
+    """
+    Everything on the dashboard that doesn't depend on who is looking,
+    loaded with concurrent queries.
+    """
+
+    async def active_sensors():
+        sensors = []
+        async for doc in db.sensors.find({"is_active": True}):
+            doc["id"] = str(doc["_id"])
+            del doc["_id"]
+            sensors.append(doc)
+        return sensors
+
+    async def latest_per_sensor():
+        # DISTINCT_SCAN of the (sensor_id, timestamp) index, see app/latest.py
+        rows = await latest_readings("value")
+        return {
+            str(sid): {"timestamp": row["timestamp"], "value": row["value"]}
+            for sid, row in rows.items()
+        }
+
+    async def recent_readings():
+        readings = []
+        cursor = db.sensor_readings.find().sort("timestamp", -1).limit(recent_limit)
+        async for doc in cursor:
+            doc["id"] = str(doc["_id"])
+            if "sensor_id" in doc:
+                doc["sensor_id"] = str(doc["sensor_id"])
+            del doc["_id"]
+            readings.append(doc)
+        return readings
+
+    async def feed():
+        docs, user_names = await _load_feed_page(feed_limit, DocLoader())
+        page = []
+        for doc in docs:
+            liked_by = {str(x) for x in doc.get("liked_by") or [] if isinstance(x, ObjectId)}
+            page.append((shape_user_report(doc, user_names, None), liked_by))
+        return page
+
+    sensors, latest, recent, page = await asyncio.gather(
+        active_sensors(), latest_per_sensor(), recent_readings(), feed()
+    )
+    return {"sensors": sensors, "latest": latest, "recent_readings": recent, "feed": page}
+
+
+@router.get("/dashboard")
+async def get_dashboard(
+    current_user_id: Optional[str] = None,
+    feed_limit: int = 100,
+    recent_limit: int = 6,
+):
+    """
+    Everything posts.tsx needs on first load in one round trip:
+    active sensors, latest reading per sensor, the newest readings and
+    the first feed page (with liked_by_me for current_user_id).
+    """
+    feed_limit = max(1, min(feed_limit, 200))
+    recent_limit = max(0, min(recent_limit, 500))
+
+    # User-independent part is shared between requests for a few seconds
+    shared = await dashboard_flight.do(
+        ("dashboard", feed_limit, recent_limit),
+        lambda: _load_dashboard_shared(feed_limit, recent_limit),
+    )
+
+    reports = [
+        {**report, "liked_by_me": current_user_id in liked_by}
+        for report, liked_by in shared["feed"]
+    ]
+
+    return {
+        "sensors": shared["sensors"],
+        "latest": shared["latest"],
+        "recent_readings": shared["recent_readings"],
+        "reports": reports,
+    }
+
+def _export_response(kind: str, query: dict, format: str, gzip: bool) -> StreamingResponse:
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid format. Allowed formats: {sorted(EXPORT_FORMATS)}",
+        )
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export is not available on this server")
+
+    media_type = "application/gzip" if gzip else EXPORT_FORMATS[format][0]
+    return StreamingResponse(
+        export_stream(kind, query, format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(kind, format, gzip)}"'},
+    )
+
+
+@router.get("/export/sensor-readings")
+async def export_sensor_readings(
+    date_from: Optional[datetime] = Query(default=None, alias="from"),
+    date_to: Optional[datetime] = Query(default=None, alias="to"),
+    sensor_ids: Optional[str] = None,
+    format: str = "csv",
+    gzip: bool = False,
+):
+    """
+    Stream sensor readings (oldest first) as csv, ndjson or parquet.
+    sensor_ids is a comma separated list; from is inclusive, to exclusive.
+    """
+    sids = None
+    if sensor_ids:
+        try:
+            sids = [ObjectId(s.strip()) for s in sensor_ids.split(",") if s.strip()]
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid sensor ID format")
+
+    query = build_export_query(date_from, date_to, sids)
+    return _export_response("sensor-readings", query, format, gzip)
+
+
+@router.get("/export/user-reports")
+async def export_user_reports(
+    date_from: Optional[datetime] = Query(default=None, alias="from"),
+    date_to: Optional[datetime] = Query(default=None, alias="to"),
+    sensor_ids: Optional[str] = None,
+    format: str = "csv",
+    gzip: bool = False,
+):
+    """
+    Stream user reports (oldest first) as csv, ndjson or parquet.
+    """
+    sids = None
+    if sensor_ids:
+        try:
+            sids = [ObjectId(s.strip()) for s in sensor_ids.split(",") if s.strip()]
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid sensor ID format")
+
+    query = build_export_query(date_from, date_to, sids)
+    return _export_response("user-reports", query, format, gzip)
+
+
+@router.get("/tiles/{z}/{x}/{y}")
+async def get_tile(z: int, x: int, y: int):
+    """
+    Aggregated station values for one slippy-map tile, split into
+    8x8 cells (zoom z+3). Served from the in-memory index in app/tiles.py.
+    """
+    if z < 0 or z > TILE_MAX_ZOOM:
+        raise HTTPException(status_code=400, detail=f"z must be between 0 and {TILE_MAX_ZOOM}")
+    if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise HTTPException(status_code=400, detail="Tile x/y out of range for zoom")
+
+    return Response(content=tile_index.tile(z, x, y, encode_json), media_type="application/json")
+
+
+@router.get("/sensor-readings")
 async def get_all_sensor_readings():
     """
     GET ALL SENSOR READINGS (all types, all locations), newest first.
@@ -943,4 +1909,28 @@ async def get_all_sensor_readings():
         del doc["_id"]
         readings.append(doc)
 
-    return {"readings": readings}
\ No newline at end of file
+    return {"readings": readings}
+
+
+def create_app() -> FastAPI:
+    """
+    Build the ASGI app. Nothing here touches the network: the Mongo
+    client is created on first use (app/db.py) and caches are warmed by
+    the lifespan, so spawning a worker only costs the imports.
+    """
+    # Per-client token buckets sized by plan (app/ratelimit.py)
+    app = FastAPI(lifespan=lifespan, dependencies=[Depends(rate_limit)])
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],        # only your frontend dev origins
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
+
+# uvicorn app.main:app
+app = create_app()
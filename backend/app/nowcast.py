@@ -0,0 +1,314 @@
+"""
+Short-term water-level nowcasts.
+
+Each water-level sensor gets a damped Holt (level + trend) exponential
+smoothing model on a STEP_MINUTES grid, plus a small rainfall term from
+the co-located rain sensor. Models live in the `nowcasts` collection
+together with their latest forecast, so GET /sensors/{id}/forecast is a
+single document read.
+
+`run_nowcast()` processes every sensor as one (sensors x steps) matrix:
+
+  - full refit (no model yet, or older than REFIT_HOURS): grid-search
+    alpha/beta for all sensors at once over the last FIT_HOURS
+  - otherwise: advance the stored level/trend with only the grid steps
+    that completed since the last run
+
+Either way the cost is a fixed number of vectorised steps, independent of
+how many sensors there are. The API runs it every NOWCAST_INTERVAL_SECONDS;
+it can also be run by hand:
+
+    python -m app.nowcast
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio
+import os
+import time
+
+import numpy as np
+from pymongo import ReplaceOne
+
+from .db import db
+from .resample import from_ms, resample, to_ms
+
+STEP_MINUTES = 10
+FIT_HOURS = 48
+REFIT_HOURS = 6
+HORIZON_HOURS = 6
+
+# damping of the trend, per step
+PHI = 0.98
+
+# candidate smoothing parameters tried during a full refit
+ALPHAS = np.array([0.1, 0.2, 0.3, 0.5, 0.7, 0.9])
+BETAS = np.array([0.01, 0.05, 0.1, 0.2])
+
+# rain input: mean of the last RAIN_STEPS grid steps, effect fades by
+# RAIN_DECAY per forecast step
+RAIN_STEPS = 6
+RAIN_DECAY = 0.9
+
+NOWCAST_INTERVAL_SECONDS = float(os.getenv("NOWCAST_INTERVAL_SECONDS", "300"))
+
+STEP_MS = STEP_MINUTES * 60 * 1000
+
+
+def holt(Y: np.ndarray, alpha: np.ndarray, beta: np.ndarray, level: np.ndarray, trend: np.ndarray, keep_errors: bool = False):
+    """
+    Damped Holt in error-correction form over the columns of Y (S, T),
+    for P parameter sets at once. alpha/beta broadcast to (S, P),
+    level/trend are the starting state (S, P). NaN observations leave the
+    state to coast. Returns (level, trend, sse, errors or None).
+    """
+    S, T = Y.shape
+    level = level.copy()
+    trend = trend.copy()
+    sse = np.zeros_like(level)
+    errors = np.zeros((S, level.shape[1], T)) if keep_errors else None
+
+    for t in range(T):
+        y = Y[:, t:t + 1]
+        f = level + PHI * trend
+        e = np.where(np.isnan(y), 0.0, y - f)
+        sse += e * e
+        level = f + alpha * e
+        trend = PHI * trend + alpha * beta * e
+        if keep_errors:
+            errors[:, :, t] = e
+
+    return level, trend, sse, errors
+
+
+def fit(Y: np.ndarray, R: np.ndarray) -> dict:
+    """
+    Grid-search alpha/beta for every row of Y (S, T) at once and fit the
+    rain coefficient from the one-step errors. R is the rain grid (S, T),
+    zeros where a location has no rain sensor.
+    """
+    S, T = Y.shape
+    first = np.argmax(~np.isnan(Y), axis=1)
+    start = Y[np.arange(S), first]
+
+    a, b = np.meshgrid(ALPHAS, BETAS, indexing="ij")
+    a, b = a.ravel()[None, :], b.ravel()[None, :]   # (1, P)
+    P = a.shape[1]
+
+    level0 = np.repeat(start[:, None], P, axis=1)
+    trend0 = np.zeros((S, P))
+    _, _, sse, _ = holt(Y, a, b, level0, trend0)
+
+    best = np.argmin(sse, axis=1)
+    alpha = a[0, best][:, None]
+    beta = b[0, best][:, None]
+
+    level, trend, _, errors = holt(Y, alpha, beta, level0[:, :1], trend0[:, :1], keep_errors=True)
+    errors = errors[:, 0, :]
+
+    # rain term: errors ~ gamma * mean rain over the previous RAIN_STEPS
+    rain_recent = _trailing_mean(R, RAIN_STEPS)
+    lagged = np.zeros_like(rain_recent)
+    lagged[:, 1:] = rain_recent[:, :-1]
+    denom = (lagged * lagged).sum(axis=1)
+    gamma = np.where(denom > 0, (errors * lagged).sum(axis=1) / np.where(denom > 0, denom, 1), 0.0)
+    gamma = np.clip(gamma, 0.0, None)
+
+    return {
+        "alpha": alpha[:, 0],
+        "beta": beta[:, 0],
+        "gamma": gamma,
+        "level": level[:, 0],
+        "trend": trend[:, 0],
+        "rain": rain_recent[:, -1],
+    }
+
+
+def _trailing_mean(R: np.ndarray, k: int) -> np.ndarray:
+    c = np.cumsum(np.pad(R, ((0, 0), (1, 0))), axis=1)
+    idx = np.arange(1, R.shape[1] + 1)
+    lo = np.maximum(idx - k, 0)
+    return (c[:, idx] - c[:, lo]) / (idx - lo)
+
+
+def forecast(level, trend, gamma, rain, steps: int) -> np.ndarray:
+    """
+    (S, steps) forecasts for h = 1..steps.
+    """
+    h = np.arange(1, steps + 1)
+    damp = np.cumsum(PHI ** h)
+    return (
+        level[:, None]
+        + damp[None, :] * trend[:, None]
+        + (gamma * rain)[:, None] * (RAIN_DECAY ** h)[None, :]
+    )
+
+
+async def _load_grid(sensor_ids: list, start_ms: int, end_ms: int, fill: str) -> np.ndarray:
+    """
+    (len(sensor_ids), steps) grid of readings between start_ms and end_ms,
+    fetched with one query. None entries in sensor_ids give zero rows.
+    """
+    n = (end_ms - start_ms) // STEP_MS
+    grid = np.zeros((len(sensor_ids), n)) if fill == "zero" else np.full((len(sensor_ids), n), np.nan)
+    wanted = [s for s in sensor_ids if s is not None]
+    if n <= 0 or not wanted:
+        return grid
+
+    series = {sid: ([], []) for sid in wanted}
+    cursor = db.sensor_readings.find(
+        {
+            "sensor_id": {"$in": wanted},
+            "timestamp": {
+                "$gte": datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc),
+                "$lt": datetime.fromtimestamp(end_ms / 1000, tz=timezone.utc),
+            },
+        },
+        {"_id": 0, "sensor_id": 1, "timestamp": 1, "value": 1},
+    )
+    async for doc in cursor:
+        ts, vals = series[doc["sensor_id"]]
+        ts.append(to_ms(doc["timestamp"]))
+        vals.append(float(doc.get("value") or 0.0))
+
+    for row, sid in enumerate(sensor_ids):
+        if sid is None:
+            continue
+        ts, vals = series[sid]
+        grid[row], _ = resample(np.asarray(ts, dtype=np.int64), np.asarray(vals), start_ms, STEP_MS, n, fill)
+    return grid
+
+
+async def run_nowcast(force_refit: bool = False) -> dict:
+    """
+    Refit or advance every water-level sensor's model and store new
+    forecasts. Returns counts for logging.
+    """
+    started = time.perf_counter()
+    end_ms = int(time.time() * 1000) // STEP_MS * STEP_MS   # last complete step
+    now = datetime.utcnow()
+
+    # 1. Water-level sensors and their co-located rain gauge
+    levels, rain_by_location = [], {}
+    async for s in db.sensors.find({"is_active": True, "type": {"$in": ["water_level", "rain"]}}).sort("_id", 1):
+        if s["type"] == "water_level":
+            levels.append(s)
+        else:
+            rain_by_location.setdefault(s.get("location"), s["_id"])
+    if not levels:
+        return {"refit": 0, "advanced": 0, "seconds": 0.0}
+
+    models = {doc["_id"]: doc async for doc in db.nowcasts.find({"_id": {"$in": [s["_id"] for s in levels]}})}
+
+    refit, advance = [], []
+    for s in levels:
+        model = models.get(s["_id"])
+        stale = model is None or force_refit or now - model["fitted_at"] > timedelta(hours=REFIT_HOURS)
+        (refit if stale else advance).append(s)
+
+    results: dict = {}
+
+    # 2. Full refit: one matrix for all stale sensors
+    if refit:
+        start_ms = end_ms - FIT_HOURS * 3600 * 1000
+        Y, R = await asyncio.gather(
+            _load_grid([s["_id"] for s in refit], start_ms, end_ms, "none"),
+            _load_grid([rain_by_location.get(s.get("location")) for s in refit], start_ms, end_ms, "zero"),
+        )
+        has_data = ~np.all(np.isnan(Y), axis=1)
+        if has_data.any():
+            fitted = fit(Y[has_data], R[has_data])
+            with_data = [s for s, ok in zip(refit, has_data) if ok]
+            for i, s in enumerate(with_data):
+                results[s["_id"]] = {k: float(v[i]) for k, v in fitted.items()} | {"fitted_at": now}
+
+    # 3. Incremental: only the steps completed since each model's last run.
+    #    Models are grouped by last_ms (normally all share one value).
+    groups: dict[int, list] = {}
+    for s in advance:
+        groups.setdefault(models[s["_id"]]["last_ms"], []).append(s)
+
+    for since_ms, group in groups.items():
+        if since_ms >= end_ms:
+            continue
+        Y, R = await asyncio.gather(
+            _load_grid([s["_id"] for s in group], since_ms, end_ms, "none"),
+            _load_grid([rain_by_location.get(s.get("location")) for s in group], since_ms, end_ms, "zero"),
+        )
+
+        m = [models[s["_id"]] for s in group]
+        col = lambda key: np.array([x[key] for x in m], dtype=np.float64)[:, None]
+        level, trend, _, _ = holt(Y, col("alpha"), col("beta"), col("level"), col("trend"))
+        rain = _trailing_mean(R, RAIN_STEPS)[:, -1]
+
+        for i, s in enumerate(group):
+            results[s["_id"]] = {
+                "alpha": m[i]["alpha"],
+                "beta": m[i]["beta"],
+                "gamma": m[i]["gamma"],
+                "level": float(level[i, 0]),
+                "trend": float(trend[i, 0]),
+                "rain": float(rain[i]),
+                "fitted_at": m[i]["fitted_at"],
+            }
+
+    if not results:
+        return {"refit": 0, "advanced": 0, "seconds": time.perf_counter() - started}
+
+    # 4. Forecasts for everything we touched, stored in one bulk write
+    ids = list(results)
+    steps = HORIZON_HOURS * 60 // STEP_MINUTES
+    arr = lambda key: np.array([results[i][key] for i in ids])
+    fc = forecast(arr("level"), arr("trend"), arr("gamma"), arr("rain"), steps)
+    fc_times = [from_ms(end_ms + h * STEP_MS) for h in range(1, steps + 1)]
+
+    ops = []
+    for row, sid in enumerate(ids):
+        doc = results[sid] | {
+            "_id": sid,
+            "last_ms": end_ms,
+            "updated_at": now,
+            "step_minutes": STEP_MINUTES,
+            "forecast": [
+                {"timestamp": ts, "value": round(float(v), 3)}
+                for ts, v in zip(fc_times, fc[row])
+            ],
+        }
+        ops.append(ReplaceOne({"_id": sid}, doc, upsert=True))
+    await db.nowcasts.bulk_write(ops, ordered=False)
+
+    return {
+        "refit": len([s for s in refit if s["_id"] in results]),
+        "advanced": len([s for s in advance if s["_id"] in results]),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+async def nowcast_loop():
+    """
+    Lifespan task: keep forecasts fresh.
+    """
+    while True:
+        try:
+            await run_nowcast()
+        except Exception as exc:
+            print(f"[nowcast] run failed: {exc}")
+        await asyncio.sleep(NOWCAST_INTERVAL_SECONDS)
+
+
+async def get_forecast(sensor_id, hours: Optional[float] = None) -> Optional[dict]:
+    doc = await db.nowcasts.find_one({"_id": sensor_id}, {"forecast": 1, "updated_at": 1, "step_minutes": 1})
+    if doc is None:
+        return None
+    points = doc.get("forecast") or []
+    if hours is not None:
+        points = points[: int(hours * 60 // doc.get("step_minutes", STEP_MINUTES))]
+    return {"updated_at": doc.get("updated_at"), "step_minutes": doc.get("step_minutes"), "forecast": points}
+
+
+async def main():
+    stats = await run_nowcast(force_refit=True)
+    print(f"Refit {stats['refit']} sensors in {stats['seconds'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
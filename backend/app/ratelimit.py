@@ -0,0 +1,208 @@
+"""
+Plan-aware token-bucket rate limiting.
+
+Every client has a bucket of `burst` tokens refilled at `rate` tokens per
+second, both taken from its plan (PLAN_LIMITS; requests that don't name a
+known user are "anonymous" and keyed by IP). A request costs what its
+route says in ROUTE_COSTS, scaled by the window (`hours`) or page size
+(`limit`) it asks for, so one 30-day readings query weighs as much as 30
+one-day ones. A request that doesn't fit gets 429 with Retry-After.
+
+The client is the user named by the X-User-Id header or a user_id /
+current_user_id parameter. That header isn't authenticated, so every
+request is also charged to a bucket for its IP (IP_LIMIT, sized for a
+handful of users behind one NAT): rotating user ids gets a client more
+buckets, but not past its address's limit. A request is only allowed,
+and only charged, if both buckets can pay.
+
+Buckets live in this worker's memory, so with N workers a client gets
+up to N times the limit. Buckets and cached plans are both capped at
+MAX_BUCKETS entries.
+"""
+from typing import Callable, Optional
+import math
+import os
+import time
+
+from bson import ObjectId
+from fastapi import HTTPException, Request
+
+from .db import db
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+
+# tokens per second, bucket size
+PLAN_LIMITS = {
+    "anonymous": {"rate": 2.0, "burst": 40},
+    "free": {"rate": 5.0, "burst": 100},
+    "plus": {"rate": 20.0, "burst": 400},
+    "ultra": {"rate": 50.0, "burst": 1000},
+}
+
+# every request, whatever its plan, also draws on its IP's bucket
+IP_LIMIT = {
+    "rate": float(os.getenv("RATE_LIMIT_IP_RATE", "100")),
+    "burst": int(os.getenv("RATE_LIMIT_IP_BURST", "2000")),
+}
+
+PLAN_CACHE_SECONDS = 60
+MAX_BUCKETS = 50_000
+
+EXEMPT_PATHS = {"/", "/health"}
+
+
+def _number(params, name: str, default: float) -> float:
+    try:
+        return float(params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _days(params, default_hours: float = 24) -> float:
+    return max(1.0, _number(params, "hours", default_hours) / 24)
+
+
+def _pages(params, default_limit: float) -> float:
+    return max(1.0, _number(params, "limit", default_limit) / 50)
+
+
+def _sensor_count(params) -> int:
+    return max(1, len([s for s in (params.get("sensor_ids") or "").split(",") if s.strip()]))
+
+
+# route path -> cost(query params); anything not listed costs 1
+ROUTE_COSTS: dict[str, Callable] = {
+    "/sensor-readings": lambda p: 50,
+    "/sensors/{sensor_id}/readings": lambda p: 0.25 if p.get("since") else _days(p),
+    "/sensor-readings/series": lambda p: (0.25 if p.get("since") else _days(p)) * _sensor_count(p),
+    "/sensors/{sensor_id}/anomalies": lambda p: _days(p),
+    "/locations/{location}/lag-correlation": lambda p: 2 * _days(p, 72),
+    "/lag-correlation": lambda p: 10 * _days(p, 72),
+    "/user-reports": lambda p: _pages(p, 100),
+    "/user-reports/search": lambda p: 2 * _pages(p, 20),
+    "/reports": lambda p: _pages(p, 50),
+    "/dashboard": lambda p: 3,
+    "/export/sensor-readings": lambda p: 25,
+    "/export/user-reports": lambda p: 25,
+}
+
+
+class RateLimiter:
+    def __init__(self, limits: dict = PLAN_LIMITS, ip_limit: dict = IP_LIMIT):
+        self.limits = {**limits, "ip": ip_limit}
+        # (plan, client) -> [tokens, last refill (monotonic)]
+        self.buckets: dict[tuple[str, str], list] = {}
+        # user id -> (plan, expires)
+        self._plans: dict[str, tuple[str, float]] = {}
+        self.stats = {"allowed": 0, "limited": 0}
+
+    async def plan_for(self, user_id: Optional[str]) -> Optional[str]:
+        if not user_id:
+            return None
+        hit = self._plans.get(user_id)
+        if hit is not None and hit[1] > time.monotonic():
+            return hit[0]
+        if not ObjectId.is_valid(user_id):
+            return None
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, {"plan": 1})
+        plan = (user.get("plan") or "free") if user else None
+        if plan is not None and (plan not in self.limits or plan == "ip"):
+            plan = "free"
+
+        now = time.monotonic()
+        if user_id not in self._plans and len(self._plans) >= MAX_BUCKETS:
+            self._prune_plans(now)
+        self._plans[user_id] = (plan, now + PLAN_CACHE_SECONDS)
+        return plan
+
+    def forget_plan(self, user_id: str):
+        self._plans.pop(user_id, None)
+
+    def _prune_plans(self, now: float):
+        """
+        Drop expired plans; if every one is still fresh, the oldest half.
+        """
+        self._plans = {uid: hit for uid, hit in self._plans.items() if hit[1] > now}
+        if len(self._plans) >= MAX_BUCKETS:
+            self._plans = dict(list(self._plans.items())[len(self._plans) // 2:])
+
+    def take(self, keys: list[tuple[str, str]], cost: float) -> float:
+        """
+        Spend `cost` tokens from every (plan, client) bucket in `keys`, or
+        from none of them. Returns 0 if allowed, otherwise the seconds
+        until all of them will hold enough.
+        """
+        now = time.monotonic()
+        if len(self.buckets) + len(keys) > MAX_BUCKETS:
+            self._prune(now)
+
+        wait = 0.0
+        charges = []
+        for key in keys:
+            limit = self.limits[key[0]]
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(limit["burst"]), now]
+
+            bucket[0] = min(limit["burst"], bucket[0] + (now - bucket[1]) * limit["rate"])
+            bucket[1] = now
+            need = min(cost, limit["burst"])   # a huge request needs a full bucket, not more
+            wait = max(wait, (need - bucket[0]) / limit["rate"])
+            charges.append((bucket, need))
+
+        if wait > 0:
+            self.stats["limited"] += 1
+            return wait
+
+        for bucket, need in charges:
+            bucket[0] -= need
+        self.stats["allowed"] += 1
+        return 0.0
+
+    def _prune(self, now: float):
+        """
+        Drop buckets that have refilled completely (idle clients).
+        """
+        self.buckets = {
+            key: b for key, b in self.buckets.items()
+            if b[0] + (now - b[1]) * self.limits[key[0]]["rate"] < self.limits[key[0]]["burst"]
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+async def rate_limit(request: Request):
+    """
+    App-wide FastAPI dependency (runs after routing, so the route's path
+    template is known).
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    if path in EXEMPT_PATHS:
+        return
+
+    params = request.query_params
+    user_id = (
+        request.headers.get("x-user-id")
+        or params.get("user_id")
+        or params.get("current_user_id")
+        or request.path_params.get("user_id")
+    )
+    ip = request.client.host if request.client else "unknown"
+    plan = await rate_limiter.plan_for(user_id)
+    if plan is None:
+        plan, client = "anonymous", ip
+    else:
+        client = user_id
+
+    cost = ROUTE_COSTS.get(path, lambda p: 1)(params)
+    retry_after = rate_limiter.take([(plan, client), ("ip", ip)], cost)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for plan '{plan}'",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
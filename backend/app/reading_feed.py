@@ -0,0 +1,166 @@
+"""
+In-process feed of newly inserted sensor readings.
+
+Readings are written by the ingest gateway (another process), so the API
+tails `sensor_readings` by _id: every POLL_SECONDS it fetches documents
+whose ObjectId was generated after (last poll - LOOKBACK_SECONDS) and
+hands the ones it hasn't seen yet to subscribers. The lookback covers
+clock skew between writer processes; subscribers should still be
+idempotent (e.g. "keep the newest timestamp per sensor"), since a reading
+can be handed out again after a restart or a slow poll.
+
+ObjectIds are generated by the writer before the insert, so a reading
+can commit after the lookback has passed it (an insert_many stuck behind
+backpressure or retries, a skewed gateway clock). Every SWEEP_SECONDS a
+sweep counts the readings per ObjectId second over the last
+SWEEP_LOOKBACK_SECONDS and compares that with what was handed out; the
+seconds that come up short are fetched again and their readings handed
+out late.
+
+Long-polling requests park in `wait()` until a new reading for one of
+their sensors shows up; `generation` counts polls that brought new data.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+import asyncio
+import os
+
+from bson import ObjectId
+
+from .db import db
+
+POLL_SECONDS = float(os.getenv("READING_FEED_POLL_SECONDS", "1"))
+LOOKBACK_SECONDS = 5.0
+SWEEP_SECONDS = float(os.getenv("READING_FEED_SWEEP_SECONDS", "30"))
+SWEEP_LOOKBACK_SECONDS = float(os.getenv("READING_FEED_SWEEP_LOOKBACK_SECONDS", "900"))
+
+FEED_PROJECTION = {"sensor_id": 1, "timestamp": 1, "value": 1, "anomaly": 1, "anomaly_score": 1}
+
+
+class ReadingFeed:
+    def __init__(self, poll_seconds: float = POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.subscribers: list[Callable[[list[dict]], None]] = []
+        self.started = self.since = datetime.now(timezone.utc)
+        self.generation = 0
+        # _ids returned by the previous poll (the lookback overlaps)
+        self._seen: set = set()
+        # ObjectId second -> readings handed out with an _id from that second
+        self._delivered: dict[int, int] = {}
+        self.stats = {"delivered": 0, "swept": 0}
+        # sensor_id -> futures of requests waiting for its next reading
+        self._waiters: dict = {}
+
+    def subscribe(self, callback: Callable[[list[dict]], None]):
+        self.subscribers.append(callback)
+
+    async def poll(self) -> int:
+        started = datetime.now(timezone.utc)
+        cursor = db.sensor_readings.find(
+            {"_id": {"$gte": ObjectId.from_datetime(self.since - timedelta(seconds=LOOKBACK_SECONDS))}},
+            FEED_PROJECTION,
+        ).sort("_id", 1)
+        docs = await cursor.to_list(length=None)
+
+        fresh = [doc for doc in docs if doc["_id"] not in self._seen]
+        self._seen = {doc["_id"] for doc in docs}
+
+        for doc in fresh:
+            second = int(doc["_id"].generation_time.timestamp())
+            self._delivered[second] = self._delivered.get(second, 0) + 1
+        self._deliver(fresh)
+
+        self.since = started
+        return len(fresh)
+
+    def _deliver(self, docs: list[dict]):
+        if not docs:
+            return
+        self.generation += 1
+        self.stats["delivered"] += len(docs)
+        for callback in self.subscribers:
+            try:
+                callback(docs)
+            except Exception as exc:
+                print(f"[reading-feed] subscriber {callback!r} failed: {exc}")
+        self._wake(docs)
+
+    async def sweep(self) -> int:
+        """
+        Hand out readings that committed after the polls had moved past
+        their _id. Returns how many were found.
+        """
+        lo = max(self.started, datetime.now(timezone.utc) - timedelta(seconds=SWEEP_LOOKBACK_SECONDS))
+        hi = self.since - timedelta(seconds=LOOKBACK_SECONDS)   # newer _ids are still polled
+        lo_s, hi_s = int(lo.timestamp()) + 1, int(hi.timestamp())   # whole seconds only
+        self._delivered = {sec: n for sec, n in self._delivered.items() if sec >= lo_s}
+        if hi_s <= lo_s:
+            return 0
+
+        def oid(second: int) -> ObjectId:
+            return ObjectId.from_datetime(datetime.fromtimestamp(second, tz=timezone.utc))
+
+        pipeline = [
+            {"$match": {"_id": {"$gte": oid(lo_s), "$lt": oid(hi_s)}}},
+            {"$group": {
+                "_id": {"$floor": {"$divide": [{"$toLong": {"$toDate": "$_id"}}, 1000]}},
+                "n": {"$sum": 1},
+            }},
+        ]
+        counts = {int(row["_id"]): row["n"] async for row in db.sensor_readings.aggregate(pipeline)}
+        short = [sec for sec, n in counts.items() if n > self._delivered.get(sec, 0)]
+        if not short:
+            return 0
+
+        # the whole second is handed out again; subscribers are idempotent
+        late = []
+        for sec in sorted(short):
+            late += await db.sensor_readings.find(
+                {"_id": {"$gte": oid(sec), "$lt": oid(sec + 1)}}, FEED_PROJECTION
+            ).to_list(length=None)
+            self._delivered[sec] = counts[sec]
+
+        self.stats["swept"] += len(late)
+        self._deliver(late)
+        return len(late)
+
+    def _wake(self, docs: list[dict]):
+        for sid in {doc.get("sensor_id") for doc in docs}:
+            for fut in self._waiters.pop(sid, ()):
+                if not fut.done():
+                    fut.set_result(True)
+
+    async def wait(self, sensor_ids: list, timeout: float) -> bool:
+        """
+        True once a new reading of any of sensor_ids has been handed to
+        subscribers, False after `timeout` seconds.
+        """
+        fut = asyncio.get_running_loop().create_future()
+        for sid in sensor_ids:
+            self._waiters.setdefault(sid, set()).add(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            for sid in sensor_ids:
+                waiters = self._waiters.get(sid)
+                if waiters is not None:
+                    waiters.discard(fut)
+                    if not waiters:
+                        del self._waiters[sid]
+
+    async def run(self):
+        next_sweep = asyncio.get_running_loop().time() + SWEEP_SECONDS
+        while True:
+            try:
+                await self.poll()
+                if asyncio.get_running_loop().time() >= next_sweep:
+                    next_sweep += SWEEP_SECONDS
+                    await self.sweep()
+            except Exception as exc:
+                print(f"[reading-feed] poll failed: {exc}")
+            await asyncio.sleep(self.poll_seconds)
+
+
+reading_feed = ReadingFeed()
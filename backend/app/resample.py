@@ -0,0 +1,123 @@
+"""
+Snap irregular sensor readings onto a regular time grid.
+
+Readings are averaged per bin; empty bins are filled according to the
+sensor type:
+
+    rain         0 (no report = no rain)
+    water_level  linear interpolation between neighbouring bins
+    temperature  forward-fill from the last reading, at most FFILL_LIMIT bins
+
+Bins that can't be filled (e.g. temperature before its first reading or
+after a long outage) are NaN. Every result carries a gap mask: True where
+the bin had no real reading.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+import math
+
+import numpy as np
+
+FFILL_LIMIT = 6
+
+FILL_POLICY = {
+    "rain": "zero",
+    "water_level": "linear",
+    "temperature": "ffill",
+}
+DEFAULT_FILL = "linear"
+
+
+def fill_policy(sensor_type: Optional[str]) -> str:
+    return FILL_POLICY.get(sensor_type or "", DEFAULT_FILL)
+
+
+def to_ms(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp() * 1000)
+
+
+def from_ms(ms: int) -> datetime:
+    # naive UTC, same as what Motor hands back for stored dates
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+def grid_window(since: datetime, until: datetime, step_ms: int) -> tuple[int, int]:
+    """
+    (start_ms, n) of a grid aligned to multiples of step_ms since the
+    epoch, so every series resampled with the same step lines up.
+    """
+    start_ms = to_ms(since) // step_ms * step_ms
+    n = max(1, math.ceil((to_ms(until) - start_ms) / step_ms))
+    return start_ms, n
+
+
+def resample(
+    ts_ms: np.ndarray,
+    values: np.ndarray,
+    start_ms: int,
+    step_ms: int,
+    n: int,
+    fill: str,
+    limit: int = FFILL_LIMIT,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Average readings into n bins of step_ms from start_ms and fill empty
+    bins with `fill` ("zero", "linear", "ffill" or "none").
+    Returns (grid, gap) where gap[i] is True if bin i had no reading.
+    """
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+
+    idx = (ts_ms - start_ms) // step_ms
+    ok = (idx >= 0) & (idx < n)
+    idx, values = idx[ok], values[ok]
+
+    sums = np.bincount(idx, weights=values, minlength=n)
+    counts = np.bincount(idx, minlength=n)
+    has = counts > 0
+
+    grid = np.full(n, np.nan)
+    grid[has] = sums[has] / counts[has]
+
+    if has.all():
+        return grid, ~has
+
+    if fill == "zero":
+        grid[~has] = 0.0
+    elif fill == "linear" and has.any():
+        pos = np.arange(n)
+        grid[~has] = np.interp(pos[~has], pos[has], grid[has])
+    elif fill == "ffill":
+        pos = np.arange(n)
+        last = np.maximum.accumulate(np.where(has, pos, -1))
+        ok = (~has) & (last >= 0) & (pos - last <= limit)
+        grid[ok] = grid[last[ok]]
+
+    return grid, ~has
+
+
+def resample_readings(
+    readings: list[dict],
+    sensor_type: Optional[str],
+    start_ms: int,
+    step_ms: int,
+    n: int,
+) -> list[dict]:
+    """
+    Readings (dicts with timestamp / value) -> one point per grid bin:
+    {"timestamp", "value" (None if unfillable), "gap"}.
+    """
+    ts = np.fromiter((to_ms(r["timestamp"]) for r in readings), dtype=np.int64, count=len(readings))
+    vals = np.fromiter((float(r.get("value") or 0.0) for r in readings), dtype=np.float64, count=len(readings))
+
+    grid, gap = resample(ts, vals, start_ms, step_ms, n, fill_policy(sensor_type))
+
+    return [
+        {"timestamp": from_ms(start_ms + i * step_ms), "value": v, "gap": g}
+        for i, (v, g) in enumerate(zip(
+            [None if math.isnan(x) else round(x, 4) for x in grid.tolist()],
+            gap.tolist(),
+        ))
+    ]
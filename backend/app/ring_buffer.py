@@ -0,0 +1,265 @@
+"""
+Recent readings of every sensor, in memory.
+
+Each sensor gets a fixed-size ring of RING_CAPACITY slots held in
+preallocated NumPy arrays (no per-reading dicts):
+
+    timestamp   int64    ms since epoch (UTC)
+    value       float64
+    oid         uint8    12 bytes of the reading's ObjectId
+    anomaly     int8     0 = none, see ANOMALY_CODES
+    score       float32  anomaly_score, NaN if none
+
+so memory is SLOT_BYTES * RING_CAPACITY per sensor whatever its reporting
+rate. The rings are warmed with the last RING_WARM_HOURS at startup and
+then fed from app/reading_feed.py. A ring knows from which time on it is
+complete (`covers_from_ms`); windows starting at or after that are cut
+out with a binary search, anything older goes back to Mongo.
+
+The feed catches readings that commit late (see its sweep); one that
+commits later than even the sweep looks back would be missing from the
+ring, so every RING_REWARM_SECONDS the rings are rebuilt from Mongo in
+the background and swapped in whole.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import os
+
+import numpy as np
+from bson import ObjectId
+
+from .db import db
+from .resample import from_ms, to_ms
+
+RING_CAPACITY = int(os.getenv("RING_CAPACITY", "4096"))
+RING_WARM_HOURS = float(os.getenv("RING_WARM_HOURS", "25"))
+RING_REWARM_SECONDS = float(os.getenv("RING_REWARM_SECONDS", "3600"))
+
+ANOMALY_CODES = {"spike": 1, "flatline": 2}
+ANOMALY_LABELS = {code: label for label, code in ANOMALY_CODES.items()}
+
+SLOT_BYTES = 8 + 8 + 12 + 1 + 4
+
+
+class SensorRing:
+    __slots__ = ("capacity", "ts", "value", "oid", "anomaly", "score", "start", "size", "covers_from_ms")
+
+    def __init__(self, capacity: int, covers_from_ms: int):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.value = np.zeros(capacity, dtype=np.float64)
+        self.oid = np.zeros((capacity, 12), dtype=np.uint8)
+        self.anomaly = np.zeros(capacity, dtype=np.int8)
+        self.score = np.full(capacity, np.nan, dtype=np.float32)
+        self.start = 0
+        self.size = 0
+        # every reading with timestamp >= covers_from_ms is in the ring
+        self.covers_from_ms = covers_from_ms
+
+    def _segments(self) -> list[tuple[int, int]]:
+        """
+        Physical [lo, hi) ranges of the ring, oldest first.
+        """
+        end = self.start + self.size
+        if end <= self.capacity:
+            return [(self.start, end)]
+        return [(self.start, self.capacity), (0, end - self.capacity)]
+
+    def _last_ts(self) -> int:
+        return int(self.ts[(self.start + self.size - 1) % self.capacity])
+
+    def _write(self, pos: int, ts: int, value: float, oid: bytes, anomaly: int, score: float):
+        self.ts[pos] = ts
+        self.value[pos] = value
+        self.oid[pos] = np.frombuffer(oid, dtype=np.uint8)
+        self.anomaly[pos] = anomaly
+        self.score[pos] = score
+
+    def add(self, ts: int, value: float, oid: bytes, anomaly: int = 0, score: float = np.nan) -> bool:
+        """
+        Add one reading. Readings already present (same timestamp, which
+        is unique per sensor) or older than the ring's coverage are ignored.
+        """
+        if ts < self.covers_from_ms:
+            return False
+
+        if self.size == 0 or ts > self._last_ts():
+            pos = (self.start + self.size) % self.capacity
+            if self.size == self.capacity:
+                # overwrite the oldest slot
+                self.covers_from_ms = int(self.ts[self.start]) + 1
+                self.start = (self.start + 1) % self.capacity
+            else:
+                self.size += 1
+            self._write(pos, ts, value, oid, anomaly, score)
+            return True
+
+        # late reading: rare, so rebuild the ring in order
+        ordered = self._ordered()
+        i = int(np.searchsorted(ordered[0], ts))
+        if i < self.size and ordered[0][i] == ts:
+            return False
+        row = (ts, value, np.frombuffer(oid, dtype=np.uint8), anomaly, score)
+        columns = [np.insert(col, i, item, axis=0) for col, item in zip(ordered, row)]
+        if len(columns[0]) > self.capacity:
+            self.covers_from_ms = int(columns[0][0]) + 1
+            columns = [col[1:] for col in columns]
+        n = len(columns[0])
+        self.ts[:n], self.value[:n], self.oid[:n], self.anomaly[:n], self.score[:n] = columns
+        self.start, self.size = 0, n
+        return True
+
+    def _ordered(self) -> tuple[np.ndarray, ...]:
+        parts = self._segments()
+        return tuple(
+            np.concatenate([col[lo:hi] for lo, hi in parts])
+            for col in (self.ts, self.value, self.oid, self.anomaly, self.score)
+        )
+
+    def window(self, since_ms: int, until_ms: Optional[int] = None) -> Optional[tuple[np.ndarray, ...]]:
+        """
+        (ts, value, oid, anomaly, score) of readings with
+        since_ms <= timestamp (< until_ms), oldest first, or None if the
+        ring doesn't reach back to since_ms.
+        """
+        if since_ms < self.covers_from_ms:
+            return None
+
+        pieces = []
+        for lo, hi in self._segments():
+            seg = self.ts[lo:hi]
+            a = lo + int(np.searchsorted(seg, since_ms, side="left"))
+            b = hi if until_ms is None else lo + int(np.searchsorted(seg, until_ms, side="left"))
+            if a < b:
+                pieces.append((a, b))
+
+        cols = (self.ts, self.value, self.oid, self.anomaly, self.score)
+        if len(pieces) == 1:
+            a, b = pieces[0]
+            return tuple(col[a:b] for col in cols)
+        return tuple(
+            np.concatenate([col[a:b] for a, b in pieces]) if pieces else col[:0]
+            for col in cols
+        )
+
+
+class ReadingRing:
+    def __init__(self, capacity: int = RING_CAPACITY, warm_hours: float = RING_WARM_HOURS):
+        self.capacity = capacity
+        self.warm_hours = warm_hours
+        self.rings: dict[ObjectId, SensorRing] = {}
+        # rings created after warm-up start out complete from this time on
+        self.ready_from_ms: Optional[int] = None
+        # feed docs that arrive while a re-warm is building new rings
+        self._pending: Optional[list[dict]] = None
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.rings) * self.capacity * SLOT_BYTES
+
+    def _ring(self, rings: dict, ready_from_ms: Optional[int], sid: ObjectId) -> Optional[SensorRing]:
+        ring = rings.get(sid)
+        if ring is None and ready_from_ms is not None:
+            ring = rings[sid] = SensorRing(self.capacity, ready_from_ms)
+        return ring
+
+    def add_doc(self, doc: dict) -> bool:
+        if self._pending is not None:
+            self._pending.append(doc)
+        return self._add(self.rings, self.ready_from_ms, doc)
+
+    def _add(self, rings: dict, ready_from_ms: Optional[int], doc: dict) -> bool:
+        ring = self._ring(rings, ready_from_ms, doc.get("sensor_id"))
+        if ring is None or doc.get("timestamp") is None:
+            return False
+        score = doc.get("anomaly_score")
+        return ring.add(
+            to_ms(doc["timestamp"]),
+            float(doc.get("value") or 0.0),
+            doc["_id"].binary,
+            ANOMALY_CODES.get(doc.get("anomaly"), 0),
+            np.nan if score is None else score,
+        )
+
+    def apply_readings(self, docs: list[dict]):
+        """
+        Subscriber for app/reading_feed.py.
+        """
+        for doc in docs:
+            self.add_doc(doc)
+
+    def remove_sensor(self, sid: ObjectId):
+        self.rings.pop(sid, None)
+
+    async def warm(self):
+        """
+        Build rings with the last warm_hours of readings and swap them in.
+        The current rings keep serving (and being fed) until then.
+        """
+        since = datetime.utcnow() - timedelta(hours=self.warm_hours)
+        ready_from_ms = to_ms(since)
+        rings: dict = {}
+
+        self._pending = []
+        try:
+            cursor = db.sensor_readings.find(
+                {"timestamp": {"$gte": since}},
+                {"sensor_id": 1, "timestamp": 1, "value": 1, "anomaly": 1, "anomaly_score": 1},
+            ).sort("timestamp", 1).batch_size(10000)
+            async for doc in cursor:
+                self._add(rings, ready_from_ms, doc)
+
+            # readings the feed handed out meanwhile (no await from here
+            # to the swap, so nothing can slip in between)
+            for doc in self._pending:
+                self._add(rings, ready_from_ms, doc)
+        finally:
+            self._pending = None
+        self.rings, self.ready_from_ms = rings, ready_from_ms
+
+    async def rewarm_loop(self):
+        """
+        Lifespan task: rebuild the rings every RING_REWARM_SECONDS.
+        """
+        while True:
+            await asyncio.sleep(RING_REWARM_SECONDS)
+            try:
+                await self.warm()
+            except Exception as exc:
+                print(f"[ring-buffer] re-warm failed: {exc}")
+
+    def window_docs(self, sid: ObjectId, sensor: dict, since: datetime, until: Optional[datetime] = None) -> Optional[list[dict]]:
+        """
+        Readings of one sensor as API documents (same shape as
+        sensor_readings rows), or None if the window isn't in memory.
+        """
+        ring = self.rings.get(sid)
+        if ring is None:
+            return None
+        cols = ring.window(to_ms(since), None if until is None else to_ms(until))
+        if cols is None:
+            return None
+
+        ts, value, oid, anomaly, score = cols
+        sensor_id = str(sid)
+        docs = []
+        for t, v, o, a, s in zip(ts.tolist(), value.tolist(), oid, anomaly.tolist(), score.tolist()):
+            doc = {
+                "sensor_id": sensor_id,
+                "sensor_name": sensor.get("name"),
+                "location": sensor.get("location"),
+                "timestamp": from_ms(t),
+                "type": sensor.get("type"),
+                "value": v,
+                "unit": sensor.get("unit"),
+                "id": o.tobytes().hex(),
+            }
+            if a:
+                doc["anomaly"] = ANOMALY_LABELS[a]
+                doc["anomaly_score"] = round(s, 2)
+            docs.append(doc)
+        return docs
+
+
+reading_ring = ReadingRing()
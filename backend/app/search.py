@@ -0,0 +1,65 @@
+"""
+Helpers for GET /user-reports/search (text index on user_reports, see
+indexes.py): query terms, opaque keyset cursors and highlighted snippets.
+"""
+from html import escape
+from typing import Optional
+import base64
+import re
+
+from bson import ObjectId
+
+SNIPPET_CHARS = 160
+
+
+def query_terms(q: str) -> list[str]:
+    """
+    Words and "quoted phrases" from a search box string, lower-cased.
+    """
+    phrases = re.findall(r'"([^"]+)"', q)
+    rest = re.sub(r'"[^"]*"', " ", q)
+    words = [w for w in re.split(r"\W+", rest) if w and not w.startswith("-")]
+    return [t.lower() for t in phrases + words]
+
+
+def encode_cursor(score: float, oid: ObjectId) -> str:
+    raw = f"{score!r}:{oid}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[tuple[float, ObjectId]]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, oid = base64.urlsafe_b64decode(padded).decode().split(":")
+        return float(score), ObjectId(oid)
+    except Exception:
+        return None
+
+
+def highlight(text: str, terms: list[str], width: int = SNIPPET_CHARS) -> str:
+    """
+    A window of `text` around the first match, HTML-escaped, with every
+    match wrapped in <mark>.
+    """
+    if not text:
+        return ""
+    if not terms:
+        return escape(text[:width])
+
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(text)
+    start = 0
+    if first and first.start() > width // 3:
+        start = first.start() - width // 3
+    end = min(len(text), start + width)
+    window = text[start:end]
+
+    parts = []
+    pos = 0
+    for m in pattern.finditer(window):
+        parts.append(escape(window[pos:m.start()]))
+        parts.append(f"<mark>{escape(m.group(0))}</mark>")
+        pos = m.end()
+    parts.append(escape(window[pos:]))
+
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
@@ -0,0 +1,62 @@
+"""
+Request coalescing for hot read endpoints.
+
+Concurrent callers asking for the same key share one in-flight load
+(and its already-encoded result); finished results are kept for a short
+TTL so a burst of identical requests costs one Mongo query.
+"""
+from typing import Any, Awaitable, Callable, Hashable
+import asyncio
+import time
+
+
+class SingleFlight:
+    def __init__(self, ttl: float, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._cache: dict[Hashable, tuple[float, Any]] = {}
+        self.stats = {"hits": 0, "joins": 0, "loads": 0}
+
+    async def do(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        # 1. Fresh cached result
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            self.stats["hits"] += 1
+            return hit[1]
+
+        # 2. Someone is already loading it -> wait for their result
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["joins"] += 1
+        else:
+            # 3. We are the leader. The load runs as its own task so a
+            #    cancelled leader (client went away) doesn't fail the others.
+            self.stats["loads"] += 1
+            task = asyncio.ensure_future(self._load(key, load))
+            self._inflight[key] = task
+
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await load()
+            if self.ttl > 0:
+                self._store(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key: Hashable, value: Any):
+        now = time.monotonic()
+        if len(self._cache) >= self.max_entries:
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+        self._cache[key] = (now + self.ttl, value)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] = lambda key: True):
+        """
+        Drop cached results whose key matches (in-flight loads are left alone).
+        """
+        self._cache = {k: v for k, v in self._cache.items() if not predicate(k)}
@@ -0,0 +1,207 @@
+"""
+Map tiles with per-cell aggregates of the latest sensor values.
+
+GET /tiles/{z}/{x}/{y} (slippy-map / Web Mercator numbering) returns the
+tile split into 2^CELL_BITS x 2^CELL_BITS cells, each with
+
+    station_count, max_water_level, total_rainfall, avg_temperature
+
+computed from the latest reading of every active station in the cell.
+
+Everything is kept in memory: each station's tile coordinates are
+precomputed for every zoom, and when its latest value changes (fed by
+app/reading_feed.py) only the encoded tiles that contain it are dropped.
+Map panning is then served from the encoded tile cache: an LRU of at
+most TILE_CACHE_MAX_TILES tiles with stations in them. Empty tiles
+(most of the 4^16 at high zoom) are encoded on the fly, never stored.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import math
+import os
+
+from .db import db
+from .latest import latest_per_sensor
+
+MAX_ZOOM = 16
+CELL_BITS = 3
+TILE_CACHE_MAX_TILES = int(os.getenv("TILE_CACHE_MAX_TILES", "4096"))
+
+
+def tile_xy(lat: float, lon: float, z: int) -> tuple[int, int]:
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    n = 1 << z
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+class TileIndex:
+    def __init__(self):
+        # sensor_id -> {"type", "lat", "lon", "value", "timestamp", "tiles": [(x, y) per zoom]}
+        self.sensors: dict = {}
+        # (z, x, y) -> sensor ids inside that tile, for z in 0..MAX_ZOOM
+        self.members: dict[tuple[int, int, int], set] = {}
+        # (z, x, y) -> encoded response body, least recently used first
+        self.encoded: OrderedDict[tuple[int, int, int], bytes] = OrderedDict()
+
+    # --- maintenance -------------------------------------------------------
+
+    def set_sensor(self, sensor: dict):
+        """
+        Add / move / update a station from its sensors document.
+        """
+        sid = sensor["_id"]
+        lat, lon = sensor.get("latitude"), sensor.get("longitude")
+        if lat is None or lon is None or not sensor.get("is_active", True):
+            self.remove_sensor(sid)
+            return
+
+        old = self.sensors.get(sid)
+        if old is not None and old["lat"] == lat and old["lon"] == lon:
+            old["type"] = sensor.get("type")
+            self._invalidate(old)
+            return
+
+        self.remove_sensor(sid)
+        entry = {
+            "type": sensor.get("type"),
+            "lat": lat,
+            "lon": lon,
+            "value": old["value"] if old else None,
+            "timestamp": old["timestamp"] if old else None,
+            "tiles": [tile_xy(lat, lon, z) for z in range(MAX_ZOOM + CELL_BITS + 1)],
+        }
+        self.sensors[sid] = entry
+        for z in range(MAX_ZOOM + 1):
+            x, y = entry["tiles"][z]
+            self.members.setdefault((z, x, y), set()).add(sid)
+        self._invalidate(entry)
+
+    def remove_sensor(self, sid):
+        entry = self.sensors.pop(sid, None)
+        if entry is None:
+            return
+        for z in range(MAX_ZOOM + 1):
+            x, y = entry["tiles"][z]
+            members = self.members.get((z, x, y))
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del self.members[(z, x, y)]
+        self._invalidate(entry)
+
+    def update_value(self, sid, timestamp: datetime, value: float) -> bool:
+        """
+        Apply a reading; only newer readings change anything.
+        """
+        entry = self.sensors.get(sid)
+        if entry is None:
+            return False
+        if entry["timestamp"] is not None and timestamp <= entry["timestamp"]:
+            return False
+        entry["timestamp"] = timestamp
+        entry["value"] = value
+        self._invalidate(entry)
+        return True
+
+    def apply_readings(self, docs: list[dict]):
+        """
+        Subscriber for app/reading_feed.py.
+        """
+        for doc in docs:
+            self.update_value(doc.get("sensor_id"), doc.get("timestamp"), doc.get("value"))
+
+    def _invalidate(self, entry: dict):
+        for z in range(MAX_ZOOM + 1):
+            x, y = entry["tiles"][z]
+            self.encoded.pop((z, x, y), None)
+
+    async def warm(self):
+        """
+        Load active stations and their latest readings.
+        """
+        self.sensors.clear()
+        self.members.clear()
+        self.encoded.clear()
+
+        async for sensor in db.sensors.find({"is_active": True}):
+            self.set_sensor(sensor)
+
+        # one index entry per sensor (app/latest.py)
+        for sid, row in (await latest_per_sensor("value")).items():
+            self.update_value(sid, row["timestamp"], row["value"])
+
+    # --- reads -------------------------------------------------------------
+
+    def tile(self, z: int, x: int, y: int, encode) -> bytes:
+        key = (z, x, y)
+        body = self.encoded.get(key)
+        if body is not None:
+            self.encoded.move_to_end(key)
+            return body
+
+        body = encode(self.build_tile(z, x, y))
+        if key in self.members:
+            self.encoded[key] = body
+            while len(self.encoded) > TILE_CACHE_MAX_TILES:
+                self.encoded.popitem(last=False)
+        return body
+
+    def build_tile(self, z: int, x: int, y: int) -> dict:
+        cell_z = z + CELL_BITS
+        cells: dict = {}
+
+        for sid in self.members.get((z, x, y), ()):
+            entry = self.sensors[sid]
+            cx, cy = entry["tiles"][cell_z]
+            cell = cells.get((cx, cy))
+            if cell is None:
+                cell = cells[(cx, cy)] = {
+                    "z": cell_z, "x": cx, "y": cy,
+                    "lat_sum": 0.0, "lon_sum": 0.0,
+                    "station_count": 0,
+                    "max_water_level": None,
+                    "total_rainfall": None,
+                    "temp_sum": 0.0, "temp_count": 0,
+                    "latest_at": None,
+                }
+
+            cell["station_count"] += 1
+            cell["lat_sum"] += entry["lat"]
+            cell["lon_sum"] += entry["lon"]
+
+            value = entry["value"]
+            if value is None:
+                continue
+            if entry["type"] == "water_level":
+                cell["max_water_level"] = value if cell["max_water_level"] is None else max(cell["max_water_level"], value)
+            elif entry["type"] == "rain":
+                cell["total_rainfall"] = (cell["total_rainfall"] or 0.0) + value
+            elif entry["type"] == "temperature":
+                cell["temp_sum"] += value
+                cell["temp_count"] += 1
+            if cell["latest_at"] is None or entry["timestamp"] > cell["latest_at"]:
+                cell["latest_at"] = entry["timestamp"]
+
+        out = []
+        for cell in cells.values():
+            n = cell["station_count"]
+            out.append({
+                "z": cell["z"],
+                "x": cell["x"],
+                "y": cell["y"],
+                "lat": round(cell["lat_sum"] / n, 5),
+                "lon": round(cell["lon_sum"] / n, 5),
+                "station_count": n,
+                "max_water_level": cell["max_water_level"],
+                "total_rainfall": None if cell["total_rainfall"] is None else round(cell["total_rainfall"], 2),
+                "avg_temperature": round(cell["temp_sum"] / cell["temp_count"], 2) if cell["temp_count"] else None,
+                "latest_at": cell["latest_at"],
+            })
+
+        return {"z": z, "x": x, "y": y, "cell_zoom": cell_z, "cells": out}
+
+
+tile_index = TileIndex()
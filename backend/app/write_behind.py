@@ -0,0 +1,383 @@
+"""
+Write-behind batching for user report creation and likes.
+
+With WRITE_BEHIND_ENABLED=1, POST /user-reports and
+POST /user-reports/{id}/like validate the request, queue the write and
+answer straight away. A single flusher task drains the queue every
+WRITE_BEHIND_FLUSH_MS (or as soon as WRITE_BEHIND_BATCH ops are waiting)
+and writes each batch as
+
+    one bulk insert for new reports
+    one bulk_write for likes, folded: toggles on the same (report, user)
+      collapse to their final state, and pairs that cancel out are dropped
+    one bulk_write per counter collection (app/counters.py), with the
+      $inc of the whole batch summed per document
+
+The queue holds at most WRITE_BEHIND_MAX_QUEUE ops; when it is full,
+requests wait for room (backpressure) instead of piling up in memory.
+
+Every batch has an id and a ledger document (`write_behind_ledger`)
+written before anything is counted. The ledger records which likes
+actually change state, from Mongo as it is just before the batch, and
+the counter deltas that follow from them and from the new reports. A
+retried batch, a spill replay or a recovery reuses that ledger instead
+of deriving deltas again. Each counter collection is marked done in the
+ledger once its $incs land, so a retry doesn't apply them twice. The
+ledger is deleted when the batch is complete. Ledgers left behind by a
+dead worker are finished by the next `start()`.
+
+On shutdown `stop()` flushes everything that was acknowledged. A batch
+that still can't be written after retries is appended to
+WRITE_BEHIND_SPILL_PATH and replayed by the next `start()`.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import os
+import time
+
+from bson import ObjectId, json_util
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .db import db
+from .hot import rescore
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "0") == "1"
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "5"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "1000"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "20000"))
+WRITE_BEHIND_SPILL_PATH = os.getenv(
+    "WRITE_BEHIND_SPILL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "write_behind_spill.ndjson"),
+)
+
+FLUSH_RETRIES = 5
+# a ledger this old belongs to a worker that died mid-batch
+LEDGER_STALE_SECONDS = 300
+COUNTER_COLLECTIONS = ("users", "sensors", "location_stats")
+
+
+class WriteBehind:
+    def __init__(self, enabled: bool = WRITE_BEHIND_ENABLED):
+        self.enabled = enabled
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WRITE_BEHIND_MAX_QUEUE)
+        # reports acknowledged but not written yet, so they can be liked
+        self.pending_reports: dict[ObjectId, dict] = {}
+        # (report_id, user_id) -> [liked in Mongo, liked after queued ops, queued ops]
+        self.pending_likes: dict[tuple[ObjectId, ObjectId], list] = {}
+        # report_id -> likes delta not written yet
+        self.pending_like_counts: dict[ObjectId, int] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.on_flushed = []   # callbacks(new reports, liked report ids) after each batch
+        self.stats = {"queued": 0, "batches": 0, "writes": 0, "folded": 0, "spilled": 0}
+
+    # --- producers ---------------------------------------------------------
+
+    async def submit_report(self, doc: dict):
+        """
+        Queue a fully built user_reports document (with its _id set).
+        """
+        self.pending_reports[doc["_id"]] = doc
+        await self.queue.put(("report", doc))
+        self.stats["queued"] += 1
+
+    async def toggle_like(self, rid: ObjectId, uid: ObjectId) -> Optional[tuple[int, bool]]:
+        """
+        Toggle uid's like on report rid. Returns (likes, liked) as they will
+        be once queued writes land, or None if the report doesn't exist.
+        """
+        doc = self.pending_reports.get(rid)
+        if doc is not None:
+            in_db, likes, author = uid in doc.get("liked_by", []), 0, doc.get("user_id")
+        else:
+            doc = await db.user_reports.find_one(
+                {"_id": rid},
+                {"likes": 1, "user_id": 1, "liked_by": {"$elemMatch": {"$eq": uid}}},
+            )
+            if doc is None:
+                return None
+            in_db, likes, author = bool(doc.get("liked_by")), int(doc.get("likes") or 0), doc.get("user_id")
+
+        key = (rid, uid)
+        state = self.pending_likes.get(key)
+        if state is None:
+            state = self.pending_likes[key] = [in_db, in_db, 0]
+        liked = not state[1]
+        state[1] = liked
+        state[2] += 1
+
+        delta = 1 if liked else -1
+        self.pending_like_counts[rid] = self.pending_like_counts.get(rid, 0) + delta
+        likes += self.pending_like_counts[rid]
+
+        await self.queue.put(("like", rid, uid, author, delta))
+        self.stats["queued"] += 1
+        return max(likes, 0), liked
+
+    # --- flushing ----------------------------------------------------------
+
+    async def start(self):
+        if not self.enabled:
+            return
+        await self._replay_spill()
+        await self._recover_ledgers()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Flush everything queued, then stop the flusher.
+        """
+        if self.task is None:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + WRITE_BEHIND_FLUSH_MS / 1000
+            while len(batch) < WRITE_BEHIND_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _fold(self, batch: list) -> tuple[list[dict], list[tuple], dict]:
+        """
+        Reports to insert, the final like state of every (report, user)
+        whose state actually changed, and per (report, user) the number
+        of ops and likes delta this batch covers.
+        """
+        reports = [op[1] for op in batch if op[0] == "report"]
+
+        touched: dict = {}
+        for op in batch:
+            if op[0] == "like":
+                _, rid, uid, author, delta = op
+                entry = touched.setdefault((rid, uid), [author, 0, 0])
+                entry[1] += 1
+                entry[2] += delta
+
+        likes = []
+        for (rid, uid), (author, _, _) in touched.items():
+            in_db, liked, _ = self.pending_likes[(rid, uid)]
+            if in_db != liked:
+                likes.append((rid, uid, author, liked))
+
+        self.stats["folded"] += sum(n for _, n, _ in touched.values()) - len(likes)
+        return reports, likes, touched
+
+    def _settle(self, reports: list[dict], likes: list[tuple], touched: dict):
+        """
+        Drop the pending state covered by a written (or spilled) batch.
+        Toggles queued while it was being written stay pending.
+        """
+        for doc in reports:
+            self.pending_reports.pop(doc["_id"], None)
+
+        written = {(rid, uid): liked for rid, uid, _, liked in likes}
+        for key, (_, n, delta) in touched.items():
+            state = self.pending_likes[key]
+            state[2] -= n
+            if state[2] <= 0:
+                del self.pending_likes[key]
+            else:
+                state[0] = written.get(key, state[0])
+
+            left = self.pending_like_counts.get(key[0], 0) - delta
+            if left:
+                self.pending_like_counts[key[0]] = left
+            else:
+                self.pending_like_counts.pop(key[0], None)
+
+    async def _flush(self, batch: list):
+        reports, likes, touched = self._fold(batch)
+        batch_id = ObjectId()
+        for attempt in range(FLUSH_RETRIES):
+            try:
+                await self._write(batch_id, reports, likes, first=attempt == 0)
+                break
+            except Exception as exc:
+                print(f"[write-behind] flush failed ({attempt + 1}/{FLUSH_RETRIES}): {exc}")
+                await asyncio.sleep(0.2 * 2 ** attempt)
+        else:
+            self._spill(batch_id, reports, likes)
+            self._settle(reports, likes, touched)
+            return
+        self._settle(reports, likes, touched)
+
+        liked_ids = [rid for rid, *_ in likes]
+        for callback in self.on_flushed:
+            try:
+                await callback(reports, liked_ids)
+            except Exception as exc:
+                print(f"[write-behind] on_flushed callback failed: {exc}")
+
+    async def _write(self, batch_id: ObjectId, reports: list[dict], likes: list[tuple], first: bool = False):
+        """
+        Safe to repeat for the same batch_id: inserts skip _ids that are
+        already there, like updates are conditional on the current state,
+        and counters follow the batch's ledger (see module docstring).
+        first: no earlier attempt of this batch can have inserted anything.
+        """
+        self.stats["batches"] += 1
+
+        # 1. New reports. Duplicates were inserted by an earlier attempt,
+        #    or, on a first attempt, by an earlier run of the same
+        #    Idempotency-Key (app/idempotency.py): those aren't counted.
+        new_reports = reports
+        if reports:
+            try:
+                await db.user_reports.bulk_write([InsertOne(doc) for doc in reports], ordered=False)
+            except BulkWriteError as exc:
+                errors = exc.details.get("writeErrors", [])
+                if any(e.get("code") != 11000 for e in errors):
+                    raise
+                if first:
+                    existed = {e["index"] for e in errors}
+                    new_reports = [doc for i, doc in enumerate(reports) if i not in existed]
+            self.stats["writes"] += 1
+
+        # 2. What this batch changes, fixed before anything is counted
+        ledger = await db.write_behind_ledger.find_one({"_id": batch_id})
+        if ledger is None:
+            ledger = await self._plan(batch_id, new_reports, likes)
+            await db.write_behind_ledger.insert_one(ledger)
+            self.stats["writes"] += 2
+
+        await self._apply(ledger)
+
+    async def _plan(self, batch_id: ObjectId, reports: list[dict], likes: list[tuple]) -> dict:
+        """
+        The ledger of a batch: the likes that really change state in Mongo
+        right now, and the counter deltas of those likes and the reports.
+        """
+        users: dict = {}
+        sensors: dict = {}
+        locations: dict = {}
+        for doc in reports:
+            inc = users.setdefault(doc["user_id"], {})
+            inc["report_count"] = inc.get("report_count", 0) + 1
+            sensors[doc["sensor_id"]] = sensors.get(doc["sensor_id"], 0) + 1
+            if doc.get("location"):
+                locations[doc["location"]] = locations.get(doc["location"], 0) + 1
+
+        changes = []
+        if likes:
+            liked_now = await self._liked_now(likes)
+            for rid, uid, author, liked in likes:
+                if ((rid, uid) in liked_now) == liked:
+                    continue   # already in that state, nothing to count
+                changes.append([rid, uid, liked])
+                inc = users.setdefault(author, {})
+                inc["likes_received"] = inc.get("likes_received", 0) + (1 if liked else -1)
+
+        return {
+            "_id": batch_id,
+            "created_at": datetime.utcnow(),
+            "likes": changes,
+            "users": [[oid, inc] for oid, inc in users.items() if oid is not None and any(inc.values())],
+            "sensors": [[oid, n] for oid, n in sensors.items()],
+            "location_stats": [[loc, n] for loc, n in locations.items()],
+            "done": [],
+        }
+
+    async def _liked_now(self, likes: list[tuple]) -> set:
+        """
+        The (report, user) pairs of `likes` that are liked in Mongo.
+        """
+        uids = list({uid for _, uid, _, _ in likes})
+        rows = await db.user_reports.aggregate([
+            {"$match": {"_id": {"$in": list({rid for rid, *_ in likes})}}},
+            {"$project": {"liked": {"$setIntersection": [{"$ifNull": ["$liked_by", []]}, uids]}}},
+        ]).to_list(length=None)
+        self.stats["writes"] += 1
+        return {(row["_id"], uid) for row in rows for uid in row["liked"]}
+
+    async def _apply(self, ledger: dict):
+        """
+        Carry out a ledger: like updates, then each counter collection
+        not marked done yet, then drop the ledger.
+        """
+        if ledger["likes"]:
+            ops = []
+            for rid, uid, liked in ledger["likes"]:
+                if liked:
+                    ops.append(UpdateOne(
+                        {"_id": rid, "liked_by": {"$ne": uid}},
+                        {"$push": {"liked_by": uid}, "$inc": {"likes": 1}},
+                    ))
+                else:
+                    ops.append(UpdateOne(
+                        {"_id": rid, "liked_by": uid},
+                        {"$pull": {"liked_by": uid}, "$inc": {"likes": -1}},
+                    ))
+            await db.user_reports.bulk_write(ops, ordered=False)
+            await rescore({rid for rid, _, _ in ledger["likes"]})
+            self.stats["writes"] += 2
+
+        # counters, summed per document (drift from concurrent writers is
+        # repaired by `python -m app.counters`)
+        for name in COUNTER_COLLECTIONS:
+            if name in ledger["done"] or not ledger[name]:
+                continue
+            if name == "users":
+                ops = [UpdateOne({"_id": oid}, {"$inc": inc}) for oid, inc in ledger[name]]
+            elif name == "sensors":
+                ops = [UpdateOne({"_id": oid}, {"$inc": {"report_count": n}}) for oid, n in ledger[name]]
+            else:
+                ops = [UpdateOne({"_id": loc}, {"$inc": {"report_count": n}}, upsert=True) for loc, n in ledger[name]]
+            await db[name].bulk_write(ops, ordered=False)
+            await db.write_behind_ledger.update_one({"_id": ledger["_id"]}, {"$addToSet": {"done": name}})
+            self.stats["writes"] += 2
+
+        await db.write_behind_ledger.delete_one({"_id": ledger["_id"]})
+        self.stats["writes"] += 1
+
+    async def _recover_ledgers(self):
+        """
+        Finish batches whose worker died between planning and counting.
+        """
+        stale = datetime.utcnow() - timedelta(seconds=LEDGER_STALE_SECONDS)
+        ledgers = await db.write_behind_ledger.find({"created_at": {"$lt": stale}}).to_list(length=None)
+        for ledger in ledgers:
+            await self._apply(ledger)
+        if ledgers:
+            print(f"[write-behind] finished {len(ledgers)} interrupted batches")
+
+    # --- spill file --------------------------------------------------------
+
+    def _spill(self, batch_id: ObjectId, reports: list[dict], likes: list[tuple]):
+        # one line per batch, keeping its id so a replay reuses its ledger
+        with open(WRITE_BEHIND_SPILL_PATH, "a") as f:
+            f.write(json_util.dumps({"batch": batch_id, "reports": reports, "likes": [list(l) for l in likes]}) + "\n")
+        self.stats["spilled"] += len(reports) + len(likes)
+        print(f"[write-behind] spilled {len(reports) + len(likes)} writes to {WRITE_BEHIND_SPILL_PATH}")
+
+    async def _replay_spill(self):
+        if not os.path.exists(WRITE_BEHIND_SPILL_PATH):
+            return
+        batches = []
+        with open(WRITE_BEHIND_SPILL_PATH) as f:
+            for line in f:
+                if line.strip():
+                    item = json_util.loads(line)
+                    batches.append((item["batch"], item["reports"], [tuple(l) for l in item["likes"]]))
+        for batch_id, reports, likes in batches:
+            await self._write(batch_id, reports, likes)
+        os.remove(WRITE_BEHIND_SPILL_PATH)
+        print(f"[write-behind] replayed {len(batches)} spilled batches")
+
+
+write_behind = WriteBehind()
@@ -0,0 +1,92 @@
+"""
+Latency of a readings window: Mongo vs the in-memory ring.
+
+Warms app.ring_buffer.ReadingRing from the database in .env, then for a
+few sensors fetches the last HOURS of readings ROUNDS times both ways
+(the same find + dict building get_sensor_readings used to do, and
+ReadingRing.window_docs), checks both return the same readings and
+prints p50 / p95 per path.
+
+    python bench_ring_buffer.py [hours] [sensors]
+"""
+from datetime import datetime, timedelta
+import asyncio
+import statistics
+import sys
+import time
+
+from app.db import db
+from app.ring_buffer import SLOT_BYTES, reading_ring
+
+ROUNDS = 50
+
+
+async def mongo_window(sid, since):
+    readings = []
+    cursor = db.sensor_readings.find({"sensor_id": sid, "timestamp": {"$gte": since}}).sort("timestamp", 1)
+    async for doc in cursor:
+        doc["id"] = str(doc["_id"])
+        doc["sensor_id"] = str(doc["sensor_id"])
+        del doc["_id"]
+        readings.append(doc)
+    return readings
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return f"p50 {statistics.median(samples) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms"
+
+
+async def main(hours: float, n_sensors: int):
+    # 1. Warm the ring like the API does at startup
+    started = time.perf_counter()
+    await reading_ring.warm()
+    print(
+        f"Warmed {len(reading_ring.rings)} rings in {time.perf_counter() - started:.2f} s, "
+        f"{reading_ring.memory_bytes / 1e6:.1f} MB "
+        f"({reading_ring.capacity} slots x {SLOT_BYTES} B per sensor)"
+    )
+
+    sensors = await db.sensors.find({"_id": {"$in": list(reading_ring.rings)}}).to_list(length=n_sensors)
+    if not sensors:
+        raise SystemExit("No sensors with recent readings")
+
+    mongo_times, ring_times, rows = [], [], 0
+    for sensor in sensors:
+        sid = sensor["_id"]
+        since = datetime.utcnow() - timedelta(hours=hours)
+
+        # 2. Both paths must agree on which readings are in the window
+        expected = await mongo_window(sid, since)
+        got = reading_ring.window_docs(sid, sensor, since)
+        if got is None:
+            print(f"{sid}: window not in memory (ring wrapped), skipped")
+            continue
+        # (Mongo may have newer rows: nothing feeds the ring during the run)
+        assert [d["id"] for d in got] == [d["id"] for d in expected[:len(got)]], f"{sid}: ring and Mongo differ"
+        rows += len(got)
+
+        # 3. Time them
+        for _ in range(ROUNDS):
+            t = time.perf_counter()
+            await mongo_window(sid, since)
+            mongo_times.append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            reading_ring.window_docs(sid, sensor, since)
+            ring_times.append(time.perf_counter() - t)
+
+    if not ring_times:
+        raise SystemExit("Nothing to compare")
+
+    print(f"{len(sensors)} sensors, {hours:g} h windows, {rows / len(sensors):.0f} readings each, {ROUNDS} rounds")
+    print(f"  mongo  {percentiles(mongo_times)}")
+    print(f"  ring   {percentiles(ring_times)}")
+    print(f"  speedup x{statistics.median(mongo_times) / statistics.median(ring_times):.1f} (median)")
+
+
+if __name__ == "__main__":
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    n_sensors = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    asyncio.run(main(hours, n_sensors))
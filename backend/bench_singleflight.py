@@ -0,0 +1,63 @@
+"""
+Thousands of concurrent identical readings requests -> one load.
+
+Drives app.singleflight.SingleFlight the same way get_sensor_readings
+does, with a fake 50 ms "Mongo query", and checks that
+
+  - 5000 concurrent identical requests run the query exactly once
+  - every caller gets the same encoded body
+  - a cancelled caller doesn't break the others
+  - requests inside the TTL are served from the micro-cache
+  - distinct parameters still get their own query
+
+    python bench_singleflight.py
+"""
+import asyncio
+import time
+
+from app.singleflight import SingleFlight
+
+CONCURRENT = 5000
+QUERY_SECONDS = 0.05
+
+
+async def main():
+    flight = SingleFlight(ttl=1.0)
+    queries = []
+
+    async def fake_query(sensor_id, hours):
+        queries.append((sensor_id, hours))
+        await asyncio.sleep(QUERY_SECONDS)
+        return f'{{"sensor_id":"{sensor_id}","hours":{hours},"readings":[]}}'.encode()
+
+    def request(sensor_id="s1", hours=24):
+        return flight.do(("readings", sensor_id, hours), lambda: fake_query(sensor_id, hours))
+
+    # 1. burst of identical requests, one of them cancelled mid-flight
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(request()) for _ in range(CONCURRENT)]
+    await asyncio.sleep(QUERY_SECONDS / 2)
+    tasks[0].cancel()
+    results = await asyncio.gather(*tasks[1:])
+    elapsed = time.perf_counter() - started
+
+    assert len(queries) == 1, f"expected 1 query, got {len(queries)}"
+    assert len(set(results)) == 1, "callers got different bodies"
+    print(
+        f"{CONCURRENT} concurrent identical requests -> {len(queries)} query "
+        f"in {elapsed * 1000:.1f} ms (stats {flight.stats})"
+    )
+
+    # 2. inside the TTL: cache hits, no new query
+    await asyncio.gather(*(request() for _ in range(CONCURRENT)))
+    assert len(queries) == 1, "micro-cache missed"
+
+    # 3. different parameters are different queries
+    await asyncio.gather(*(request(hours=h) for h in (6, 12, 48) for _ in range(100)))
+    assert len(queries) == 4, f"expected 4 queries, got {len(queries)}"
+
+    print(f"OK: {len(queries)} queries for {2 * CONCURRENT + 300} requests")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
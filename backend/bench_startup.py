@@ -0,0 +1,119 @@
+"""
+Cold start budget for the API: import time and time to first response.
+
+  1. Imports app.main in a fresh interpreter with `python -X importtime`
+     (RUNS times, best run kept) and prints where the time goes, summed
+     per top-level package.
+  2. Starts `uvicorn app.main:app` on a free port and measures the time
+     from spawn until GET /health answers (that includes the lifespan:
+     indexes and cache warm-up against the database in .env).
+
+Exits with status 1 if either goes over its budget, so it can gate CI:
+
+    python bench_startup.py [--import-budget-ms 1500] [--startup-budget-s 15]
+    python bench_startup.py --skip-server     # imports only, no database
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUNS = 5
+TOP = 12
+
+
+def import_profile() -> tuple[float, dict[str, float]]:
+    """
+    (total ms for `import app.main`, {top-level package: self ms})
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import app.main failed:\n{result.stderr[-2000:]}")
+
+    total = 0.0
+    per_package: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        root = name.split(".")[0]
+        per_package[root] = per_package.get(root, 0.0) + int(self_us) / 1000
+        if name == "app.main":
+            total = int(cumulative_us) / 1000
+    return total, per_package
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_response(timeout: float) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise SystemExit(f"uvicorn exited with status {server.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise SystemExit(f"no response within {timeout:.0f} s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--import-budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1500")))
+    parser.add_argument("--startup-budget-s", type=float, default=float(os.getenv("STARTUP_BUDGET_S", "15")))
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--skip-server", action="store_true", help="only measure imports")
+    args = parser.parse_args()
+
+    # 1. Import time, best of N (the first run also warms the disk cache)
+    profiles = [import_profile() for _ in range(args.runs)]
+    total, per_package = min(profiles, key=lambda p: p[0])
+    print(f"import app.main   best {total:7.1f} ms   median {statistics.median(p[0] for p in profiles):7.1f} ms")
+    for name, ms in sorted(per_package.items(), key=lambda kv: -kv[1])[:TOP]:
+        print(f"  {name:<24} {ms:7.1f} ms")
+
+    failed = []
+    if total > args.import_budget_ms:
+        failed.append(f"import {total:.0f} ms > {args.import_budget_ms:.0f} ms")
+
+    # 2. Spawn to first response
+    if not args.skip_server:
+        ttfr = time_to_first_response(timeout=args.startup_budget_s * 4)
+        print(f"first response    {ttfr:7.2f} s")
+        if ttfr > args.startup_budget_s:
+            failed.append(f"first response {ttfr:.2f} s > {args.startup_budget_s:.0f} s")
+
+    if failed:
+        print("OVER BUDGET: " + "; ".join(failed))
+        sys.exit(1)
+    print("within budget")
+
+
+if __name__ == "__main__":
+    main()
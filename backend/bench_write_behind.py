@@ -0,0 +1,144 @@
+"""
+Report/like write throughput: one write per request vs app.write_behind.
+
+Against the database in .env, creates REPORTS user reports and LIKES like
+toggles from CONCURRENCY concurrent "requests", first the way the
+endpoints do it without write-behind (insert_one / conditional update plus
+counter $incs per request), then through WriteBehind. Prints requests/s
+and Mongo operations for both, then deletes the generated reports and
+runs the counter reconcile so the database is left as it was.
+
+    python bench_write_behind.py [reports] [likes]
+"""
+from datetime import datetime
+import asyncio
+import random
+import sys
+import time
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.counters import on_like_changed, on_report_created, reconcile_counters
+from app.db import db
+from app.write_behind import WriteBehind
+
+CONCURRENCY = 200
+BENCH_COMMENT = "bench_write_behind"
+
+
+def make_doc(user, sensor) -> dict:
+    return {
+        "user_id": user["_id"],
+        "sensor_id": sensor["_id"],
+        "sensor_name": sensor.get("name"),
+        "location": sensor.get("location"),
+        "timestamp": datetime.utcnow(),
+        "type": sensor.get("type"),
+        "value": round(random.uniform(0, 10), 2),
+        "unit": sensor.get("unit"),
+        "source": user.get("name") or "User",
+        "comment": BENCH_COMMENT,
+        "likes": 0,
+        "liked_by": [],
+    }
+
+
+async def run_requests(jobs, concurrency=CONCURRENCY) -> float:
+    queue = list(jobs)
+    started = time.perf_counter()
+
+    async def worker():
+        while queue:
+            await queue.pop()()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def direct(users, sensors, n_reports, n_likes) -> tuple[float, int]:
+    ops = 0
+    report_ids = []
+
+    async def create():
+        nonlocal ops
+        user, sensor = random.choice(users), random.choice(sensors)
+        result = await db.user_reports.insert_one(make_doc(user, sensor))
+        await on_report_created(user["_id"], sensor["_id"], sensor.get("location"))
+        report_ids.append(result.inserted_id)
+        ops += 4
+
+    async def like():
+        nonlocal ops
+        rid, uid = random.choice(report_ids), random.choice(users)["_id"]
+        doc = await db.user_reports.find_one_and_update(
+            {"_id": rid, "liked_by": {"$ne": uid}},
+            {"$push": {"liked_by": uid}, "$inc": {"likes": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        ops += 1
+        if doc is None:
+            doc = await db.user_reports.find_one_and_update(
+                {"_id": rid, "liked_by": uid},
+                {"$pull": {"liked_by": uid}, "$inc": {"likes": -1}},
+            )
+            ops += 1
+            await on_like_changed(doc["user_id"], -1)
+        else:
+            await on_like_changed(doc["user_id"], 1)
+        ops += 1
+
+    elapsed = await run_requests([create] * n_reports)
+    elapsed += await run_requests([like] * n_likes)
+    return elapsed, ops
+
+
+async def batched(users, sensors, n_reports, n_likes) -> tuple[float, int, dict]:
+    wb = WriteBehind(enabled=True)
+    await wb.start()
+    report_ids = []
+    reads = 0
+
+    async def create():
+        user, sensor = random.choice(users), random.choice(sensors)
+        doc = make_doc(user, sensor) | {"_id": ObjectId()}
+        await wb.submit_report(doc)
+        report_ids.append(doc["_id"])
+
+    async def like():
+        nonlocal reads
+        rid = random.choice(report_ids)
+        if rid not in wb.pending_reports:
+            reads += 1
+        await wb.toggle_like(rid, random.choice(users)["_id"])
+
+    started = time.perf_counter()
+    await run_requests([create] * n_reports)
+    await run_requests([like] * n_likes)
+    await wb.stop()   # include the final flush
+    return time.perf_counter() - started, wb.stats["writes"] + reads, wb.stats
+
+
+async def main(n_reports: int, n_likes: int):
+    users = await db.users.find({}, {"name": 1}).to_list(length=100)
+    sensors = await db.sensors.find({"is_active": True}).to_list(length=100)
+    if not users or not sensors:
+        raise SystemExit("Needs at least one user and one active sensor")
+
+    total = n_reports + n_likes
+    try:
+        elapsed, ops = await direct(users, sensors, n_reports, n_likes)
+        print(f"direct        {total / elapsed:8.0f} req/s  {ops:7d} Mongo ops")
+
+        elapsed, ops, stats = await batched(users, sensors, n_reports, n_likes)
+        print(f"write-behind  {total / elapsed:8.0f} req/s  {ops:7d} Mongo ops  {stats}")
+    finally:
+        result = await db.user_reports.delete_many({"comment": BENCH_COMMENT})
+        await reconcile_counters()
+        print(f"Cleaned up {result.deleted_count} bench reports and reconciled counters")
+
+
+if __name__ == "__main__":
+    n_reports = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_likes = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    asyncio.run(main(n_reports, n_likes))
@@ -0,0 +1,42 @@
+from dotenv import load_dotenv
+from pymongo import MongoClient, DeleteMany
+import os
+
+# One-off cleanup so the unique (sensor_id, timestamp) index can be built.
+# Keeps the first reading of each (sensor_id, timestamp) pair.
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL")
+DB_NAME = os.getenv("MONGO_DB_NAME", "water_status")
+
+if not MONGO_URL:
+    raise RuntimeError("MONGO_URL is not set")
+
+client = MongoClient(MONGO_URL)
+db = client[DB_NAME]
+
+BATCH_SIZE = 1000
+
+if __name__ == "__main__":
+    pipeline = [
+        {"$group": {
+            "_id": {"sensor_id": "$sensor_id", "timestamp": "$timestamp"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+
+    ops = []
+    removed = 0
+    for group in db.sensor_readings.aggregate(pipeline, allowDiskUse=True):
+        extra_ids = sorted(group["ids"])[1:]
+        ops.append(DeleteMany({"_id": {"$in": extra_ids}}))
+        if len(ops) >= BATCH_SIZE:
+            removed += db.sensor_readings.bulk_write(ops, ordered=False).deleted_count
+            ops = []
+
+    if ops:
+        removed += db.sensor_readings.bulk_write(ops, ordered=False).deleted_count
+
+    print(f"Removed {removed} duplicate readings.")
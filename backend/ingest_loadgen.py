@@ -0,0 +1,125 @@
+"""
+Local load generator for app/ingest_gateway.py.
+
+Opens N TCP connections to the gateway and streams
+`sensor_id,timestamp,value` lines for the active sensors as fast as the
+gateway accepts them (or at --rate lines/s), then reports sustained
+throughput both on the wire and as rows that actually landed in Mongo.
+
+    python -m app.ingest_gateway          # in one terminal
+    python ingest_loadgen.py --seconds 30 --connections 8
+"""
+from dotenv import load_dotenv
+from pymongo import MongoClient
+import argparse
+import asyncio
+import os
+import random
+import time
+
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL")
+DB_NAME = os.getenv("MONGO_DB_NAME", "water_status")
+
+if not MONGO_URL:
+    raise RuntimeError("MONGO_URL is not set")
+
+
+def make_value(s_type: str) -> float:
+    if s_type == "rain":
+        return 0.0 if random.random() < 0.7 else round(random.uniform(1, 40), 1)
+    if s_type == "water_level":
+        return round(2.0 + random.uniform(-0.1, 0.1), 2)
+    return round(27 + random.uniform(-3, 3), 1)
+
+
+async def run_connection(host, port, sensors, deadline, rate, counter):
+    reader, writer = await asyncio.open_connection(host, port)
+    # BSON dates are millisecond precision: keep per-sensor timestamps
+    # strictly increasing so every generated line is a distinct reading.
+    last_ms = {sid: 0 for sid, _ in sensors}
+    chunk = 500
+    interval = chunk / rate if rate else 0.0
+
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        now_ms = int(time.time() * 1000)
+        lines = []
+        for _ in range(chunk):
+            sid, s_type = random.choice(sensors)
+            ts_ms = max(now_ms, last_ms[sid] + 1)
+            last_ms[sid] = ts_ms
+            lines.append(f"{sid},{ts_ms / 1000:.3f},{make_value(s_type)}\n")
+
+        writer.write("".join(lines).encode())
+        await writer.drain()  # waits when the gateway applies backpressure
+        counter[0] += chunk
+
+        if interval:
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    writer.close()
+    await writer.wait_closed()
+
+
+async def main(args):
+    client = MongoClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    sensors = [
+        (str(s["_id"]), s.get("type", "rain"))
+        for s in db.sensors.find({"is_active": True}, {"type": 1})
+    ]
+    if not sensors:
+        raise RuntimeError("No active sensors, run reset_and_seed_sensors.py first")
+
+    before = db.sensor_readings.estimated_document_count()
+    print(
+        f"Sending to {args.host}:{args.port} for {args.seconds}s "
+        f"with {args.connections} connections over {len(sensors)} sensors"
+    )
+
+    # Give every connection its own sensors so timestamps never collide
+    random.shuffle(sensors)
+    groups = [sensors[i::args.connections] for i in range(args.connections)]
+    groups = [g for g in groups if g]
+
+    counter = [0]
+    started = time.monotonic()
+    deadline = started + args.seconds
+    per_conn_rate = args.rate / len(groups) if args.rate else 0.0
+
+    tasks = [
+        asyncio.create_task(
+            run_connection(args.host, args.port, g, deadline, per_conn_rate, counter)
+        )
+        for g in groups
+    ]
+
+    last = 0
+    while not all(t.done() for t in tasks):
+        await asyncio.sleep(1)
+        sent = counter[0]
+        print(f"  sent {sent - last:>8,} lines/s")
+        last = sent
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    # Let the gateway flush its last batches before counting
+    await asyncio.sleep(args.settle)
+    landed = db.sensor_readings.estimated_document_count() - before
+
+    print(f"Sent {counter[0]:,} lines in {elapsed:.1f}s -> {counter[0] / elapsed:,.0f} lines/s")
+    print(f"Landed {landed:,} rows in Mongo -> {landed / elapsed:,.0f} rows/s sustained")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("INGEST_TCP_PORT", "7070")))
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rate", type=float, default=0, help="total lines/s, 0 = unthrottled")
+    parser.add_argument("--settle", type=float, default=2, help="seconds to wait for final flush")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,337 @@
+"""
+Replay historical sensor readings through the ingest gateway at N x speed.
+
+Streams readings in timestamp order from a database or from a file made
+by `python -m app.export sensor-readings` (csv / ndjson, optionally .gz)
+and sends them to app/ingest_gateway.py over TCP, either paced at
+--speed times real time or as fast as the gateway accepts (--speed 0).
+Timestamps are shifted so the replayed storm starts "now" (and is
+compressed by the speed factor), so the API's recent-window endpoints
+see it as live data; --keep-timestamps sends them unchanged.
+
+While it runs it measures
+
+    throughput      lines sent and rows that landed in the target Mongo
+    ingest lag      time from sending a probe line until it is readable
+    reader latency  GET /sensors/{id}/readings from --readers concurrent
+                    clients against --api
+
+    python -m app.ingest_gateway          # target deployment
+    python replay_readings.py --from 2025-11-17 --to 2025-11-19 --speed 500
+    python replay_readings.py --file storm.ndjson.gz --speed 0 --readers 20
+
+The target is the Mongo in .env; --source-url reads from another one
+(e.g. production) and --copy-sensors copies its sensors over first, since
+the gateway rejects readings for unknown sensors. Readings older than
+the hot tier are read from the archive in ARCHIVE_DIR (app/archive.py),
+so point ARCHIVE_DIR at a copy of the source's archive when replaying
+old ranges from --source-url.
+"""
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from pymongo import MongoClient
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import statistics
+import time
+import urllib.parse
+
+from bson import ObjectId
+
+from app.archive import archived_sensor_ids, hot_tier_start, iter_archived
+
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL")
+DB_NAME = os.getenv("MONGO_DB_NAME", "water_status")
+
+if not MONGO_URL:
+    raise RuntimeError("MONGO_URL is not set")
+
+CHUNK_LINES = 500
+PROBE_EVERY_SECONDS = 0.5
+
+
+# --- sources -----------------------------------------------------------------
+
+def parse_ts(raw) -> datetime:
+    if isinstance(raw, datetime):
+        return raw.replace(tzinfo=None) if raw.tzinfo is None else raw.astimezone(timezone.utc).replace(tzinfo=None)
+    ts = datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+    return ts if ts.tzinfo is None else ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def readings_from_db(db, date_from, date_to, sensor_ids):
+    query: dict = {}
+    if date_from or date_to:
+        query["timestamp"] = {}
+        if date_from:
+            query["timestamp"]["$gte"] = date_from
+        if date_to:
+            query["timestamp"]["$lt"] = date_to
+    if sensor_ids:
+        query["sensor_id"] = {"$in": sensor_ids}
+
+    # Archived part first: per sensor, everything before its oldest
+    # reading still in Mongo (same split as app/export.py)
+    if date_from is None or date_from < hot_tier_start():
+        ids = sensor_ids or archived_sensor_ids()
+        oldest = {
+            row["_id"]: row["timestamp"]
+            for row in db.sensor_readings.aggregate([
+                {"$match": {**query, "sensor_id": {"$in": ids}}},
+                {"$sort": {"sensor_id": 1, "timestamp": 1}},
+                {"$group": {"_id": "$sensor_id", "timestamp": {"$first": "$timestamp"}}},
+            ])
+        }
+        end = date_to or datetime.utcnow()
+        for doc in iter_archived(date_from, {sid: min(oldest.get(sid, end), end) for sid in ids}):
+            yield doc["sensor_id"], doc["timestamp"], float(doc["value"])
+
+    cursor = (
+        db.sensor_readings.find(query, {"_id": 0, "sensor_id": 1, "timestamp": 1, "value": 1})
+        .sort("timestamp", 1)
+        .batch_size(10000)
+    )
+    for doc in cursor:
+        yield str(doc["sensor_id"]), doc["timestamp"], float(doc.get("value") or 0.0)
+
+
+def readings_from_file(path):
+    """
+    Exports are written oldest first, so no sorting is needed here.
+    """
+    raw = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    with io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+        if ".csv" in path:
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if not row.get("sensor_id") or not row.get("timestamp"):
+                continue
+            yield row["sensor_id"], parse_ts(row["timestamp"]), float(row.get("value") or 0.0)
+
+
+# --- measurements ------------------------------------------------------------
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.lags: list[float] = []
+        self.reads: list[float] = []
+        self.read_errors: dict[str, int] = {}
+
+
+def percentiles(samples: list[float]) -> str:
+    if not samples:
+        return "no samples"
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(len(s) * q))]
+    return (
+        f"p50 {statistics.median(s) * 1000:7.1f} ms  p95 {pick(0.95) * 1000:7.1f} ms  "
+        f"p99 {pick(0.99) * 1000:7.1f} ms  max {s[-1] * 1000:7.1f} ms  (n={len(s)})"
+    )
+
+
+async def probe_lag(target, probes: asyncio.Queue, stats: Stats):
+    """
+    For each probe (sensor_id, timestamp, sent_at) wait until the reading
+    is readable in the target database.
+    """
+    while True:
+        sid, ts, sent_at = await probes.get()
+        # +-1 ms: the gateway goes through float epoch seconds
+        query = {
+            "sensor_id": ObjectId(sid),
+            "timestamp": {"$gte": ts - timedelta(milliseconds=1), "$lte": ts + timedelta(milliseconds=1)},
+        }
+        while True:
+            found = await asyncio.to_thread(target.sensor_readings.find_one, query, {"_id": 1})
+            if found:
+                stats.lags.append(time.monotonic() - sent_at)
+                break
+            if time.monotonic() - sent_at > 60:
+                stats.lags.append(float("inf"))
+                break
+            await asyncio.sleep(0.02)
+        probes.task_done()
+
+
+async def http_get(base: str, path: str) -> int:
+    url = urllib.parse.urlsplit(base)
+    reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    await reader.read()   # whole body, like a real client
+    writer.close()
+    await writer.wait_closed()
+    return status
+
+
+async def reader_client(api: str, sensor_ids: list[str], hours: float, deadline: float, stats: Stats):
+    while time.monotonic() < deadline:
+        sid = random.choice(sensor_ids)
+        started = time.monotonic()
+        try:
+            status = await http_get(api, f"/sensors/{sid}/readings?hours={hours:g}")
+            if status == 200:
+                stats.reads.append(time.monotonic() - started)
+            else:
+                stats.read_errors[str(status)] = stats.read_errors.get(str(status), 0) + 1
+        except OSError as exc:
+            stats.read_errors[type(exc).__name__] = stats.read_errors.get(type(exc).__name__, 0) + 1
+            await asyncio.sleep(0.5)
+
+
+# --- replay ------------------------------------------------------------------
+
+async def send(args, readings, probes: asyncio.Queue, stats: Stats):
+    _, writer = await asyncio.open_connection(args.host, args.port)
+
+    wall_start = time.monotonic()
+    clock_start = datetime.utcnow()
+    first_ts = None
+    last_probe = 0.0
+    last_ms: dict[str, int] = {}
+    lines = []
+
+    for sid, ts, value in readings:
+        if first_ts is None:
+            first_ts = ts
+        offset = (ts - first_ts).total_seconds()
+
+        # 1. Pace: reading at offset t is due at t / speed
+        if args.speed:
+            due = wall_start + offset / args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                if lines:
+                    writer.write("".join(lines).encode())
+                    await writer.drain()
+                    lines = []
+                await asyncio.sleep(delay)
+
+        # 2. Timestamp as sent (shifted to now, compressed by the speed)
+        if not args.keep_timestamps:
+            ts = clock_start + timedelta(seconds=offset / (args.speed or args.max_rate_compress))
+        ts_ms = int(ts.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        # BSON dates are ms: keep each sensor's timestamps distinct
+        ts_ms = max(ts_ms, last_ms.get(sid, 0) + 1)
+        last_ms[sid] = ts_ms
+
+        lines.append(f"{sid},{ts_ms / 1000:.3f},{value}\n")
+        stats.sent += 1
+
+        now = time.monotonic()
+        if now - last_probe >= PROBE_EVERY_SECONDS:
+            last_probe = now
+            writer.write("".join(lines).encode())
+            await writer.drain()
+            lines = []
+            probes.put_nowait((sid, datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).replace(tzinfo=None), now))
+
+        if len(lines) >= CHUNK_LINES:
+            writer.write("".join(lines).encode())
+            await writer.drain()   # waits when the gateway applies backpressure
+            lines = []
+
+    if lines:
+        writer.write("".join(lines).encode())
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def main(args):
+    target = MongoClient(MONGO_URL)[DB_NAME]
+    source = MongoClient(args.source_url)[DB_NAME] if args.source_url else target
+
+    sensor_ids = [ObjectId(s) for s in args.sensor_ids.split(",")] if args.sensor_ids else None
+
+    # 1. Sensors must exist on the target for the gateway to accept readings
+    if args.copy_sensors and source is not target:
+        query = {"_id": {"$in": sensor_ids}} if sensor_ids else {}
+        copied = 0
+        for sensor in source.sensors.find(query):
+            copied += target.sensors.replace_one({"_id": sensor["_id"]}, sensor, upsert=True).upserted_id is not None
+        print(f"Copied {copied} sensors to the target database")
+
+    if args.file:
+        readings = readings_from_file(args.file)
+    else:
+        date_from = parse_ts(args.date_from) if args.date_from else None
+        date_to = parse_ts(args.date_to) if args.date_to else None
+        readings = readings_from_db(source, date_from, date_to, sensor_ids)
+
+    reader_sensors = [str(s["_id"]) for s in target.sensors.find({"is_active": True}, {"_id": 1})]
+    before = target.sensor_readings.estimated_document_count()
+    stats = Stats()
+    probes: asyncio.Queue = asyncio.Queue()
+
+    print(
+        f"Replaying {'file ' + args.file if args.file else 'database readings'} to {args.host}:{args.port} "
+        f"at {str(args.speed) + 'x' if args.speed else 'max rate'}"
+        + (f", {args.readers} readers on {args.api}" if args.readers else "")
+    )
+
+    # 2. Send; meanwhile probe lag and run readers
+    started = time.monotonic()
+    prober = asyncio.create_task(probe_lag(target, probes, stats))
+    sender = asyncio.create_task(send(args, readings, probes, stats))
+    readers = [
+        asyncio.create_task(reader_client(args.api, reader_sensors, args.reader_hours, float("inf"), stats))
+        for _ in range(args.readers if reader_sensors else 0)
+    ]
+
+    last = 0
+    while not sender.done():
+        await asyncio.sleep(1)
+        print(f"  sent {stats.sent - last:>8,} lines/s   reads {len(stats.reads):>6,}")
+        last = stats.sent
+    await sender
+    elapsed = time.monotonic() - started
+
+    # 3. Let the gateway flush, then count and stop
+    await asyncio.sleep(args.settle)
+    await asyncio.wait_for(probes.join(), timeout=60)
+    for task in readers + [prober]:
+        task.cancel()
+    await asyncio.gather(*readers, prober, return_exceptions=True)
+    landed = target.sensor_readings.estimated_document_count() - before
+
+    print(f"Sent {stats.sent:,} readings in {elapsed:.1f}s -> {stats.sent / elapsed:,.0f} lines/s")
+    print(f"Landed {landed:,} rows -> {landed / elapsed:,.0f} rows/s")
+    print(f"Ingest lag      {percentiles(stats.lags)}")
+    if args.readers:
+        print(f"Reader latency  {percentiles(stats.reads)}")
+        if stats.read_errors:
+            print(f"Reader errors   {stats.read_errors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--file", help="export file (.csv / .ndjson, optionally .gz) instead of a database")
+    parser.add_argument("--source-url", help="Mongo URL to read from (default: the target in .env)")
+    parser.add_argument("--from", dest="date_from", help="ISO date/time, inclusive")
+    parser.add_argument("--to", dest="date_to", help="ISO date/time, exclusive")
+    parser.add_argument("--sensor-ids", help="comma separated sensor ids")
+    parser.add_argument("--copy-sensors", action="store_true", help="copy sensors from --source-url first")
+    parser.add_argument("--speed", type=float, default=60, help="x real time, 0 = as fast as possible")
+    parser.add_argument("--max-rate-compress", type=float, default=1000,
+                        help="with --speed 0: time compression of shifted timestamps")
+    parser.add_argument("--keep-timestamps", action="store_true")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("INGEST_TCP_PORT", "7070")))
+    parser.add_argument("--api", default="http://127.0.0.1:8000", help="API base URL for readers")
+    parser.add_argument("--readers", type=int, default=0, help="concurrent /sensors/{id}/readings clients")
+    parser.add_argument("--reader-hours", type=float, default=24)
+    parser.add_argument("--settle", type=float, default=2, help="seconds to wait for final flush")
+    asyncio.run(main(parser.parse_args()))
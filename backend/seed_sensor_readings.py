@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timedelta, UTC
 import os
 import random
@@ -55,14 +56,21 @@ if __name__ == "__main__":
     client = MongoClient(MONGO_URL)
     db = client[DB_NAME]
 
-    # 🚨 1) Clear previous readings so we don't clash
-    db.sensor_readings.delete_many({})
+    # 1) Same unique key the API and ingest gateway use, so re-running this
+    #    script can't create duplicate readings
+    db.sensor_readings.create_index(
+        [("sensor_id", ASCENDING), ("timestamp", ASCENDING)],
+        unique=True,
+        name="sensor_id_timestamp_unique",
+    )
 
     HOURS_BACK = 24
     INTERVAL_MINUTES = 10
 
-    # Use timezone-aware UTC as the warning suggests
-    now = datetime.now(UTC)
+    # Use timezone-aware UTC as the warning suggests, snapped to the interval
+    # grid so two runs in the same interval produce the same timestamps
+    now = datetime.now(UTC).replace(second=0, microsecond=0)
+    now -= timedelta(minutes=now.minute % INTERVAL_MINUTES)
 
     sensors = list(db.sensors.find({"is_active": True}))
     print(f"Found {len(sensors)} active sensors")
@@ -110,9 +118,14 @@ if __name__ == "__main__":
         r.pop("_id", None)
 
     if all_readings:
-        result = db.sensor_readings.insert_many(all_readings)
+        # 3) Unordered insert: readings already in the DB are skipped, not fatal
+        try:
+            inserted = len(db.sensor_readings.insert_many(all_readings, ordered=False).inserted_ids)
+        except BulkWriteError as exc:
+            inserted = exc.details.get("nInserted", 0)
         print(
-            f"Inserted {len(result.inserted_ids)} readings "
+            f"Inserted {inserted} readings "
+            f"({len(all_readings) - inserted} already present) "
             f"for {len(sensors)} sensors "
             f"({HOURS_BACK} hours, every {INTERVAL_MINUTES} minutes)."
         )
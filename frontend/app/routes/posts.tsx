@@ -1,6 +1,6 @@
 // app/routes/posts.tsx
 // @ts-nocheck
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { Trash2, Heart } from "lucide-react";
 import {
   LineChart,
@@ -29,6 +29,10 @@ function getCurrentSourceName(): string {
 
 const API_BASE = "http://127.0.0.1:8000";
 
+// Charts re-fetch their whole window this often instead of a since= delta,
+// to pick up readings that arrived after the cursor passed their timestamp
+const CHART_RESYNC_MS = 5 * 60 * 1000;
+
 type ActiveUser = {
   id: string;
   name: string;
@@ -161,55 +165,15 @@ const editFilteredSensors = sensors.filter((s) => s.type === editType);
     }
   }, []);
 
-  // ---- load sensors for dropdown ----
+  // ---- load sensors, latest readings and reports in one round trip ----
   useEffect(() => {
-    async function loadSensors() {
-      try {
-        const res = await fetch(`${API_BASE}/sensors`);
-        if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const data = await res.json();
-        setSensors(data.sensors ?? data);
-      } catch (err: any) {
-        console.error(err);
-        setError("Could not load sensors.");
-      }
-    }
-    loadSensors();
-  }, []);
-
-    // ---- load latest sensor readings for header time-series ----
-  useEffect(() => {
-    async function loadAllReadings() {
-      try {
-        setReadingsLoading(true);
-        const res = await fetch(`${API_BASE}/sensor-readings`);
-        if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const data = await res.json();
-        const list = data.readings ?? data;
-        if (Array.isArray(list)) {
-          // take only the first few newest points for a compact header
-          setRecentReadings(list.slice(0, 6));
-        } else {
-          setRecentReadings([]);
-        }
-      } catch (err) {
-        console.error(err);
-      } finally {
-        setReadingsLoading(false);
-      }
-    }
-    loadAllReadings();
-  }, []);
-
-
-  // ---- load existing user reports (with liked_by_me) ----
-  useEffect(() => {
-    async function loadReports() {
+    async function loadDashboard() {
       try {
         setLoading(true);
+        setReadingsLoading(true);
         setError(null);
 
-        const baseUrl = `${API_BASE}/user-reports?limit=100`;
+        const baseUrl = `${API_BASE}/dashboard?feed_limit=100&recent_limit=6`;
         const url =
           activeUser && activeUser.id
             ? `${baseUrl}&current_user_id=${encodeURIComponent(activeUser.id)}`
@@ -218,17 +182,23 @@ const editFilteredSensors = sensors.filter((s) => s.type === editType);
         const res = await fetch(url);
         if (!res.ok) throw new Error(`HTTP ${res.status}`);
         const data = await res.json();
-        const reportsArray: UserReport[] = data.reports ?? data;
+
+        setSensors(data.sensors ?? []);
+        setRecentReadings(
+          Array.isArray(data.recent_readings) ? data.recent_readings : []
+        );
+        const reportsArray: UserReport[] = data.reports ?? [];
         setReports(reportsArray);
       } catch (err: any) {
         console.error(err);
-        setError("Could not load user reports.");
+        setError("Could not load dashboard.");
       } finally {
         setLoading(false);
+        setReadingsLoading(false);
       }
     }
 
-    loadReports();
+    loadDashboard();
   }, [activeUser?.id]);
 
 // ---- delete a user report ----
@@ -503,6 +473,50 @@ const mainLineColor = getColorForType(chartSeriesType);
 const compareLineColor = getColorForType(chartCompareType);
 const userSeriesColor = "#6366f1"; // purple for user reports
 
+// Last chart load per sensor + window: readings and the server's cursor,
+// so reloading the same chart only fetches readings newer than the cursor.
+// The cursor is a reading timestamp, so a reading that arrives late with an
+// older timestamp never shows up in a delta; the full window is fetched
+// again once the cache is CHART_RESYNC_MS old.
+const chartCacheRef = useRef<
+  Record<string, { readings: SensorReading[]; cursor: string; syncedAt: number }>
+>({});
+
+async function fetchSensorReadings(
+  sensorId: string,
+  hours: number
+): Promise<SensorReading[]> {
+  const key = `${sensorId}:${hours}`;
+  const now = Date.now();
+  const stored = chartCacheRef.current[key];
+  const cached =
+    stored && now - stored.syncedAt < CHART_RESYNC_MS ? stored : undefined;
+
+  let url = `${API_BASE}/sensors/${sensorId}/readings?hours=${hours}`;
+  if (cached) url += `&since=${encodeURIComponent(cached.cursor)}`;
+
+  const res = await fetch(url);
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  const data = await res.json();
+  const fresh: SensorReading[] = data.readings ?? [];
+
+  // Drop readings that slid out of the window (timestamps are UTC ISO,
+  // compared as "YYYY-MM-DDTHH:MM:SS" strings)
+  const cutoff = new Date(Date.now() - hours * 3600 * 1000)
+    .toISOString()
+    .slice(0, 19);
+  const readings = (cached ? [...cached.readings, ...fresh] : fresh).filter(
+    (r) => !r.timestamp || r.timestamp >= cutoff
+  );
+
+  chartCacheRef.current[key] = {
+    readings,
+    cursor: data.cursor ?? cached?.cursor ?? "",
+    syncedAt: cached ? cached.syncedAt : now,
+  };
+  return readings;
+}
+
 async function handleLoadChart() {
   if (!chartSensorId) {
     setChartData([]);
@@ -517,23 +531,13 @@ async function handleLoadChart() {
     setChartError(null);
     setChartLoading(true);
 
-    // Load primary sensor readings
-    const resMain = await fetch(
-      `${API_BASE}/sensors/${chartSensorId}/readings?hours=${chartHours}`
-    );
-    if (!resMain.ok) throw new Error(`HTTP ${resMain.status}`);
-    const dataMain = await resMain.json();
-    const mainList: SensorReading[] = dataMain.readings ?? [];
+    // Load primary sensor readings (only new ones if already loaded)
+    const mainList = await fetchSensorReadings(chartSensorId, chartHours);
 
     // Optionally load compare sensor readings (same type only, ensured by options list)
     let compareList: SensorReading[] = [];
     if (chartCompareSensorId) {
-      const resCompare = await fetch(
-        `${API_BASE}/sensors/${chartCompareSensorId}/readings?hours=${chartHours}`
-      );
-      if (!resCompare.ok) throw new Error(`HTTP ${resCompare.status}`);
-      const dataCompare = await resCompare.json();
-      compareList = dataCompare.readings ?? [];
+      compareList = await fetchSensorReadings(chartCompareSensorId, chartHours);
     }
 
     if (!Array.isArray(mainList) || mainList.length === 0) {